@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from matrix import LEDMatrix
+from drivers import NullDriver
+from color import Color
+
+"""
+Rendering benchmarks for the matrix library.
+
+Every workload runs against a NullDriver, so the numbers are the cost of the
+python side only, the part that competes with everything else on the Pi.
+A frame ends every time the workload calls show(), or for workloads that never
+show (like drawing into the buffer) every time the workload says so.
+
+For each workload this reports frames per second, per frame latency percentiles,
+and how many bytes each frame allocates on top of what was already live
+(measured in a second pass under tracemalloc, since tracing slows everything down).
+
+Results can be saved as a baseline and later runs are compared against it:
+    python benchmark.py --save-baseline
+    python benchmark.py                         compares against benchmarkBaseline.json
+    python benchmark.py --max-regression 20     exits non zero if any fps drops more than 20%
+"""
+
+ROWS = 7
+COLS = 55
+BASELINE_FILE = "benchmarkBaseline.json"
+
+HEADLINE = "Storms expected to bring heavy rain and strong winds to the region through the weekend"
+WEATHER = "Now Partly Cloudy,\\g72\\6\\w,Today Light Rain,\\b61\\6\\w/\\r78\\6"
+
+
+class FrameTimer:
+    """
+    Collects per frame timings, and per frame allocations when tracking them
+    """
+    def __init__(self, trackAllocations = False):
+        self.trackAllocations = trackAllocations
+        self.times = []
+        self.allocations = []
+        self.last = 0
+        self.base = 0
+
+    def start(self):
+        if self.trackAllocations:
+            tracemalloc.reset_peak()
+            self.base = tracemalloc.get_traced_memory()[0]
+        self.last = time.perf_counter()
+
+    def frameCount(self):
+        return len(self.times)
+
+    # Ends the current frame and starts the next one
+    def mark(self):
+        now = time.perf_counter()
+        self.times.append(now - self.last)
+        if self.trackAllocations:
+            current, peak = tracemalloc.get_traced_memory()
+            self.allocations.append(peak - self.base)
+            tracemalloc.reset_peak()
+            self.base = current
+        self.last = time.perf_counter()
+
+
+# Skips every sleep inside the widget animations, only the drawing is being measured
+class NoSleep:
+    def __enter__(self):
+        self.sleep = time.sleep
+        time.sleep = lambda seconds: None
+
+    def __exit__(self, *args):
+        time.sleep = self.sleep
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+######################################
+##  Workloads                       ##
+######################################
+# Each one takes the matrix and the FrameTimer, and has to end every frame with
+# a show() or a timer.mark()
+
+def workloadHeadlineScroll(mat, timer, frames):
+    c = Color()
+    while timer.frameCount() < frames:
+        mat.stringExitLeft(HEADLINE, c.WHITE, 0, speed = 0, delay = 0)
+
+def workloadWeatherString(mat, timer, frames):
+    c = Color()
+    for frame in range(frames):
+        mat.stringPrint(WEATHER, c.WHITE, COLS - (frame % 300))
+
+def workloadBufferText(mat, timer, frames):
+    c = Color()
+    for frame in range(frames):
+        mat.bufferStringPrint(WEATHER, c.WHITE, frame % mat.bufferRows, frame % mat.bufferCols)
+        timer.mark()
+
+def workloadRainScroll(mat, timer, frames):
+    # The same rain as widget_Animation, drawn once, then scrolled through the window
+    rng = random.Random(1)
+    mat.clearBuffer()
+    for i in range(35):
+        row = rng.randrange(0, mat.bufferRows)
+        col = rng.randrange(0, mat.cols)
+        color = (rng.randrange(0, 255), rng.randrange(0, 255), rng.randrange(0, 255))
+        mat.bufferDrawPixel(row, col, color, brightnessMod = 0.1)
+        mat.bufferDrawPixel(row + 1, col, color, brightnessMod = 0.4)
+        mat.bufferDrawPixel(row + 2, col, color, brightnessMod = 0.8)
+        mat.bufferDrawPixel(row + 3, col, color, brightnessMod = 1.0)
+
+    for frame in range(frames):
+        mat.bufferWindowToMatrix([(mat.bufferRows - mat.rows) - frame, 0])
+
+def animationWorkload(animationNumber):
+    def workload(mat, timer, frames):
+        # The widgets are imported here so the other workloads still run without yfinance and friends
+        from widgets import Widget
+
+        # Only the animation is needed, so skip __init__ and its secrets file and API providers
+        w = Widget.__new__(Widget)
+        w.mat = mat
+        w.c = Color()
+
+        random.seed(animationNumber)
+        with NoSleep():
+            while timer.frameCount() < frames:
+                w.widget_Animation(animationNumber)
+    return workload
+
+# Plays a compiled sine wave, to compare with animation4_sineWave
+def workloadSequencePlayback(mat, timer, frames):
+    import tempfile
+    from frameSequence import FrameSequence, compileAnimation
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = compileAnimation(4, 4, directory)
+        timer.start()   # dont count the compile as part of the first frame
+        with NoSleep():
+            while timer.frameCount() < frames:
+                with FrameSequence(path) as sequence:
+                    sequence.play(mat)
+
+WORKLOADS = {
+    "headlineScroll": workloadHeadlineScroll,
+    "weatherString": workloadWeatherString,
+    "bufferText": workloadBufferText,
+    "rainScroll": workloadRainScroll,
+    "animation0_randomPixels": animationWorkload(0),
+    "animation1_bounce": animationWorkload(1),
+    "animation2_redFlash": animationWorkload(2),
+    "animation3_rain": animationWorkload(3),
+    "animation4_sineWave": animationWorkload(4),
+    "sequencePlayback": workloadSequencePlayback,
+}
+
+
+######################################
+##  Harness                         ##
+######################################
+
+def runOnce(name, frames, backend, trackAllocations):
+    timer = FrameTimer(trackAllocations)
+    driver = NullDriver(ROWS * COLS, onShow = timer.mark)
+    mat = LEDMatrix(None, ROWS, COLS, bufferEnabled = True, bufferBackend = backend, driver = driver)
+
+    timer.start()
+    WORKLOADS[name](mat, timer, frames)
+    return timer
+
+"""
+@brief:     Runs one workload, once for timing and once for allocations
+@param:     name        Key of WORKLOADS
+@param:     frames      How many frames to measure, some workloads run a few over
+@param:     backend     Buffer backend for the matrix, "list" or "numpy"
+@retval:    dict        The results, or None if the workload could not run here
+"""
+def runWorkload(name, frames, backend):
+    try:
+        timer = runOnce(name, frames, backend, trackAllocations = False)
+    except ImportError as ex:
+        print(name + ": skipped, " + str(ex))
+        return None
+
+    tracemalloc.start()
+    try:
+        allocTimer = runOnce(name, max(1, frames // 4), backend, trackAllocations = True)
+    finally:
+        tracemalloc.stop()
+
+    times = timer.times
+    return {
+        "frames": len(times),
+        "fps": len(times) / sum(times) if sum(times) > 0 else 0.0,
+        "p50Ms": percentile(times, 0.50) * 1000,
+        "p95Ms": percentile(times, 0.95) * 1000,
+        "p99Ms": percentile(times, 0.99) * 1000,
+        "allocBytesPerFrame": sum(allocTimer.allocations) / max(1, len(allocTimer.allocations)),
+    }
+
+def printResults(results, baseline):
+    print("{:<26}{:>7}{:>11}{:>9}{:>9}{:>9}{:>12}{:>10}".format(
+        "workload", "frames", "fps", "p50 ms", "p95 ms", "p99 ms", "alloc B/fr", "vs base"))
+    for name, result in results.items():
+        change = ""
+        if name in baseline and baseline[name]["fps"] > 0:
+            change = "{:+.1f}%".format((result["fps"] / baseline[name]["fps"] - 1) * 100)
+        print("{:<26}{:>7}{:>11.1f}{:>9.3f}{:>9.3f}{:>9.3f}{:>12.0f}{:>10}".format(
+            name, result["frames"], result["fps"], result["p50Ms"], result["p95Ms"], result["p99Ms"],
+            result["allocBytesPerFrame"], change))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmarks the matrix rendering hot paths")
+    parser.add_argument("--frames", type = int, default = 500, help = "frames to measure per workload")
+    parser.add_argument("--backend", default = "numpy", choices = ["list", "numpy"], help = "buffer backend")
+    parser.add_argument("--only", nargs = "*", default = None, help = "workloads to run, default all")
+    parser.add_argument("--baseline", default = BASELINE_FILE, help = "baseline file to compare against")
+    parser.add_argument("--save-baseline", action = "store_true", help = "store these results as the baseline")
+    parser.add_argument("--max-regression", type = float, default = None,
+                        help = "exit with an error if any workload loses more than this percent of its baseline fps")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile).get(args.backend, {})
+
+    results = {}
+    for name in (args.only if args.only else WORKLOADS):
+        result = runWorkload(name, args.frames, args.backend)
+        if result is not None:
+            results[name] = result
+    printResults(results, baseline)
+
+    if args.save_baseline:
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baselineFile:
+                stored = json.load(baselineFile)
+        stored[args.backend] = results
+        with open(args.baseline, "w") as baselineFile:
+            json.dump(stored, baselineFile, indent = 4)
+        print("Saved baseline to " + args.baseline)
+
+    if args.max_regression is not None:
+        regressed = [name for name, result in results.items()
+                     if name in baseline and result["fps"] < baseline[name]["fps"] * (1 - args.max_regression / 100)]
+        if regressed:
+            print("Regressed: " + ", ".join(regressed))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
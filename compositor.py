@@ -0,0 +1,298 @@
+# numpy is optional, without it there is no Compositor and overlays fall back to PixelOverlay
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Layers on top of (and under) whatever the widgets draw.
+
+Widgets still draw straight into LEDMatrix.matrix like they always have, that frame is
+the main layer at z = 0. Any number of extra layers can be stacked above it (z > 0, like
+a status ticker or an alert badge) or below it (z < 0, like a background animation).
+Every time the matrix is shown, the layers are blended bottom to top with numpy over the
+whole rows x cols frame and the result is what goes out to the LEDs. So an overlay shows
+up on every widget without any widget knowing about it.
+
+Each layer is a float color plane plus an alpha plane, 0.0 where the layer is empty.
+The main layer is opaque where it is lit and see-through where it is black, so a
+background shows through the gaps in the text.
+
+Blend modes, base is everything under the layer and src is the layer:
+    "normal"    src
+    "add"       base + src, clipped
+    "multiply"  base * src / 255
+    "screen"    255 - (255 - base) * (255 - src) / 255
+    "lighten"   the brighter of the two, per channel
+The blended color is then mixed with the base by alpha * opacity.
+
+Compositor needs numpy. Without it, PixelOverlay does the one thing the board uses
+overlays for, opaque pixels over every frame, with plain lists.
+
+Usage:
+    comp = Compositor(mat)
+    badge = comp.addLayer("alertBadge", 10)
+    badge.drawPixel(0, mat.cols - 1, (255, 0, 0))
+    ...widgets draw and show like normal, the badge is on every frame
+"""
+
+BLEND_MODES = ("normal", "add", "multiply", "screen", "lighten")
+
+
+class Layer:
+    """
+    One layer of the stack, made by Compositor.addLayer
+
+    color       float32 (rows, cols, 3), 0 to 255
+    alpha       float32 (rows, cols), 0.0 is empty, 1.0 covers what is under it
+    opacity     0.0 to 1.0, applied to the whole layer
+    """
+    def __init__(self, compositor, name, z, opacity = 1.0, blend = "normal"):
+        if blend not in BLEND_MODES:
+            raise ValueError("blend must be one of " + ", ".join(BLEND_MODES) + ", got " + repr(blend))
+        self.compositor = compositor
+        self.name = name
+        self.z = z
+        self.opacity = opacity
+        self.blend = blend
+        self.visible = True
+        self.color = np.zeros((compositor.rows, compositor.cols, 3), dtype=np.float32)
+        self.alpha = np.zeros((compositor.rows, compositor.cols), dtype=np.float32)
+
+    # Every change to a layer goes through here, so the next show() sends a new frame
+    def changed(self):
+        self.compositor.dirty = True
+
+    def setOpacity(self, opacity):
+        self.opacity = min(1.0, max(0.0, opacity))
+        self.changed()
+
+    def setBlend(self, blend):
+        if blend not in BLEND_MODES:
+            raise ValueError("blend must be one of " + ", ".join(BLEND_MODES) + ", got " + repr(blend))
+        self.blend = blend
+        self.changed()
+
+    def setVisible(self, visible):
+        if visible != self.visible:
+            self.visible = visible
+            self.changed()
+
+    def clear(self):
+        self.color[:] = 0
+        self.alpha[:] = 0
+        self.changed()
+
+    def fill(self, color, alpha = 1.0):
+        self.color[:] = color
+        self.alpha[:] = alpha
+        self.changed()
+
+    # Same as LEDMatrix.matrixDrawPixel, but into the layer. Returns False off the matrix
+    def drawPixel(self, row, col, color, alpha = 1.0):
+        if 0 <= row < self.compositor.rows and 0 <= col < self.compositor.cols:
+            self.color[row, col] = color
+            self.alpha[row, col] = alpha
+            self.changed()
+            return True
+        return False
+
+    """
+    @brief:     Copies a whole frame into the layer
+    @param:     frame       (rows, cols, 3) array of colors
+    @param:     alpha       Default None, (rows, cols) array. None means lit pixels are opaque
+                                and black ones are empty
+    @retval:    None
+    """
+    def drawFrame(self, frame, alpha = None):
+        frame = np.asarray(frame, dtype=np.float32)
+        self.color[:] = frame
+        self.alpha[:] = alpha if alpha is not None else frame.any(axis=2)
+        self.changed()
+
+    """
+    @brief:     Draws a string into the layer, rendered through the matrix's text cache
+    @param:     string      The string, escape codes and all, see LEDMatrix.stringPrint
+    @param:     color       The color as (RED,GRN,BLU)
+    @param:     startCol    Default 0, column of the matrix the string starts at, can be negative
+    @param:     startRow    Default 0, row of the matrix the string starts at, can be negative
+    @param:     opaque      Default False, also cover what is under the unlit pixels of the text
+    @retval:    None
+    """
+    def drawText(self, string, color, startCol = 0, startRow = 0, opaque = False):
+        stripColor, stripAlpha = self.compositor.stripArrays(self.compositor.mat.getTextStrip(string, color))
+        rows = self.compositor.rows
+        cols = self.compositor.cols
+
+        # Overlap of the strip with the matrix
+        rowStart = max(0, startRow)
+        rowEnd = min(rows, startRow + stripColor.shape[0])
+        colStart = max(0, startCol)
+        colEnd = min(cols, startCol + stripColor.shape[1])
+        if rowStart < rowEnd and colStart < colEnd:
+            source = (slice(rowStart - startRow, rowEnd - startRow), slice(colStart - startCol, colEnd - startCol))
+            target = (slice(rowStart, rowEnd), slice(colStart, colEnd))
+            if opaque:
+                self.color[target] = stripColor[source]
+                self.alpha[target] = 1.0
+            else:
+                lit = stripAlpha[source] > 0
+                self.color[target][lit] = stripColor[source][lit]
+                self.alpha[target][lit] = 1.0
+        self.changed()
+
+
+class Compositor:
+    """
+    The layer stack for one LEDMatrix. Making one hooks it into the matrix, every
+    show() from then on sends the composited frame.
+    """
+    STRIP_CACHE_SIZE = 16       # rendered text strips kept as arrays
+
+    def __init__(self, mat):
+        if np is None:
+            raise ImportError("The compositor needs numpy installed, use PixelOverlay without it")
+        self.mat = mat
+        self.rows = mat.rows
+        self.cols = mat.cols
+        self.layers = []
+        self.dirty = True
+
+        # Strip order <-> row-major order, as index arrays so each is a single gather
+        self.frameGather = np.array(mat.pixelIndex, dtype=np.intp)
+        self.stripGather = np.asarray(mat.stripGather, dtype=np.intp)
+        self.stripCache = {}
+
+        mat.matrix.compositor = self
+
+    def addLayer(self, name, z, opacity = 1.0, blend = "normal"):
+        if z == 0:
+            raise ValueError("z = 0 is the main layer, the one the widgets draw on")
+        layer = Layer(self, name, z, opacity, blend)
+        self.layers.append(layer)
+        self.layers.sort(key = lambda each: each.z)
+        self.dirty = True
+        return layer
+
+    def layer(self, name):
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        raise KeyError(name)
+
+    def removeLayer(self, name):
+        self.layers.remove(self.layer(name))
+        self.dirty = True
+
+    # True when any layer could change the frame, otherwise the matrix skips compositing altogether
+    def active(self):
+        for layer in self.layers:
+            if layer.visible and layer.opacity > 0:
+                return True
+        return False
+
+    # A TextStrip as (color, alpha) arrays, converted once per strip
+    def stripArrays(self, strip):
+        key = id(strip)
+        cached = self.stripCache.get(key)
+        if cached is None or cached[0] is not strip:
+            color = np.array(strip.rows, dtype=np.float32).reshape(strip.height, strip.width, 3)
+            cached = (strip, color, color.any(axis=2).astype(np.float32))
+            if len(self.stripCache) >= self.STRIP_CACHE_SIZE:
+                del self.stripCache[next(iter(self.stripCache))]
+            self.stripCache[key] = cached
+        return cached[1], cached[2]
+
+    @staticmethod
+    def blend(mode, base, source):
+        if mode == "add":
+            return np.minimum(base + source, 255.0)
+        if mode == "multiply":
+            return base * source * (1.0 / 255.0)
+        if mode == "screen":
+            return 255.0 - (255.0 - base) * (255.0 - source) * (1.0 / 255.0)
+        if mode == "lighten":
+            return np.maximum(base, source)
+        return source
+
+    """
+    @brief:     Blends every layer and the main frame into one frame
+    @param:     mainFrame   (rows, cols, 3) array, what the widgets drew
+    @retval:    ndarray     (rows, cols, 3) uint8
+    """
+    def compose(self, mainFrame):
+        mainFrame = np.asarray(mainFrame, dtype=np.float32)
+        out = np.zeros((self.rows, self.cols, 3), dtype=np.float32)
+        mainDone = False
+
+        for layer in self.layers:
+            if layer.z > 0 and not mainDone:
+                # Black pixels of the main layer are see-through
+                mainAlpha = mainFrame.any(axis=2)[..., None]
+                out = np.where(mainAlpha, mainFrame, out)
+                mainDone = True
+            if not layer.visible or layer.opacity <= 0:
+                continue
+            blended = self.blend(layer.blend, out, layer.color)
+            weight = (layer.alpha * layer.opacity)[..., None]
+            out += (blended - out) * weight
+
+        if not mainDone:
+            out = np.where(mainFrame.any(axis=2)[..., None], mainFrame, out)
+        return np.clip(out + 0.5, 0, 255).astype(np.uint8)
+
+    """
+    @brief:     Composites a frame that is in strip order, the way StripFrame holds it
+    @param:     pixels      List of (r, g, b) in strip order
+    @retval:    list        List of (r, g, b) tuples in strip order
+    """
+    def compositeStrip(self, pixels):
+        stripArray = np.array(pixels, dtype=np.float32)
+        mainFrame = stripArray[self.frameGather].reshape(self.rows, self.cols, 3)
+        frame = self.compose(mainFrame).reshape(-1, 3)
+        self.dirty = False
+        return list(map(tuple, frame[self.stripGather].tolist()))
+
+
+class PixelOverlay:
+    """
+    A few opaque pixels over every frame, for when numpy is not installed
+
+    Hooks into the matrix the same way a Compositor does, and has the drawPixel, clear
+    and setVisible of a Layer, so it can stand in for a single layer like the alert badge.
+    """
+    def __init__(self, mat):
+        self.mat = mat
+        self.rows = mat.rows
+        self.cols = mat.cols
+        self.pixels = {}        # strip position: (r, g, b)
+        self.visible = True
+        self.dirty = True
+        mat.matrix.compositor = self
+
+    def drawPixel(self, row, col, color, alpha = 1.0):
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            self.pixels[self.mat.pixelIndex[(row * self.cols) + col]] = tuple(color)
+            self.dirty = True
+            return True
+        return False
+
+    def clear(self):
+        self.pixels = {}
+        self.dirty = True
+
+    def setVisible(self, visible):
+        if visible != self.visible:
+            self.visible = visible
+            self.dirty = True
+
+    def active(self):
+        return self.visible and len(self.pixels) > 0
+
+    # Same as Compositor.compositeStrip, the pixels are just put over the frame
+    def compositeStrip(self, pixels):
+        out = list(pixels)
+        for position, color in self.pixels.items():
+            out[position] = color
+        self.dirty = False
+        return out
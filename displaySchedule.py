@@ -0,0 +1,188 @@
+import math
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+"""
+When the display does what, over the day.
+
+main() used to check datetime.now() against four Time objects on every pass of its loop,
+and at night it slept 120 seconds at a time, so the display could come on two minutes
+late. Now the day is a list of phases, each starting at a time of day. The schedule turns
+them into the day's transitions once per date, sorted, and can say which phase is on
+right now and exactly when the next one starts, so main() can sleep until then instead
+of waking up to check.
+
+A phase can also start relative to sunrise or sunset, those are worked out locally with
+the NOAA sunrise equation, no API call, good to about a minute:
+    Phase(SunTime("sunset", 30), "clock", 0.005)     # red clock half an hour after sunset
+
+Usage:
+    schedule = DisplaySchedule([Phase(Time(5, 30), "clock", 0.005), Phase(Time(23, 50), "off")])
+    phase = schedule.current()
+    at, nextPhase = schedule.nextTransition()
+"""
+
+class SunTime:
+    """
+    A time of day relative to the sun
+
+    event           "sunrise" or "sunset"
+    offsetMinutes   Default 0, minutes after the event, negative for before it
+    """
+    def __init__(self, event, offsetMinutes = 0):
+        if event not in ("sunrise", "sunset"):
+            raise ValueError("event must be sunrise or sunset, got " + repr(event))
+        self.event = event
+        self.offsetMinutes = offsetMinutes
+
+    """
+    @brief:     The time this happens on a given date
+    @param:     day         date
+    @param:     latitude    Degrees, north is positive
+    @param:     longitude   Degrees, east is positive
+    @retval:    datetime    Naive local time, None when the sun does not rise or set that day
+    """
+    def onDate(self, day, latitude, longitude):
+        sunrise, sunset = sunTimes(day, latitude, longitude)
+        at = sunrise if self.event == "sunrise" else sunset
+        if at is None:
+            return None
+        return at + timedelta(minutes = self.offsetMinutes)
+
+
+"""
+@brief:     Sunrise and sunset for a date, with the sunrise equation
+@note:      See https://en.wikipedia.org/wiki/Sunrise_equation, -0.833 degrees of elevation
+                accounts for refraction and the size of the sun
+@param:     day         date
+@param:     latitude    Degrees, north is positive
+@param:     longitude   Degrees, east is positive
+@retval:    tuple       (sunrise, sunset) as naive local datetimes, (None, None) during polar day or night
+"""
+def sunTimes(day, latitude, longitude):
+    days = day.toordinal() - datetime(2000, 1, 1).toordinal()      # days since the J2000 epoch
+    meanNoon = days - (longitude / 360.0)
+    anomaly = math.radians((357.5291 + (0.98560028 * meanNoon)) % 360)
+    center = (1.9148 * math.sin(anomaly)) + (0.02 * math.sin(2 * anomaly)) + (0.0003 * math.sin(3 * anomaly))
+    eclipticLong = math.radians((math.degrees(anomaly) + center + 180 + 102.9372) % 360)
+    transit = 2451545.0 + meanNoon + (0.0053 * math.sin(anomaly)) - (0.0069 * math.sin(2 * eclipticLong))
+
+    declination = math.asin(math.sin(eclipticLong) * math.sin(math.radians(23.4397)))
+    lat = math.radians(latitude)
+    cosHourAngle = (math.sin(math.radians(-0.833)) - (math.sin(lat) * math.sin(declination))) / (math.cos(lat) * math.cos(declination))
+    if cosHourAngle < -1 or cosHourAngle > 1:
+        return (None, None)
+    hourAngle = math.degrees(math.acos(cosHourAngle))
+
+    def toLocal(julian):
+        return datetime.fromtimestamp((julian - 2440587.5) * 86400, timezone.utc).astimezone().replace(tzinfo = None)
+    return (toLocal(transit - (hourAngle / 360.0)), toLocal(transit + (hourAngle / 360.0)))
+
+
+class Phase:
+    """
+    One part of the day
+
+    start       Time, or SunTime, when the phase starts
+    mode        What main() does during it, "off", "clock" or "widgets"
+    brightness  Default None, brightness for the phase, None leaves it alone
+    """
+    def __init__(self, start, mode, brightness = None):
+        self.start = start
+        self.mode = mode
+        self.brightness = brightness
+
+    def __repr__(self):
+        return "Phase(" + self.mode + ")"
+
+
+class DisplaySchedule:
+    """
+    The phases of every day. A phase lasts until the next one starts, the last phase of the
+    day runs over midnight until the first one of the next day.
+
+    latitude, longitude     Default None, only needed for phases that start at a SunTime
+    """
+    DAYS_CACHED = 4
+
+    def __init__(self, phases, latitude = None, longitude = None):
+        if len(phases) == 0:
+            raise ValueError("A schedule needs at least one phase")
+        for phase in phases:
+            if isinstance(phase.start, SunTime) and (latitude is None or longitude is None):
+                raise ValueError("Phases at sunrise or sunset need the latitude and longitude")
+        self.phases = phases
+        self.latitude = latitude
+        self.longitude = longitude
+        self.days = {}      # date ordinal: (sorted start datetimes, phases in the same order)
+
+    """
+    @brief:     The transitions of one date, worked out once and kept
+    @param:     day         date
+    @retval:    tuple       (list of datetimes, list of phases), sorted by time
+    """
+    def transitions(self, day):
+        key = day.toordinal()
+        compiled = self.days.get(key)
+        if compiled is None:
+            starts = []
+            for phase in self.phases:
+                if isinstance(phase.start, SunTime):
+                    at = phase.start.onDate(day, self.latitude, self.longitude)
+                else:
+                    at = phase.start.onDate(day)
+                if at is not None:
+                    starts.append((at, phase))
+            starts.sort(key = lambda start: start[0])
+            compiled = ([at for at, phase in starts], [phase for at, phase in starts])
+
+            if len(self.days) >= self.DAYS_CACHED:
+                del self.days[min(self.days)]
+            self.days[key] = compiled
+        return compiled
+
+    """
+    @brief:     The phase that is on at a point in time
+    @param:     now         Default None, naive local datetime, None means right now
+    @retval:    Phase
+    """
+    def current(self, now = None):
+        if now is None:
+            now = datetime.now()
+        day = now.date()
+        # Walk back from today until a phase has started, usually that is today or yesterday
+        for back in range(self.DAYS_CACHED):
+            times, phases = self.transitions(day - timedelta(days = back))
+            index = bisect_right(times, now) - 1
+            if index >= 0:
+                return phases[index]
+        return self.phases[-1]
+
+    """
+    @brief:     When the next phase starts
+    @param:     now         Default None, naive local datetime, None means right now
+    @retval:    tuple       (datetime, Phase) of the first transition after now
+    """
+    def nextTransition(self, now = None):
+        if now is None:
+            now = datetime.now()
+        day = now.date()
+        for ahead in range(self.DAYS_CACHED):
+            times, phases = self.transitions(day + timedelta(days = ahead))
+            index = bisect_right(times, now)
+            if index < len(times):
+                return (times[index], phases[index])
+        raise ValueError("No phase starts in the next " + str(self.DAYS_CACHED) + " days")
+
+    # Seconds from now until the next transition, never negative
+    def secondsUntilNext(self, now = None):
+        if now is None:
+            now = datetime.now()
+        return max(0.0, (self.nextTransition(now)[0] - now).total_seconds())
+
+    # The transitions of a date, one per line, for printing or the log
+    def report(self, day = None):
+        if day is None:
+            day = datetime.now().date()
+        times, phases = self.transitions(day)
+        return "\n".join(at.strftime("%H:%M") + "  " + phase.mode for at, phase in zip(times, phases))
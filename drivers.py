@@ -0,0 +1,230 @@
+import sys
+import struct
+import time
+import zlib
+from collections import deque, namedtuple
+
+"""
+Output drivers for LEDMatrix. A driver is whatever LEDMatrix.matrix points at, and
+has to look like a neopixel.NeoPixel with auto_write off:
+    driver[i] = (r, g, b)       also slices, driver[a:b] = [colors]
+    driver[i]                   returns (r, g, b)
+    driver.fill((r, g, b))
+    driver.show()
+    driver.brightness           0.0 to 1.0, applied on the way out
+    len(driver)
+
+openNeoPixel        The real strip, the only thing here that needs the Pi libraries
+SimulatorDriver     Pure software, records shown frames so the whole stack can run,
+                        be profiled and be checked on any machine without a Pi
+NullDriver          Throws everything away, for measuring the cost of the library itself
+
+SharedMemoryDriver, which hands frames to a separate render process, is in renderProcess.py
+"""
+
+# time          time.monotonic() when show() was called
+# pixels        Tuple of (r, g, b) in strip order, before brightness
+# brightness    The driver brightness at the time
+SimulatedFrame = namedtuple("SimulatedFrame", ["time", "pixels", "brightness"])
+
+
+"""
+@brief:     Opens the real WS2812 strip through the adafruit neopixel library
+@note:      neopixel is imported here rather than at the top, so the rest of the
+                project can be imported on machines without it
+@param:     dataPin     Pin from the board module, typ. board.D18
+@param:     nPix        Number of LEDs on the strip
+@param:     brightness  Starting brightness from 0.0 to 1.0
+@param:     pixelOrder  Default "GRB", name of the neopixel byte order constant
+@retval:    NeoPixel    The strip object
+"""
+def openNeoPixel(dataPin, nPix, brightness, pixelOrder = "GRB"):
+    import neopixel
+    return neopixel.NeoPixel(
+        dataPin, nPix, brightness = brightness, auto_write = False,
+        pixel_order = getattr(neopixel, pixelOrder)
+    )
+
+
+class SimulatorDriver:
+    """
+    Stands in for the neopixel strip. Every show() copies the strip into a ring buffer
+    of the last historySize frames, which can then be looked at as a grid, printed to a
+    terminal, or saved as PNG/GIF.
+
+    LEDMatrix calls setLayout when it is given this driver, so the simulator knows where
+    every LED sits on the matrix. Without it frames are treated as one long row.
+
+    liveAnsi prints every frame to the terminal as it is shown, for watching the widgets
+    run on a dev box.
+
+    The recorded pixels are exactly what the LEDs would get, after LEDMatrix's gamma and
+    brightness tables, so at normal brightness they are very dark. The viewing functions
+    take autoLevel to stretch a frame so its brightest channel is 255, just for looking at.
+    """
+    def __init__(self, nPix, historySize = 600, liveAnsi = False, stream = None):
+        self.n = nPix
+        self.brightness = 1.0
+        self.pixels = [(0, 0, 0)] * nPix
+        self.frames = deque(maxlen = historySize)
+        self.showCount = 0
+        self.liveAnsi = liveAnsi
+        self.stream = stream if stream is not None else sys.stdout
+
+        self.rows = 1
+        self.cols = nPix
+        self.pixelIndex = list(range(nPix))
+
+    def setLayout(self, rows, cols, pixelIndex):
+        self.rows = rows
+        self.cols = cols
+        self.pixelIndex = list(pixelIndex)
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, color):
+        if isinstance(index, slice):
+            self.pixels[index] = [c if type(c) is tuple else tuple(c) for c in color]
+        else:
+            self.pixels[index] = color if type(color) is tuple else tuple(color)
+
+    def __getitem__(self, index):
+        return self.pixels[index]
+
+    def fill(self, color):
+        self.pixels = [tuple(color)] * self.n
+
+    def show(self):
+        self.showCount += 1
+        frame = SimulatedFrame(time.monotonic(), tuple(self.pixels), self.brightness)
+        self.frames.append(frame)
+        if self.liveAnsi:
+            # Move the cursor back to the top left so frames draw over each other
+            self.stream.write("\x1b[H" + self.toAnsi(frame, autoLevel = True))
+            self.stream.flush()
+
+    # Forgets every recorded frame
+    def clearHistory(self):
+        self.frames.clear()
+
+    """
+    @brief:     Turns a recorded frame back into rows and cols
+    @param:     frame       Default None, a SimulatedFrame. None means the last frame shown
+    @param:     applyBrightness Default False, scale the colors like the real strip would
+    @param:     autoLevel   Default False, stretch the frame so the brightest channel is 255
+    @retval:    list        rows lists of cols (r, g, b) tuples
+    """
+    def grid(self, frame = None, applyBrightness = False, autoLevel = False):
+        if frame is None:
+            frame = self.frames[-1] if len(self.frames) > 0 else SimulatedFrame(0, tuple(self.pixels), self.brightness)
+        scale = frame.brightness if applyBrightness else 1.0
+        if autoLevel:
+            brightest = max(max(color) for color in frame.pixels) * scale
+            if brightest > 0:
+                scale = scale * 255.0 / brightest
+
+        grid = []
+        for row in range(self.rows):
+            gridRow = []
+            for col in range(self.cols):
+                r, g, b = frame.pixels[self.pixelIndex[(row * self.cols) + col]]
+                gridRow.append((int(r * scale), int(g * scale), int(b * scale)))
+            grid.append(gridRow)
+        return grid
+
+    # Renders a frame as 24 bit color ANSI text, two characters per LED
+    def toAnsi(self, frame = None, autoLevel = False):
+        lines = []
+        for gridRow in self.grid(frame, autoLevel = autoLevel):
+            line = ""
+            for r, g, b in gridRow:
+                line += "\x1b[48;2;" + str(r) + ";" + str(g) + ";" + str(b) + "m  "
+            lines.append(line + "\x1b[0m")
+        return "\n".join(lines) + "\n"
+
+    """
+    @brief:     Saves a frame as a PNG, each LED as a scale x scale square
+    @note:      Written with zlib directly, so no imaging library is needed
+    @param:     path        File to write
+    @param:     frame       Default None, a SimulatedFrame. None means the last frame shown
+    @param:     scale       Default 8, pixels per LED
+    @param:     autoLevel   Default False, stretch the frame so the brightest channel is 255
+    @retval:    None
+    """
+    def savePng(self, path, frame = None, scale = 8, autoLevel = False):
+        grid = self.grid(frame, autoLevel = autoLevel)
+        width = self.cols * scale
+        height = self.rows * scale
+
+        raw = b""
+        for gridRow in grid:
+            line = b"\x00" + b"".join(bytes(color) * scale for color in gridRow)     # filter type 0 per line
+            raw += line * scale
+
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+        with open(path, "wb") as pngFile:
+            pngFile.write(b"\x89PNG\r\n\x1a\n")
+            pngFile.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+            pngFile.write(chunk(b"IDAT", zlib.compress(raw)))
+            pngFile.write(chunk(b"IEND", b""))
+
+    """
+    @brief:     Saves the recorded frames as an animated GIF
+    @note:      Needs Pillow, frame timing comes from when each frame was shown
+    @param:     path        File to write
+    @param:     scale       Default 8, pixels per LED
+    @param:     autoLevel   Default False, stretch each frame so its brightest channel is 255
+    @retval:    None
+    """
+    def saveGif(self, path, scale = 8, autoLevel = False):
+        from PIL import Image
+
+        frames = list(self.frames)
+        if len(frames) == 0:
+            return
+
+        images = []
+        durations = []
+        for index, frame in enumerate(frames):
+            image = Image.new("RGB", (self.cols, self.rows))
+            image.putdata([color for gridRow in self.grid(frame, autoLevel = autoLevel) for color in gridRow])
+            images.append(image.resize((self.cols * scale, self.rows * scale), Image.NEAREST))
+            if index + 1 < len(frames):
+                durations.append(max(20, int((frames[index + 1].time - frame.time) * 1000)))
+            else:
+                durations.append(500)
+
+        images[0].save(path, save_all = True, append_images = images[1:], duration = durations, loop = 0)
+
+
+class NullDriver:
+    """
+    A strip that keeps the pixels but never sends them anywhere. show() only counts,
+    and calls onShow if one is given, which is how the benchmarks find frame boundaries.
+    """
+    def __init__(self, nPix, onShow = None):
+        self.n = nPix
+        self.brightness = 1.0
+        self.pixels = [(0, 0, 0)] * nPix
+        self.showCount = 0
+        self.onShow = onShow
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, color):
+        self.pixels[index] = color
+
+    def __getitem__(self, index):
+        return self.pixels[index]
+
+    def fill(self, color):
+        self.pixels = [tuple(color)] * self.n
+
+    def show(self):
+        self.showCount += 1
+        if self.onShow is not None:
+            self.onShow()
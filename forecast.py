@@ -0,0 +1,123 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+"""
+The Tomorrow.io forecast, parsed once into typed arrays.
+
+widget_Weather used to walk the raw JSON on every display, picking the hourly entry by
+the local hour of day, which is the wrong entry as soon as the forecast is a few hours
+old, and redoing the unit conversions and condition lookups each time.
+
+Now the provider thread parses each response into a Forecast. Hourly entries are kept
+sorted by unix time and looked up with a binary search, so whatever the age of the
+payload, "now" is the entry whose hour contains the current time. Daily entries are
+keyed by their local date, so today and tomorrow stay right across midnight too.
+Display strings are built the first time an hour is shown and reused after that.
+"""
+
+def parseTime(text):
+    # fromisoformat only takes a trailing Z from python 3.11 on
+    return datetime.fromisoformat(text.replace("Z", "+00:00")).timestamp()
+
+def toFahrenheit(celsius):
+    return int(celsius * 1.8 + 32)
+
+
+class Forecast:
+    """
+    hourlyTimes     array of unix times, the start of every hour, sorted
+    hourlyTempF     array of temperatures in F
+    hourlyCodes     array of Tomorrow.io weather codes
+    dailyDates      array of local date ordinals, sorted
+    dailyHighF, dailyLowF, dailyCodes   the same for every day, codes are the worst of the day
+    conditions      weather code (as a string) to the text to show
+    """
+    def __init__(self, hourlyTimes, hourlyTempF, hourlyCodes, dailyDates, dailyHighF, dailyLowF, dailyCodes, conditions):
+        self.hourlyTimes = hourlyTimes
+        self.hourlyTempF = hourlyTempF
+        self.hourlyCodes = hourlyCodes
+        self.dailyDates = dailyDates
+        self.dailyHighF = dailyHighF
+        self.dailyLowF = dailyLowF
+        self.dailyCodes = dailyCodes
+        self.conditions = conditions
+        self.strings = {}       # (hour index, day index): (today string, tomorrow string)
+
+    """
+    @brief:     Parses a Tomorrow.io forecast response
+    @param:     data        The response JSON, with timelines.hourly and timelines.daily
+    @param:     conditions  Dict of weather code strings to condition text, like Widget.weatherCodes
+    @retval:    Forecast
+    """
+    @classmethod
+    def fromTomorrow(cls, data, conditions):
+        hourly = sorted(data['timelines']['hourly'], key = lambda entry: entry['time'])
+        hourlyTimes = array('d', (parseTime(entry['time']) for entry in hourly))
+        hourlyTempF = array('h', (toFahrenheit(float(entry['values']['temperature'])) for entry in hourly))
+        hourlyCodes = array('i', (int(entry['values']['weatherCode']) for entry in hourly))
+
+        daily = sorted(data['timelines']['daily'], key = lambda entry: entry['time'])
+        dailyDates = array('i', (datetime.fromtimestamp(parseTime(entry['time'])).toordinal() for entry in daily))
+        dailyHighF = array('h', (toFahrenheit(float(entry['values']['temperatureMax'])) for entry in daily))
+        dailyLowF = array('h', (toFahrenheit(float(entry['values']['temperatureMin'])) for entry in daily))
+        dailyCodes = array('i', (int(entry['values']['weatherCodeMax']) for entry in daily))
+
+        return cls(hourlyTimes, hourlyTempF, hourlyCodes, dailyDates, dailyHighF, dailyLowF, dailyCodes, dict(conditions))
+
+    # The strings cache is left out when pickling. The render thread adds to it while the
+    # provider thread saves the same Forecast to the ResponseCache, and it is cheap to rebuild
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["strings"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.strings = {}
+
+    # Same forecast values, so the scheduler can tell a refetch of the same forecast from a new one
+    def __eq__(self, other):
+        if not isinstance(other, Forecast):
+            return NotImplemented
+        return (self.hourlyTimes == other.hourlyTimes and self.hourlyTempF == other.hourlyTempF and
+                self.hourlyCodes == other.hourlyCodes and self.dailyDates == other.dailyDates and
+                self.dailyHighF == other.dailyHighF and self.dailyLowF == other.dailyLowF and
+                self.dailyCodes == other.dailyCodes)
+
+    # Index of the hourly entry covering unix time now, clamped to the ends of the forecast
+    def hourIndex(self, now):
+        index = bisect_right(self.hourlyTimes, now) - 1
+        return min(max(index, 0), len(self.hourlyTimes) - 1)
+
+    # Index of the daily entry for a local date ordinal, the closest one if it is not in the forecast
+    def dayIndex(self, dateOrdinal):
+        index = bisect_left(self.dailyDates, dateOrdinal)
+        return min(max(index, 0), len(self.dailyDates) - 1)
+
+    def condition(self, code):
+        return str(self.conditions.get(str(code), self.conditions.get("0", "Unknown")))
+
+    """
+    @brief:     The strings for the weather widget at a point in time
+    @note:      Built once per hour of the forecast, after that this is a dict lookup
+    @param:     now         Default None, unix time, None means right now
+    @retval:    tuple       (today string, tomorrow string), see widget_Weather
+    """
+    def displayStrings(self, now = None):
+        if now is None:
+            now = datetime.now(timezone.utc).timestamp()
+        hour = self.hourIndex(now)
+        today = self.dayIndex(datetime.fromtimestamp(now).toordinal())
+        key = (hour, today)
+
+        strings = self.strings.get(key)
+        if strings is None:
+            tomorrow = min(today + 1, len(self.dailyDates) - 1)
+            #todayString includes current weather, and todays high/low
+            todayString = "Now " + self.condition(self.hourlyCodes[hour]) + ",\\g" + str(self.hourlyTempF[hour]) + "\\6\\w"
+            todayString += ",Today " + self.condition(self.dailyCodes[today]) + ",\\b" + str(self.dailyLowF[today]) + "\\6\\w/\\r" + str(self.dailyHighF[today]) + "\\6"
+            tomorrowString = "Tomorrow " + self.condition(self.dailyCodes[tomorrow]) + ",\\b" + str(self.dailyLowF[tomorrow]) + "\\6\\w/\\r" + str(self.dailyHighF[tomorrow]) + "\\6"
+            strings = (todayString, tomorrowString)
+            self.strings[key] = strings
+        return strings
@@ -0,0 +1,431 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+
+"""
+Animations compiled ahead of time into frame sequence files, and a player for them.
+
+The procedural animations in widget_Animation work out math.sin, HsvToRgb and random
+numbers for every pixel of every frame, on the same CPU that has to feed the strip.
+Compiling runs the very same widget_Animation code once, offline, against a driver
+that records every frame, and writes the frames to a file. Playing memory maps the file
+and copies frames out of it, so no per pixel math is left at runtime.
+
+Each compile is seeded, so any number of variants of an animation can be compiled,
+and widget_Animation picks one of them at random, the same way it picks what to draw.
+
+Every frame lasts as long as it did while compiling: the real time it took to draw, plus
+whatever the animation slept after it, and never less than it takes to clock the frame
+out to the strip. Bounce, rain and sine never sleep, they run as fast as they can draw
+and send, so that is what sets their speed. Compile on the Pi to get the draw times it
+has, anywhere faster the strip time is what is left and they play at the strip's pace.
+
+    python frameSequence.py compile --animation 4 --variants 8
+    python frameSequence.py info animations/sineWave-3.rgbs
+
+File layout, all little endian:
+    header      HEADER
+        magic       4s      SEQUENCE_MAGIC
+        version     uint16  SEQUENCE_VERSION
+        rows        uint8
+        cols        uint8
+        flags       uint16  FLAG_DELTA when delta frames are used
+        frameCount  uint32
+        seed        uint32  the seed it was compiled with
+    index       frameCount entries of INDEX_ENTRY
+        offset      uint32  where the frame starts in the file
+        duration    uint32  microseconds to show the frame for
+    frames      one after the other, each starting with a kind byte
+        FRAME_KEY   rows * cols * 3 bytes of r, g, b in row-major order
+        FRAME_DELTA uint16 run count, then per run: uint16 first pixel, uint16 pixel count,
+                        and count * 3 bytes of r, g, b. Pixels are row-major indexes, and
+                        everything not in a run is the same as the frame before
+"""
+
+SEQUENCE_MAGIC = b"RGBS"
+SEQUENCE_VERSION = 2
+HEADER = struct.Struct("<4sHBBHII")
+INDEX_ENTRY = struct.Struct("<II")
+RUN = struct.Struct("<HH")
+RUN_COUNT = struct.Struct("<H")
+FLAG_DELTA = 1
+FRAME_KEY = 0
+FRAME_DELTA = 1
+
+KEY_INTERVAL = 120      # a key frame at least this often, so a damaged delta never lasts long
+RUN_GAP = 2             # unchanged pixels between two runs before they get split
+MAX_DURATION_US = 0xFFFFFFFF
+STRIP_SECONDS_PER_LED = 0.00003     # 24 bits at 800 kHz, the WS2812B data rate
+STRIP_RESET_SECONDS = 0.00005       # the low time that latches a frame
+SEQUENCE_DIRECTORY = "animations"
+SEQUENCE_EXTENSION = ".rgbs"
+
+# widget_Animation's animation numbers, and the names their compiled files go by
+ANIMATION_NAMES = {0: "randomPixels", 1: "bounce", 2: "redFlash", 3: "rain", 4: "sineWave"}
+
+
+class FrameSequenceWriter:
+    """
+    Builds a frame sequence file, one frame at a time
+
+    Frames are kept in memory until close(), even uncompressed a minute of 7x55 frames is
+    only a couple of megabytes. The file is written to a temp file and renamed into place.
+    """
+    def __init__(self, path, rows, cols, delta = True, seed = 0):
+        self.path = path
+        self.rows = rows
+        self.cols = cols
+        self.frameBytes = rows * cols * 3
+        self.delta = delta
+        self.seed = seed
+        self.frames = []        # (encoded frame, duration us)
+        self.last = None
+        self.sinceKey = 0
+
+    """
+    @brief:     Adds a frame
+    @param:     frame       bytes of r, g, b for every pixel in row-major order
+    @param:     duration    Seconds to show it for
+    @retval:    None
+    """
+    def add(self, frame, duration):
+        frame = bytes(frame)
+        if len(frame) != self.frameBytes:
+            raise ValueError("Frames have to be " + str(self.frameBytes) + " bytes, got " + str(len(frame)))
+        durationUs = min(max(int(round(duration * 1000000)), 0), MAX_DURATION_US)
+
+        encoded = None
+        if self.delta and self.last is not None and self.sinceKey < KEY_INTERVAL:
+            encoded = self._encodeDelta(self.last, frame)
+            self.sinceKey += 1
+        if encoded is None or len(encoded) >= 1 + self.frameBytes:
+            encoded = bytes([FRAME_KEY]) + frame
+            self.sinceKey = 0
+        self.frames.append((encoded, durationUs))
+        self.last = frame
+
+    # Adds seconds to the last frame, for a pause after it
+    def hold(self, duration):
+        if len(self.frames) > 0:
+            encoded, durationUs = self.frames[-1]
+            self.frames[-1] = (encoded, min(durationUs + int(round(duration * 1000000)), MAX_DURATION_US))
+
+    def _encodeDelta(self, previous, frame):
+        runs = []
+        start = None
+        gap = 0
+        for pixel in range(0, self.frameBytes // 3):
+            offset = pixel * 3
+            if frame[offset:offset + 3] != previous[offset:offset + 3]:
+                if start is None:
+                    start = pixel
+                gap = 0
+                end = pixel + 1
+            elif start is not None:
+                gap += 1
+                if gap > RUN_GAP:
+                    runs.append((start, end))
+                    start = None
+        if start is not None:
+            runs.append((start, end))
+
+        parts = [bytes([FRAME_DELTA]), RUN_COUNT.pack(len(runs))]
+        for start, end in runs:
+            parts.append(RUN.pack(start, end - start))
+            parts.append(frame[start * 3:end * 3])
+        return b"".join(parts)
+
+    def close(self):
+        headerSize = HEADER.size + (len(self.frames) * INDEX_ENTRY.size)
+        index = []
+        offset = headerSize
+        for encoded, durationUs in self.frames:
+            index.append(INDEX_ENTRY.pack(offset, durationUs))
+            offset += len(encoded)
+
+        flags = FLAG_DELTA if self.delta else 0
+        tempPath = self.path + ".tmp"
+        with open(tempPath, "wb") as sequenceFile:
+            sequenceFile.write(HEADER.pack(SEQUENCE_MAGIC, SEQUENCE_VERSION, self.rows, self.cols, flags, len(self.frames), self.seed))
+            sequenceFile.write(b"".join(index))
+            for encoded, durationUs in self.frames:
+                sequenceFile.write(encoded)
+        os.replace(tempPath, self.path)
+
+
+class FrameSequence:
+    """
+    A frame sequence file, memory mapped
+
+    Nothing is read up front besides the header, frames are decoded straight out of the
+    mapping as they are played.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(path + " is empty")
+        magic, version, self.rows, self.cols, self.flags, self.frameCount, self.seed = HEADER.unpack_from(self.data, 0)
+        if magic != SEQUENCE_MAGIC or version != SEQUENCE_VERSION:
+            self.close()
+            raise ValueError(path + " is not a version " + str(SEQUENCE_VERSION) + " frame sequence")
+        self.nPix = self.rows * self.cols
+        self.frameBytes = self.nPix * 3
+
+    def __len__(self):
+        return self.frameCount
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    # Total run time in seconds
+    def duration(self):
+        return sum(INDEX_ENTRY.unpack_from(self.data, HEADER.size + (i * INDEX_ENTRY.size))[1] for i in range(self.frameCount)) / 1000000.0
+
+    """
+    @brief:     Decodes every frame in order
+    @note:      The same bytearray is handed out every time, changed in place, copy it to keep a frame
+    @retval:    generator   (frame, changed, duration seconds), frame is the whole frame in row-major
+                                order, changed is a list of the pixels that changed or None for all of them
+    """
+    def frames(self):
+        data = self.data
+        current = bytearray(self.frameBytes)
+        for i in range(self.frameCount):
+            offset, durationUs = INDEX_ENTRY.unpack_from(data, HEADER.size + (i * INDEX_ENTRY.size))
+            kind = data[offset]
+            if kind == FRAME_KEY:
+                current[:] = data[offset + 1:offset + 1 + self.frameBytes]
+                changed = None
+            else:
+                runCount = RUN_COUNT.unpack_from(data, offset + 1)[0]
+                position = offset + 1 + RUN_COUNT.size
+                changed = []
+                for run in range(runCount):
+                    start, count = RUN.unpack_from(data, position)
+                    position += RUN.size
+                    current[start * 3:(start + count) * 3] = data[position:position + (count * 3)]
+                    position += count * 3
+                    changed.extend(range(start, start + count))
+            yield current, changed, durationUs / 1000000.0
+
+    """
+    @brief:     Plays the sequence on a matrix
+    @note:      Every frame goes through matrix.show(), so the scheduler can still cut it off,
+                    and it is paced on absolute deadlines like FrameClock
+    @param:     mat         LEDMatrix, the same size as the sequence
+    @retval:    None
+    """
+    def play(self, mat):
+        if (mat.rows, mat.cols) != (self.rows, self.cols):
+            raise ValueError("Sequence is " + str(self.rows) + "x" + str(self.cols) + ", the matrix is " + str(mat.rows) + "x" + str(mat.cols))
+        strip = mat.matrix
+        pixelIndex = mat.pixelIndex
+        stripGather = [int(pixel) for pixel in mat.stripGather]
+        deadline = time.monotonic()
+        for frame, changed, duration in self.frames():
+            if changed is None:
+                pixels = list(zip(frame[0::3], frame[1::3], frame[2::3]))
+                strip[0:self.nPix] = [pixels[pixel] for pixel in stripGather]
+            else:
+                for pixel in changed:
+                    offset = pixel * 3
+                    strip[pixelIndex[pixel]] = (frame[offset], frame[offset + 1], frame[offset + 2])
+            strip.show()
+
+            deadline += duration
+            wait = deadline - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            elif wait < -duration:
+                deadline = time.monotonic()     # far behind, dont rush to catch up
+
+
+class SequenceLibrary:
+    """
+    The compiled sequences in a directory, by animation name. Files are named
+    <name>-<seed>.rgbs, a missing directory is just an empty library.
+    """
+    def __init__(self, directory = SEQUENCE_DIRECTORY):
+        self.directory = directory
+
+    # Paths of every compiled variant of an animation
+    def variants(self, name):
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        prefix = name + "-"
+        return sorted(os.path.join(self.directory, each) for each in files
+                      if each.startswith(prefix) and each.endswith(SEQUENCE_EXTENSION))
+
+    """
+    @brief:     Picks one compiled variant of an animation at random
+    @param:     name        Animation name, see ANIMATION_NAMES
+    @retval:    str         Path of the file, None when nothing is compiled for it
+    """
+    def choose(self, name):
+        variants = self.variants(name)
+        if len(variants) == 0:
+            return None
+        return random.choice(variants)
+
+
+class RecordingDriver:
+    """
+    A driver that keeps every shown frame, in row-major order, with how long it was on
+    the display. Used to compile animations, see compileAnimation.
+
+    The animation runs on a clock of its own: real time, plus every sleep it asked for,
+    which returns straight away, minus the time spent in here recording frames. A frame
+    lasts from its show() to the next one on that clock, so it gets the real time the
+    next frame took to draw plus the sleeps in between, just like on the LEDs. Sending a
+    frame to the strip takes stripSeconds, and the next one cannot go out before that, so
+    a frame that would be shorter is stretched to it and the clock moves on with it.
+    """
+    def __init__(self, n, writer):
+        self.n = n
+        self.brightness = 1.0
+        self.pixels = [(0, 0, 0)] * n
+        self.writer = writer
+        self.pixelIndex = None
+        self.realMonotonic = time.monotonic     # kept before compileAnimation swaps it out
+        self.slept = 0.0        # seconds of sleep that were skipped
+        self.overhead = 0.0     # seconds spent recording, they are not part of the animation
+        self.lastShow = None    # the clock when the last frame went out
+        self.stripSeconds = (n * STRIP_SECONDS_PER_LED) + STRIP_RESET_SECONDS
+
+    def setLayout(self, rows, cols, pixelIndex):
+        self.pixelIndex = list(pixelIndex)
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, color):
+        self.pixels[index] = color
+
+    def __getitem__(self, index):
+        return self.pixels[index]
+
+    def fill(self, color):
+        self.pixels = [tuple(color)] * self.n
+
+    def show(self):
+        recordStart = self.realMonotonic()
+        self.flush()
+        frame = bytearray(self.n * 3)
+        for pixel, position in enumerate(self.pixelIndex):
+            frame[pixel * 3:(pixel * 3) + 3] = bytes(self.pixels[position])
+        self.writer.add(frame, 0)
+        self.overhead += self.realMonotonic() - recordStart
+
+    # Stands in for time.sleep, the time is added to the clock instead of waited out
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.slept += seconds
+
+    # Stands in for time.monotonic, so FrameClock paces against the animation's clock
+    def monotonic(self):
+        return self.realMonotonic() + self.slept - self.overhead
+
+    # Ends the last frame shown, it lasted until now, or for as long as the strip needed
+    def flush(self):
+        now = self.monotonic()
+        if self.lastShow is not None:
+            elapsed = now - self.lastShow
+            if elapsed < self.stripSeconds:
+                self.slept += self.stripSeconds - elapsed
+                elapsed = self.stripSeconds
+            self.writer.hold(elapsed)
+        self.lastShow = self.monotonic()
+
+
+"""
+@brief:     Compiles one seeded variant of a widget_Animation animation
+@note:      Runs the procedural animation itself against a RecordingDriver, with brightness
+                and gamma at 1.0 so the file holds the colors as drawn
+@param:     animationNumber     See ANIMATION_NAMES
+@param:     seed                Seed for random
+@param:     directory           Default SEQUENCE_DIRECTORY
+@param:     delta               Default True, use delta frames
+@param:     rows, cols          Default 7 x 55
+@retval:    str                 Path of the file that was written
+"""
+def compileAnimation(animationNumber, seed, directory = SEQUENCE_DIRECTORY, delta = True, rows = 7, cols = 55):
+    # Only needed to compile, not to play
+    from matrix import LEDMatrix, np
+    from widgets import Widget
+    from color import Color
+
+    os.makedirs(directory, exist_ok = True)
+    path = os.path.join(directory, ANIMATION_NAMES[animationNumber] + "-" + str(seed) + SEQUENCE_EXTENSION)
+    writer = FrameSequenceWriter(path, rows, cols, delta = delta, seed = seed)
+    driver = RecordingDriver(rows * cols, writer)
+    mat = LEDMatrix(None, rows, cols, bufferEnabled = True, bufferBackend = "numpy" if np is not None else "list", driver = driver)
+    mat.setBrightness(1.0)
+    mat.setGamma(1.0)
+
+    # Only the animation is needed, so skip __init__ and its secrets file and API providers
+    w = Widget.__new__(Widget)
+    w.mat = mat
+    w.c = Color()
+
+    # Sleeps become frame durations instead of waiting, see RecordingDriver
+    realSleep = time.sleep
+    realMonotonic = time.monotonic
+    time.sleep = driver.sleep
+    time.monotonic = driver.monotonic
+    try:
+        random.seed(seed)
+        mat.clearDisplay()
+        w.widget_Animation(animationNumber)
+        driver.flush()
+    finally:
+        time.sleep = realSleep
+        time.monotonic = realMonotonic
+    writer.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compiles widget_Animation animations into frame sequence files")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    compileCommand = commands.add_parser("compile", help = "compile seeded variants of animations")
+    compileCommand.add_argument("--animation", type = int, nargs = "*", default = None,
+                                help = "animation numbers, default all: " + ", ".join(str(n) + " " + name for n, name in ANIMATION_NAMES.items()))
+    compileCommand.add_argument("--variants", type = int, default = 4, help = "seeded variants of each")
+    compileCommand.add_argument("--first-seed", type = int, default = 1, help = "seed of the first variant")
+    compileCommand.add_argument("--out", default = SEQUENCE_DIRECTORY, help = "directory for the files")
+    compileCommand.add_argument("--no-delta", action = "store_true", help = "only key frames")
+    infoCommand = commands.add_parser("info", help = "describe a compiled file")
+    infoCommand.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        for animationNumber in (args.animation if args.animation else sorted(ANIMATION_NAMES)):
+            for seed in range(args.first_seed, args.first_seed + args.variants):
+                path = compileAnimation(animationNumber, seed, args.out, delta = not args.no_delta)
+                with FrameSequence(path) as sequence:
+                    print("{:<36}{:>6} frames{:>8.1f} s{:>10} bytes".format(path, len(sequence), sequence.duration(), os.path.getsize(path)))
+    else:
+        with FrameSequence(args.path) as sequence:
+            print(args.path)
+            print("  " + str(sequence.rows) + "x" + str(sequence.cols) + ", " + str(len(sequence)) + " frames, " +
+                  "{:.1f}".format(sequence.duration()) + " s, seed " + str(sequence.seed) +
+                  (", delta frames" if sequence.flags & FLAG_DELTA else ", key frames only"))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import unicodedata
+from font import font, symbols
+
+"""
+Text used to be drawn by walking the 7x7 lists in font.py for every character,
+on every single frame of a scroll. This compiles the font once into a packed
+atlas, and renders a whole string once into an off screen strip of colors.
+After that each frame of a scroll is just a slice of the strip.
+
+Glyphs are packed as 7 row masks, bit n of a row mask is column n of the glyph.
+Symbols from font.py are stored under the keys "\\0" to "\\9" so the escape
+code is also the atlas key.
+
+Headlines from the APIs are full of characters the font does not have, smart quotes,
+accents, dashes. Before layout every string goes through normalize(), which maps it onto
+the font in one str.translate pass. Anything that still has no glyph becomes
+REPLACEMENT_GLYPH instead of raising KeyError halfway through a widget.
+"""
+
+GLYPH_SIZE = 7
+BLACK = (0, 0, 0)
+REPLACEMENT_GLYPH = "?"
+NORMALIZE_CACHE_SIZE = 64
+
+# Characters that NFKD does not take apart, or takes apart into something the font does not have
+SUBSTITUTIONS = {
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u201b": "'", "\u2032": "'", "\u00b4": "'", "`": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u2033": '"', "\u00ab": '"', "\u00bb": '"',
+    "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2013": "-", "\u2014": "-", "\u2015": "-", "\u2212": "-",
+    "\u2026": "...", "\u2022": "-", "\u00b7": "-", "|": "-", "~": "-",
+    "<": "(", ">": ")", "@": "at",
+    "\u00d7": "x", "\u00f7": "/", "\u2044": "/",
+    "\u00a3": "GBP", "\u20ac": "EUR", "\u00a5": "JPY",
+    "\u00df": "ss", "\u00e6": "ae", "\u00c6": "AE", "\u0153": "oe", "\u0152": "OE",
+    "\u00f8": "o", "\u00d8": "O", "\u0142": "l", "\u0141": "L", "\u0111": "d", "\u0110": "D",
+    "\u00f0": "d", "\u00d0": "D", "\u00fe": "th", "\u00de": "Th", "\u0131": "i",
+    "\t": " ", "\n": " ", "\r": " ",
+}
+
+
+class FallbackTable(dict):
+    """
+    Translation table for str.translate that maps every character onto the font.
+
+    Characters that are in the font map to themselves. Anything else is worked out the
+    first time it is seen and stored, so each distinct character only costs once:
+        SUBSTITUTIONS first, then NFKD with the accents dropped, then REPLACEMENT_GLYPH.
+    Control characters are dropped.
+    """
+    def __init__(self, glyphChars):
+        super().__init__()
+        self.glyphChars = glyphChars
+        for char in glyphChars:
+            self[ord(char)] = char
+        # Latin-1, Latin Extended-A and General Punctuation cover nearly all headlines, do them now
+        for codePoint in list(range(0x80, 0x180)) + list(range(0x2000, 0x2070)):
+            self[codePoint] = self.fallback(chr(codePoint))
+
+    def __missing__(self, codePoint):
+        replacement = self.fallback(chr(codePoint))
+        self[codePoint] = replacement
+        return replacement
+
+    def fallback(self, char):
+        if char in self.glyphChars:
+            return char
+        if char in SUBSTITUTIONS:
+            return SUBSTITUTIONS[char]
+        category = unicodedata.category(char)
+        if category.startswith("C"):
+            return ""
+        if category.startswith("Z"):
+            return " "
+
+        decomposed = unicodedata.normalize("NFKD", char)
+        if decomposed != char:
+            parts = []
+            for part in decomposed:
+                if unicodedata.combining(part):
+                    continue
+                parts.append(self.fallback(part))
+            result = "".join(parts)
+            if result != "":
+                return result
+        return REPLACEMENT_GLYPH
+
+
+class GlyphAtlas:
+    def __init__(self, escapeColors):
+        self.escapeColors = escapeColors
+        self.glyphs = {}
+
+        for char, charData in font.items():
+            self.glyphs[char] = self.packGlyph(charData)
+        for number, symbolData in symbols.items():
+            self.glyphs["\\" + str(number)] = self.packGlyph(symbolData)
+
+        # Each packed glyph is also expanded into the list of (row, col) offsets that are lit,
+        # which is all the renderer needs when it stamps the glyph into a strip
+        self.litOffsets = {}
+        for key, rowMasks in self.glyphs.items():
+            self.litOffsets[key] = [(row, col) for row in range(GLYPH_SIZE) for col in range(GLYPH_SIZE) if rowMasks[row] & (1 << col)]
+
+        # Escape codes are plain ASCII that the font has, so translating them is a no-op
+        self.fallbackTable = FallbackTable(set(font.keys()))
+        self.normalizeCache = {}
+        self.normalizeHits = 0
+        self.normalizeMisses = 0
+
+    # Turns a 7x7 list of 0/1 from font.py into a tuple of 7 row bitmasks
+    def packGlyph(self, glyphData):
+        rowMasks = []
+        for row in range(GLYPH_SIZE):
+            mask = 0
+            for col in range(GLYPH_SIZE):
+                if glyphData[row][col] == 1:
+                    mask |= (1 << col)
+            rowMasks.append(mask)
+        return tuple(rowMasks)
+
+    """
+    @brief:     Splits an escaped string into the glyphs to draw and the color of each
+    @note:      Escapes work the same as LEDMatrix.stringPrint, \\0-\\9 are symbols and
+                    letters from escapeColors change the color for the rest of the string
+    @note:      The string is normalized first, so characters missing from the font never raise
+    @param:     string      The string to be rendered
+    @param:     color       The starting color as (RED,GRN,BLU)
+    @retval:    list        (atlasKey, color) for every glyph, in order
+    """
+    def layout(self, string, color):
+        string = self.normalize(string)
+        glyphs = []
+        drawColor = tuple(color)
+
+        index = 0
+        while index <= len(string) - 1:
+            char = string[index]
+
+            if char == '\\':
+                nextChar = string[index + 1] if index + 1 < len(string) else ""
+                if nextChar.isnumeric():
+                    glyphs.append(("\\" + nextChar, drawColor))
+                elif nextChar in self.escapeColors:
+                    drawColor = self.escapeColors[nextChar]
+                index += 1  # skip past the escape code
+            else:
+                glyphs.append((char, drawColor))
+
+            index += 1
+        return glyphs
+
+    """
+    @brief:     Maps a string onto the characters the font has
+    @note:      Smart quotes and dashes become ASCII, accents are dropped, anything else
+                    becomes REPLACEMENT_GLYPH. Results are cached per distinct string
+    @param:     string      Any text, escape codes are left alone
+    @retval:    str         A string that only uses characters from the font
+    """
+    def normalize(self, string):
+        normalized = self.normalizeCache.get(string)
+        if normalized is None:
+            self.normalizeMisses += 1
+            normalized = string.translate(self.fallbackTable)
+            if len(self.normalizeCache) >= NORMALIZE_CACHE_SIZE:
+                del self.normalizeCache[next(iter(self.normalizeCache))]
+            self.normalizeCache[string] = normalized
+        else:
+            self.normalizeHits += 1
+        return normalized
+
+    """
+    @brief:     Renders a string once into a TextStrip
+    @param:     string      The string to be rendered
+    @param:     color       The starting color as (RED,GRN,BLU)
+    @retval:    TextStrip   The rendered string
+    """
+    def render(self, string, color):
+        glyphs = self.layout(string, color)
+        width = len(glyphs) * GLYPH_SIZE
+
+        rows = [[BLACK] * width for _ in range(GLYPH_SIZE)]
+        litPixels = []
+        drawCol = 0
+        for key, drawColor in glyphs:
+            for row, col in self.litOffsets[key]:
+                rows[row][drawCol + col] = drawColor
+                litPixels.append((row, drawCol + col, drawColor))
+            drawCol += GLYPH_SIZE
+
+        return TextStrip(rows, litPixels, width)
+
+
+class TextStrip:
+    """
+    A string that has already been rendered, 7 rows tall and width columns wide
+
+    rows        7 lists of width colors, unlit pixels are black, used for opaque frames
+    litPixels   (row, col, color) for every lit pixel, used when drawing over something else
+    """
+    def __init__(self, rows, litPixels, width):
+        self.rows = rows
+        self.litPixels = litPixels
+        self.width = width
+        self.height = GLYPH_SIZE
+
+    """
+    @brief:     Cuts a window out of the strip, padding with black where it runs off either end
+    @param:     stripRow    Row of the strip, anything outside 0-6 is all black
+    @param:     startCol    Column of the window, relative to the start of the strip
+    @param:     width       How many columns to return
+    @retval:    list        width colors
+    """
+    def rowSlice(self, stripRow, startCol, width):
+        if stripRow < 0 or stripRow >= self.height:
+            return [BLACK] * width
+
+        row = self.rows[stripRow]
+        if startCol < 0:
+            pad = min(-startCol, width)
+            pixels = [BLACK] * pad + row[0:width - pad]
+        else:
+            pixels = row[startCol:startCol + width]
+        # The strip can also end inside the window, pad the right side too
+        return pixels + [BLACK] * (width - len(pixels))
@@ -0,0 +1,129 @@
+import threading
+from urllib.parse import urlsplit
+
+"""
+One HTTP client shared by all of the widget data providers.
+
+A bare requests.get opens a new TCP and TLS connection every time. This keeps a
+requests.Session with a connection pool per host, so connections are kept alive
+between refreshes, and every request gets a timeout picked by host.
+
+Responses that came with an ETag or Last-Modified header are remembered by URL.
+The next request for that URL is sent as a conditional request, and if the server
+answers 304 Not Modified, the remembered response is returned instead. Callers can
+check response.notModified to skip reprocessing data they already have.
+
+Per host, the client also counts responses by status code and 304s, and remembers the
+last rate limit headers (X-RateLimit-Remaining and friends), see stats().
+
+requests is only imported when the first request is made, which is on a provider
+thread, so it stays out of the way of the first frame at startup.
+"""
+
+class HttpClient:
+    # (connect, read) timeouts in seconds
+    DEFAULT_TIMEOUT = (5, 15)
+    HOST_TIMEOUTS = {
+        "api.weather.gov": (5, 20),         # NWS can be slow, but alerts matter
+        "maps.googleapis.com": (5, 10),
+        "api.tomorrow.io": (5, 15),
+        "newsapi.org": (5, 15),
+    }
+
+    def __init__(self, hostTimeouts = None, poolSize = 4):
+        self.hostTimeouts = dict(self.HOST_TIMEOUTS)
+        if hostTimeouts is not None:
+            self.hostTimeouts.update(hostTimeouts)
+
+        self.poolSize = poolSize
+        self.session = None
+
+        # url: last 200 response that had an ETag or Last-Modified header
+        self.validated = {}
+        self.lock = threading.Lock()
+
+        # host: {"codes": {status code: count}, "notModified": count, "rateLimit": {window: remaining}}
+        self.hostStats = {}
+
+    # The pooled session, made on first use
+    def _session(self):
+        with self.lock:
+            if self.session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections = self.poolSize, pool_maxsize = self.poolSize)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.session = session
+            return self.session
+
+    # The (connect, read) timeout to use for a url
+    def timeoutFor(self, url):
+        return self.hostTimeouts.get(urlsplit(url).hostname, self.DEFAULT_TIMEOUT)
+
+    """
+    @brief:     GETs a url over the pooled session
+    @note:      The returned response has an extra notModified attribute, True when the server
+                    answered 304 and this is the remembered response from an earlier call
+    @param:     url         The url to get
+    @param:     headers     Default None, extra headers to send
+    @param:     conditional Default True, send If-None-Match/If-Modified-Since when we can
+    @retval:    Response    A requests.Response
+    """
+    def get(self, url, headers = None, conditional = True):
+        sendHeaders = dict(headers) if headers is not None else {}
+
+        with self.lock:
+            previous = self.validated.get(url) if conditional else None
+        if previous is not None:
+            if "ETag" in previous.headers:
+                sendHeaders["If-None-Match"] = previous.headers["ETag"]
+            if "Last-Modified" in previous.headers:
+                sendHeaders["If-Modified-Since"] = previous.headers["Last-Modified"]
+
+        response = self._session().get(url, headers = sendHeaders, timeout = self.timeoutFor(url))
+        self._count(url, response)
+
+        if response.status_code == 304 and previous is not None:
+            previous.notModified = True
+            return previous
+
+        response.notModified = False
+        if response.status_code == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers):
+            response.content   # read the body now, so it is still there when this response gets reused
+            with self.lock:
+                self.validated[url] = response
+        return response
+
+    # Adds a response to the per host counters
+    def _count(self, url, response):
+        host = urlsplit(url).hostname
+        with self.lock:
+            stats = self.hostStats.setdefault(host, {"codes": {}, "notModified": 0, "rateLimit": {}})
+            code = str(response.status_code)
+            stats["codes"][code] = stats["codes"].get(code, 0) + 1
+            if response.status_code == 304:
+                stats["notModified"] += 1
+            for header, value in response.headers.items():
+                # X-RateLimit-Remaining, RateLimit-Remaining, X-RateLimit-Remaining-Day and so on
+                name = header.lower()
+                if name.startswith("x-"):
+                    name = name[2:]
+                if name.startswith("ratelimit-remaining"):
+                    window = name[len("ratelimit-remaining"):].strip("-") or "default"
+                    try:
+                        stats["rateLimit"][window] = int(value)
+                    except ValueError:
+                        pass
+
+    # A copy of the per host counters, safe to read from another thread
+    def stats(self):
+        with self.lock:
+            return {host: {"codes": dict(stats["codes"]), "notModified": stats["notModified"], "rateLimit": dict(stats["rateLimit"])}
+                    for host, stats in self.hostStats.items()}
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
@@ -0,0 +1,349 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+"""
+Command line analyzer for log.txt.
+
+The log is read in one streaming pass, record by record. A record is a line starting
+with [LEVEL][timestamp]: plus every line after it that does not, which is how the
+multi-line exception records from the widgets are kept together.
+
+Everything the reports need is summed up per hour and saved in an index file next to
+the log (log.txt.idx), together with the byte offset of the first record of every hour
+and how far into the log the index goes. The next run only parses what was appended
+since then. If the log was rotated or replaced, the index is rebuilt from scratch.
+
+    python logAnalyzer.py rates                         API calls per provider per hour
+    python logAnalyzer.py exceptions --top 10           most common exception types by widget
+    python logAnalyzer.py gaps --kind api               longest gaps between consecutive records, in ms
+
+rates and exceptions come straight from the index. gaps needs the actual timestamps, so it
+seeks to the first indexed hour inside --since and streams from there.
+"""
+
+INDEX_VERSION = 1
+HEAD_BYTES = 256        # the start of the log is hashed to notice when it has been rotated
+
+RECORD_START = re.compile(rb"^\[(\w+)\]\[([^\]]+)\]: ")
+FIELDS = re.compile(r" \|((?: \w+=\S*)+)\s*$")
+API_CALL = re.compile(r"^Calling (.+) API\.")
+API_RESPONSE = re.compile(r"^(.+) API Response (\d+)")
+EXCEPTION = re.compile(r"^An exception of type (\w+) occurred in (?:provider )?(\S+?)\.")
+FETCHED = re.compile(r"^Fetched (\S+)\.")
+
+# Record kinds, what each record gets counted as
+KIND_API = "api"
+KIND_EXCEPTION = "exception"
+KIND_HTTP_ERROR = "httpError"
+KIND_FETCH = "fetch"
+KIND_START = "start"
+KIND_OTHER = "other"
+
+
+class LogRecord:
+    """
+    One parsed record. offset is the byte offset of its first line in the log.
+    """
+    __slots__ = ("offset", "level", "time", "message", "fields", "kind", "key")
+
+    def __init__(self, offset, level, time, message, fields):
+        self.offset = offset
+        self.level = level
+        self.time = time
+        self.message = message
+        self.fields = fields
+        self.kind, self.key = classify(message)
+
+    def hour(self):
+        return self.time.strftime("%Y-%m-%d %H:00")
+
+
+"""
+@brief:     Works out what kind of record a message is
+@param:     message     The record text, without the level and timestamp
+@retval:    tuple       (kind, key), key is the API name, or "widget|ExceptionType" and so on
+"""
+def classify(message):
+    match = API_CALL.match(message)
+    if match:
+        return (KIND_API, match.group(1))
+    match = EXCEPTION.match(message)
+    if match:
+        return (KIND_EXCEPTION, match.group(2) + "|" + match.group(1))
+    match = API_RESPONSE.match(message)
+    if match:
+        return (KIND_HTTP_ERROR, match.group(1) + "|HTTP " + match.group(2))
+    match = FETCHED.match(message)
+    if match:
+        return (KIND_FETCH, match.group(1))
+    if message.startswith("Program starting"):
+        return (KIND_START, None)
+    return (KIND_OTHER, None)
+
+def _buildRecord(offset, level, timestamp, lines):
+    message = "".join(lines).rstrip("\r\n")
+    fields = {}
+    # Structured fields from logWriter.py are on the end of the last line, after " |"
+    match = FIELDS.search(message)
+    if match:
+        for pair in match.group(1).split():
+            key, value = pair.split("=", 1)
+            fields[key] = value
+        message = message[:match.start()]
+    try:
+        time = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    return LogRecord(offset, level, time, message, fields)
+
+"""
+@brief:     Streams the records of a log file
+@note:      Lines are read as bytes so the offsets stay exact, whatever the encoding
+@param:     logFile     Log opened in binary mode, already seeked to a record start
+@retval:    generator   LogRecord objects in file order
+"""
+def readRecords(logFile):
+    offset = logFile.tell()
+    pending = None      # (offset, level, timestamp, lines)
+
+    for line in logFile:
+        start = RECORD_START.match(line)
+        if start:
+            if pending is not None:
+                record = _buildRecord(*pending)
+                if record is not None:
+                    yield record
+            level = start.group(1).decode("ascii", "replace")
+            timestamp = start.group(2).decode("ascii", "replace")
+            pending = (offset, level, timestamp, [line[start.end():].decode("utf-8", "replace")])
+        elif pending is not None:
+            pending[3].append(line.decode("utf-8", "replace"))
+        offset += len(line)
+
+    if pending is not None:
+        record = _buildRecord(*pending)
+        if record is not None:
+            yield record
+
+
+class LogIndex:
+    """
+    Per hour summary of a log file, kept up to date incrementally.
+
+    hours maps "YYYY-MM-DD HH:00" to
+        offset      Byte offset of the first record in that hour
+        records     Records per kind
+        api         API calls per provider
+        exceptions  Exceptions and bad HTTP responses, per "widget|type"
+    """
+    def __init__(self, logPath, indexPath = None):
+        self.logPath = logPath
+        self.indexPath = indexPath if indexPath is not None else logPath + ".idx"
+        self.reset()
+
+    def reset(self):
+        self.parsedTo = 0
+        self.head = ""
+        self.hours = {}
+        self.lastTime = None
+
+    def _headHash(self):
+        with open(self.logPath, "rb") as logFile:
+            return hashlib.sha1(logFile.read(HEAD_BYTES)).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.indexPath) as indexFile:
+                stored = json.load(indexFile)
+        except (OSError, ValueError):
+            return False
+        if stored.get("version") != INDEX_VERSION:
+            return False
+        self.parsedTo = stored["parsedTo"]
+        self.head = stored["head"]
+        self.hours = stored["hours"]
+        self.lastTime = stored["lastTime"]
+        return True
+
+    def save(self):
+        tempPath = self.indexPath + ".tmp"
+        with open(tempPath, "w") as indexFile:
+            json.dump({
+                "version": INDEX_VERSION,
+                "parsedTo": self.parsedTo,
+                "head": self.head,
+                "hours": self.hours,
+                "lastTime": self.lastTime,
+            }, indexFile)
+        os.replace(tempPath, self.indexPath)
+
+    """
+    @brief:     Brings the index up to date with the log, parsing only the new part
+    @param:     rebuild     Default False, throw the stored index away and start over
+    @retval:    int         Number of bytes that were parsed
+    """
+    def update(self, rebuild = False):
+        size = os.path.getsize(self.logPath)
+        head = self._headHash()
+        if rebuild or not self.load() or self.head != head or self.parsedTo > size:
+            # Rotated, truncated, or never indexed
+            self.reset()
+        self.head = head
+
+        start = self.parsedTo
+        last = None
+        with open(self.logPath, "rb") as logFile:
+            logFile.seek(start)
+            for record in readRecords(logFile):
+                if last is not None:
+                    self.add(last)
+                last = record
+            end = logFile.tell()
+
+        # More lines of the last record could still be on the way, so it is counted
+        # for this run but left out of the saved index, and parsed again next time
+        if last is not None:
+            self.parsedTo = last.offset
+        self.save()
+        if last is not None:
+            self.add(last)
+        return end - start
+
+    def add(self, record):
+        hour = record.hour()
+        bucket = self.hours.get(hour)
+        if bucket is None:
+            bucket = {"offset": record.offset, "records": {}, "api": {}, "exceptions": {}}
+            self.hours[hour] = bucket
+        bucket["records"][record.kind] = bucket["records"].get(record.kind, 0) + 1
+        if record.kind == KIND_API:
+            bucket["api"][record.key] = bucket["api"].get(record.key, 0) + 1
+        elif record.kind in (KIND_EXCEPTION, KIND_HTTP_ERROR):
+            bucket["exceptions"][record.key] = bucket["exceptions"].get(record.key, 0) + 1
+        self.lastTime = str(record.time)
+
+    # Hours in order, limited to [since, until) when given as "YYYY-MM-DD HH:00" strings
+    def hoursBetween(self, since = None, until = None):
+        for hour in sorted(self.hours):
+            if since is not None and hour < since:
+                continue
+            if until is not None and hour >= until:
+                continue
+            yield hour, self.hours[hour]
+
+    # Byte offset to start reading from to see every record from the hour of since onwards
+    def offsetFor(self, since):
+        for hour, bucket in self.hoursBetween(since):
+            return bucket["offset"]
+        return self.parsedTo
+
+
+######################################
+##  Reports                         ##
+######################################
+
+# Times from the command line, taken as UTC when no offset is given, same as the log
+def _parseTime(text):
+    if text is None:
+        return None
+    time = datetime.fromisoformat(text)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo = timezone.utc)
+    return time
+
+def _hourKey(text):
+    if text is None:
+        return None
+    return _parseTime(text).astimezone(timezone.utc).strftime("%Y-%m-%d %H:00")
+
+def reportRates(index, since, until, top):
+    totals = {}
+    hourCount = 0
+    print("{:<18}{:<28}{:>8}".format("hour (utc)", "api", "calls"))
+    for hour, bucket in index.hoursBetween(since, until):
+        hourCount += 1
+        for api, calls in sorted(bucket["api"].items()):
+            print("{:<18}{:<28}{:>8}".format(hour, api, calls))
+            totals[api] = totals.get(api, 0) + calls
+
+    print("")
+    print("Average over {} hours with records:".format(hourCount))
+    for api, calls in sorted(totals.items(), key = lambda item: -item[1])[:top]:
+        print("    {:<28}{:>10.1f} calls/hour  {:>8} total".format(api, calls / max(1, hourCount), calls))
+
+def reportExceptions(index, since, until, top):
+    totals = {}
+    for hour, bucket in index.hoursBetween(since, until):
+        for key, count in bucket["exceptions"].items():
+            totals[key] = totals.get(key, 0) + count
+
+    print("{:<28}{:<24}{:>8}".format("widget", "type", "count"))
+    for key, count in sorted(totals.items(), key = lambda item: -item[1])[:top]:
+        widget, kind = key.split("|", 1)
+        print("{:<28}{:<24}{:>8}".format(widget, kind, count))
+
+def reportGaps(index, since, until, top, kind):
+    sinceTime = _parseTime(since)
+    untilTime = _parseTime(until)
+    gaps = []
+    previous = None
+    with open(index.logPath, "rb") as logFile:
+        logFile.seek(index.offsetFor(_hourKey(since)))
+        for record in readRecords(logFile):
+            if kind is not None and record.kind != kind:
+                continue
+            if sinceTime is not None and record.time < sinceTime:
+                continue
+            if untilTime is not None and record.time >= untilTime:
+                break
+            if previous is not None:
+                gaps.append(((record.time - previous.time).total_seconds() * 1000, previous, record))
+            previous = record
+
+    if len(gaps) == 0:
+        print("Not enough records")
+        return
+    lengths = sorted(gap[0] for gap in gaps)
+    def percentile(fraction):
+        return lengths[min(len(lengths) - 1, int(round(fraction * (len(lengths) - 1))))]
+    print("{} gaps, p50 {:.0f} ms, p95 {:.0f} ms, p99 {:.0f} ms, max {:.0f} ms".format(
+        len(lengths), percentile(0.50), percentile(0.95), percentile(0.99), lengths[-1]))
+    print("")
+    print("{:>14}  {:<34}{}".format("gap ms", "after", "next record"))
+    for length, before, after in sorted(gaps, key = lambda gap: -gap[0])[:top]:
+        print("{:>14.0f}  {:<34}{}".format(length, str(before.time), after.message.split("\n")[0][:60]))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Reports on the display board log")
+    parser.add_argument("report", choices = ["rates", "exceptions", "gaps", "index"],
+                        help = "what to report, index only updates the index")
+    parser.add_argument("--log", default = "log.txt", help = "log file to read")
+    parser.add_argument("--since", default = None, help = "ISO time, like 2024-09-05 or \"2024-09-05 14:00+00:00\"")
+    parser.add_argument("--until", default = None, help = "ISO time, records before this. rates and exceptions work in whole hours")
+    parser.add_argument("--top", type = int, default = 20, help = "rows to show")
+    parser.add_argument("--kind", default = None,
+                        choices = [KIND_API, KIND_EXCEPTION, KIND_HTTP_ERROR, KIND_FETCH, KIND_START, KIND_OTHER],
+                        help = "gaps only, records to measure between, default all")
+    parser.add_argument("--rebuild", action = "store_true", help = "ignore the stored index and parse the whole log")
+    args = parser.parse_args()
+
+    index = LogIndex(args.log)
+    parsed = index.update(rebuild = args.rebuild)
+    print("Parsed {} new bytes of {}".format(parsed, args.log))
+    print("")
+
+    since = _hourKey(args.since)
+    until = _hourKey(args.until)
+    if args.report == "rates":
+        reportRates(index, since, until, args.top)
+    elif args.report == "exceptions":
+        reportExceptions(index, since, until, args.top)
+    elif args.report == "gaps":
+        reportGaps(index, args.since, args.until, args.top, args.kind)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import atexit
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+"""
+Log file writer that never does file I/O on the caller's thread.
+
+log() just puts the line on a queue. A background thread collects whatever is
+queued, writes it in one batch and flushes, at most every flushInterval seconds,
+so the SD card sees one write now and then instead of an open/write/close per line.
+
+The log keeps the format it has always had, with optional structured fields
+on the end, so old and new lines read the same:
+    [LOG][2024-09-05 02:17:17.475569+00:00]: Calling NWS Alert API. | api=NWS
+    [ERROR][2024-09-05 02:17:53.243035+00:00]: An exception of ... | widget=widget_StockPrice
+
+Once the file passes maxBytes, or has been open longer than maxAge seconds, it is
+renamed, gzipped next to the original as log-<utc time>.txt.gz, and a new file is
+started. Only the newest `backups` compressed logs are kept.
+"""
+
+class LogWriter:
+    def __init__(self, path = "log.txt", maxBytes = 1024 * 1024, maxAge = 7 * 24 * 60 * 60, backups = 8, flushInterval = 2.0):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.maxAge = maxAge
+        self.backups = backups
+        self.flushInterval = flushInterval
+
+        self.queue = queue.SimpleQueue()
+        self.logFile = None
+        self.openedAt = 0
+        self.thread = threading.Thread(target = self._run, name = "logWriter", daemon = True)
+        self.thread.start()
+        # The writer is a daemon thread, so make sure whatever is queued still gets written on the way out
+        atexit.register(self.close)
+
+    """
+    @brief:     Queues one log entry, returns right away
+    @param:     level       "LOG", "ERROR", or anything else, goes in the first brackets
+    @param:     message     The text, can be more than one line
+    @param:     fields      Extra key=value fields, like widget, api or latencyMs
+    @retval:    None
+    """
+    def log(self, level, message, **fields):
+        self.queue.put((level, datetime.now(timezone.utc), message, fields))
+
+    # Shorthands
+    def info(self, message, **fields):
+        self.log("LOG", message, **fields)
+
+    def error(self, message, **fields):
+        self.log("ERROR", message, **fields)
+
+    # Writes out everything still queued and stops the writer thread
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+
+    @staticmethod
+    def formatEntry(level, timestamp, message, fields):
+        line = "[" + level + "][" + str(timestamp) + "]: " + message
+        if fields:
+            line += " |" + "".join(" " + key + "=" + str(value) for key, value in fields.items())
+        return line + "\n"
+
+    def _open(self):
+        self.logFile = open(self.path, "a")
+        self.openedAt = time.time()
+
+    def _run(self):
+        while True:
+            batch = []
+            stop = False
+            # Block for the first entry, then take whatever else shows up within flushInterval
+            entry = self.queue.get()
+            deadline = time.monotonic() + self.flushInterval
+            while True:
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(self.formatEntry(*entry))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self.queue.get(timeout = remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    # Opened here, not once up front, so a failed open or rotation is retried next batch
+                    if self.logFile is None or self.logFile.closed:
+                        self._open()
+                    self.logFile.write("".join(batch))
+                    self.logFile.flush()
+                    self._rotateIfNeeded()
+                except Exception:
+                    pass    # nowhere left to report it, this thread and the display must keep running
+            if stop:
+                break
+        if self.logFile is not None:
+            self.logFile.close()
+
+    def _rotateIfNeeded(self):
+        tooBig = self.logFile.tell() >= self.maxBytes
+        tooOld = time.time() - self.openedAt >= self.maxAge
+        if not (tooBig or tooOld):
+            return
+
+        self.logFile.close()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        baseName, extension = os.path.splitext(os.path.basename(self.path))
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+        rotatedPath = os.path.join(directory, baseName + "-" + stamp + extension)
+        try:
+            os.replace(self.path, rotatedPath)
+        finally:
+            # Even if the rename failed, keep logging, into the same file then
+            self._open()
+
+        with open(rotatedPath, "rb") as source, gzip.open(rotatedPath + ".gz", "wb") as compressed:
+            shutil.copyfileobj(source, compressed)
+        os.remove(rotatedPath)
+
+        # Drop the oldest compressed logs, the timestamps in the names sort oldest first
+        old = sorted(name for name in os.listdir(directory)
+                     if name.startswith(baseName + "-") and name.endswith(extension + ".gz"))
+        for name in old[:-self.backups] if self.backups > 0 else old:
+            os.remove(os.path.join(directory, name))
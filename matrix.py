@@ -1,7 +1,348 @@
-import board
-import neopixel
-from font import font, symbols
+from glyphAtlas import GlyphAtlas
+from drivers import openNeoPixel
+from powerLimiter import PowerLimiter
 import time
+from contextlib import contextmanager
+
+# numpy is optional, it is only needed for the numpy buffer backend
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FrameClock:
+    """
+    Paces animation frames against absolute deadlines on the monotonic clock.
+
+    Sleeping for the frame time after every frame makes the real frame time the sleep
+    plus however long rendering and show() took, so longer strings scroll slower.
+    Instead frame n is due at startTime + (n * frameTime). tick() only sleeps for
+    whatever is left until the next deadline, and if rendering fell a whole frame or
+    more behind, the missed frames are skipped so the animation stays on schedule.
+
+    Usage:
+        clock.start(speed)
+        while position >= end:
+            draw(position)
+            position -= clock.tick(framesLeft = position - end)
+    """
+    STATS_WINDOW = 240      # how many frame intervals to keep for the fps and jitter figures
+
+    def __init__(self):
+        self.frameTime = 0
+        self.startTime = 0
+        self.frameIndex = 0
+        self.lastTick = 0
+        self.intervals = []
+
+        # Running totals across every animation, handy for diagnostics
+        self.totalFrames = 0
+        self.totalDropped = 0
+
+    """
+    @brief:     Starts timing a new animation, the first frame is due right away
+    @param:     frameTime   Time in seconds from the start of one frame to the start of the next
+    @retval:    None
+    """
+    def start(self, frameTime):
+        self.frameTime = frameTime
+        self.startTime = time.monotonic()
+        self.lastTick = self.startTime
+        self.frameIndex = 0
+        self.intervals = []
+
+    """
+    @brief:     Call after each frame is drawn, waits until the next frame is due
+    @note:      Never skips the final frame, so an animation always lands on its last position
+    @param:     framesLeft  Default None, how many frames the animation has left after this one.
+                                None means there is no limit on skipping
+    @retval:    int         How many frames to advance, 1 normally, more if frames were dropped
+    """
+    def tick(self, framesLeft = None):
+        self.frameIndex += 1
+        self.totalFrames += 1
+        advance = 1
+        now = time.monotonic()
+        deadline = self.startTime + (self.frameIndex * self.frameTime)
+
+        # A whole frame or more behind schedule, skip ahead instead of playing catch up
+        if self.frameTime > 0 and now >= deadline + self.frameTime:
+            behind = int((now - deadline) / self.frameTime)
+            if framesLeft != None:
+                behind = max(0, min(behind, framesLeft - 1))
+            self.frameIndex += behind
+            self.totalDropped += behind
+            advance += behind
+            deadline = self.startTime + (self.frameIndex * self.frameTime)
+
+        if deadline > now:
+            time.sleep(deadline - now)
+
+        now = time.monotonic()
+        self.intervals.append(now - self.lastTick)
+        if len(self.intervals) > self.STATS_WINDOW:
+            del self.intervals[0]
+        self.lastTick = now
+        return advance
+
+    # Frames per second actually achieved over the recent frames
+    def fps(self):
+        if len(self.intervals) == 0 or sum(self.intervals) == 0:
+            return 0.0
+        return len(self.intervals) / sum(self.intervals)
+
+    # Standard deviation of the frame intervals in seconds
+    def jitter(self):
+        if len(self.intervals) < 2:
+            return 0.0
+        mean = sum(self.intervals) / len(self.intervals)
+        return (sum((x - mean) ** 2 for x in self.intervals) / len(self.intervals)) ** 0.5
+
+    # Everything at once, for logging
+    def stats(self):
+        return {
+            "targetFps": (1.0 / self.frameTime) if self.frameTime > 0 else 0.0,
+            "fps": self.fps(),
+            "jitter": self.jitter(),
+            "frames": self.totalFrames,
+            "dropped": self.totalDropped
+        }
+
+
+class ColorPipeline:
+    """
+    Turns the colors that get drawn into the values that go out to the LEDs.
+
+    Everything is done through 256 entry lookup tables built ahead of time, so no float
+    math happens per pixel:
+        table               gamma correction and the global brightness, applied to every
+                                pixel when a frame is sent (see StripFrame.show)
+        dimTable(mod)       the brightnessMod dimming used when drawing, like the rain
+                                animation's 0.1/0.4/0.8 levels, one table per level
+
+    gamma defaults to 1.0, which is linear and gives exactly what the neopixel library's own
+    brightness did, value * brightness rounded down. A gamma above 1.0 makes mid values look
+    right at high brightness, but it pushes dim values down before the brightness scale, so
+    at the board's 0.045 and 0.005 brightness most of them would round to off. Only turn it
+    on with setGamma when the brightness is high.
+
+    limit is an extra brightness factor set by the PowerLimiter, see powerLimiter.py.
+    """
+    MAX_DIM_TABLES = 64     # brightnessMod can be anything, so dont let the cache grow forever
+
+    def __init__(self, brightness = 1.0, gamma = 1.0):
+        self.brightness = brightness
+        self.gamma = gamma
+        self.limit = 1.0
+        self.dimTables = {}
+        self.table = []
+        self.build()
+
+    def build(self):
+        scale = self.brightness * self.limit
+        if self.gamma == 1.0:
+            self.table = [int(value * scale) for value in range(256)]
+        else:
+            self.table = [int(round(255 * scale * ((value / 255.0) ** self.gamma))) for value in range(256)]
+
+    def setBrightness(self, brightness):
+        self.brightness = brightness
+        self.build()
+
+    def setGamma(self, gamma):
+        self.gamma = gamma
+        self.build()
+
+    def setLimit(self, limit):
+        self.limit = limit
+        self.build()
+
+    # The table for one brightnessMod, dimTable(mod)[value] == int(value * mod)
+    def dimTable(self, brightnessMod):
+        dim = self.dimTables.get(brightnessMod)
+        if dim is None:
+            if len(self.dimTables) >= self.MAX_DIM_TABLES:
+                self.dimTables.clear()
+            dim = [int(value * brightnessMod) for value in range(256)]
+            self.dimTables[brightnessMod] = dim
+        return dim
+
+    # Runs a list of colors through the output table
+    def apply(self, pixels):
+        table = self.table
+        return [(table[r], table[g], table[b]) for r, g, b in pixels]
+
+
+class StripFrame:
+    """
+    Sits between LEDMatrix and the driver, and looks just like a driver to everyone using it.
+
+    Drawing only changes self.pixels. On show() the pixels are compared with a shadow copy
+    of what was last sent to the LEDs, one row at a time, and only rows that changed are
+    copied into the driver. If nothing changed since the last show(), the driver is not
+    touched at all, so redrawing the same clock string over and over costs almost nothing.
+
+    hold() and release() batch frames, every show() in between is put off until the last
+    release(), which then sends everything as one frame. See LEDMatrix.frameBatch.
+
+    onFrame, when set, is called at the start of every frame boundary, whether or not
+    anything changed. The widget scheduler uses it to cut widgets off between frames.
+
+    compositor, when set, blends extra layers over and under the pixels on the way out,
+    see compositor.py. self.pixels always stays just what was drawn.
+
+    showTimes, when set, is a Histogram that gets the time of every frame that was sent,
+    see metrics.py.
+
+    powerLimiter, when set, estimates the current of every frame before it goes out and
+    scales it down through the pipeline when it would go over budget, see powerLimiter.py.
+    rowLevels keeps the summed output of every row, so only changed rows get summed.
+
+    Rows are run through the ColorPipeline as they are sent, which takes care of gamma and
+    brightness, so the driver itself is always left at full brightness.
+    """
+    def __init__(self, driver, rowLength, pipeline):
+        self.driver = driver
+        self.pipeline = pipeline
+        self.driver.brightness = 1.0
+        self.n = len(driver)
+        self.pixels = [(0, 0, 0)] * self.n
+        self.shadow = [None] * self.n       # unknown to start with, so the first show sends everything
+        self.rowRanges = [(start, min(start + rowLength, self.n)) for start in range(0, self.n, rowLength)]
+
+        self.dirty = True           # anything written since the last show
+        self.forceShow = True       # something besides the pixels changed, like brightness
+        self.holdCount = 0
+        self.pendingShow = False
+        self.onFrame = None
+        self.compositor = None
+        self.showTimes = None
+        self.powerLimiter = None
+        self.rowLevels = [0] * len(self.rowRanges)
+
+        # Called once, right after the very first frame goes out, for the startup timeline
+        self.onFirstShow = None
+
+        # Counters, for diagnostics
+        self.framesShown = 0
+        self.framesSkipped = 0
+        self.rowsSent = 0
+        self.lastShowCall = 0       # monotonic time of the last show(), held frames aside
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, color):
+        self.pixels[index] = color
+        self.dirty = True
+
+    def __getitem__(self, index):
+        return self.pixels[index]
+
+    def fill(self, color):
+        self.pixels = [tuple(color)] * self.n
+        self.dirty = True
+
+    @property
+    def brightness(self):
+        return self.pipeline.brightness
+
+    @brightness.setter
+    def brightness(self, brightness):
+        if brightness != self.pipeline.brightness:
+            self.pipeline.setBrightness(brightness)
+            self.resend()
+
+    # Every row has to go out again on the next show, for when the output tables change
+    def resend(self):
+        self.shadow = [None] * self.n
+        self.forceShow = True
+
+    def hold(self):
+        self.holdCount += 1
+
+    def release(self):
+        self.holdCount = max(0, self.holdCount - 1)
+        if self.holdCount == 0 and self.pendingShow:
+            self.pendingShow = False
+            self.show()
+
+    """
+    @brief:     Sends whatever changed to the driver and shows it
+    @note:      Skipped entirely when nothing changed, and put off while frames are held
+    @retval:    boolean     True if the driver was actually shown
+    """
+    def show(self):
+        if self.holdCount > 0:
+            self.pendingShow = True
+            return False
+        self.lastShowCall = time.monotonic()
+        if self.onFrame is not None:
+            self.onFrame()
+        compositor = self.compositor
+        limiter = self.powerLimiter
+        limiting = limiter is not None and limiter.scale < 1.0     # still easing back up, keep sending frames
+        if not self.dirty and not self.forceShow and not (compositor is not None and compositor.dirty) and not limiting:
+            self.framesSkipped += 1
+            return False
+
+        showTimes = self.showTimes
+        if showTimes is not None:
+            showStart = time.perf_counter()
+
+        pixels = self.pixels
+        if compositor is not None:
+            if compositor.active():
+                pixels = compositor.compositeStrip(pixels)
+            else:
+                compositor.dirty = False
+        shadow = self.shadow
+        apply = self.pipeline.apply
+        changed = False
+        pending = []        # (start, end, output colors), rows held back for the power limiter
+        for rowIndex, (start, end) in enumerate(self.rowRanges):
+            if pixels[start:end] != shadow[start:end]:
+                rowPixels = pixels[start:end]
+                rowOut = apply(rowPixels)
+                if limiter is not None:
+                    self.rowLevels[rowIndex] = limiter.level(rowOut)
+                    pending.append((start, end, rowOut))
+                else:
+                    self.driver[start:end] = rowOut
+                shadow[start:end] = rowPixels
+                self.rowsSent += 1
+                changed = True
+        self.dirty = False
+
+        if limiter is not None and (changed or limiting):
+            scale = limiter.update(sum(self.rowLevels))
+            if scale != self.pipeline.limit:
+                # The whole frame goes out again at the new scale, not just the rows that changed
+                self.pipeline.setLimit(scale)
+                apply = self.pipeline.apply
+                pending = []
+                for rowIndex, (start, end) in enumerate(self.rowRanges):
+                    rowOut = apply(pixels[start:end])
+                    self.rowLevels[rowIndex] = limiter.level(rowOut)
+                    pending.append((start, end, rowOut))
+                changed = True
+            for start, end, rowOut in pending:
+                self.driver[start:end] = rowOut
+
+        if changed or self.forceShow:
+            self.forceShow = False
+            self.driver.show()
+            self.framesShown += 1
+            if showTimes is not None:
+                showTimes.observe(time.perf_counter() - showStart)
+            if self.framesShown == 1 and self.onFirstShow is not None:
+                self.onFirstShow()
+            return True
+        else:
+            self.framesSkipped += 1
+            return False
+
 
 class LEDMatrix:
     # these color codes are used to print text, used as escape characters
@@ -45,22 +386,70 @@ class LEDMatrix:
         the instantiation of this class, that way its not always generating, taking up
         memory. To prevent unintended behavior, all buffer functions will check to see
         if the buffer is enabled, and wont do anything but return -1 if not.
+
+        The buffer can be stored two ways, picked with bufferBackend:
+        "list"  - A list of lists of (r, g, b, brightnessMod) tuples, needs nothing extra
+        "numpy" - An HxWx3 uint8 color array plus an HxW float brightness plane. Clears, fills
+                  and window copies become array slices instead of python loops. Needs numpy.
+
+    The LEDs themselves are driven by self.driver, see drivers.py. By default that is the
+    real neopixel strip on dataPin, but any driver can be passed in, like the SimulatorDriver
+    to run everything without a Pi. Drawing goes through self.matrix, a StripFrame that works
+    just like the driver but only sends what changed, and skips show() when nothing did.
     """
-    def __init__(self, dataPin, rows, cols, bufferEnabled = True):
+    def __init__(self, dataPin, rows, cols, bufferEnabled = True, bufferBackend = "list", driver = None):
         self.dataPin = dataPin      # physical pin on the GPIO to talk to the LEDs, typ. D18
         self.rows = rows
         self.cols = cols
         self.nPix = rows * cols
-        self.order = neopixel.GRB   # function of the neopixel library
+        self.order = "GRB"          # byte order constant of the neopixel library
         self.brightness = 0.045     # default brightness is 0.045
 
         self.speed = 0.03           # time in seconds between animation frames
         self.delay = 0.5            # time in seconds to hold after finishing an animation
-
-        self.matrix = neopixel.NeoPixel(
-            self.dataPin, self.nPix, brightness = self.brightness, auto_write = False,
-        pixel_order = self.order
-        )
+        self.frameClock = FrameClock()  # paces every string animation, see FrameClock
+
+        # Brightness is handled by the color pipeline, so the strip itself always runs at full
+        if driver is None:
+            driver = openNeoPixel(self.dataPin, self.nPix, 1.0, self.order)
+        self.driver = driver
+        self.colorPipeline = ColorPipeline(self.brightness)
+        self.matrix = StripFrame(self.driver, self.cols, self.colorPipeline)
+
+        # The serpentine math only depends on the size of the matrix, so work it out once here.
+        # pixelIndex[(row * cols) + col] is the position of that pixel along the strip
+        self.pixelIndex = [self._serpentinePosition(row, col) for row in range(self.rows) for col in range(self.cols)]
+        if hasattr(self.driver, "setLayout"):
+            self.driver.setLayout(self.rows, self.cols, self.pixelIndex)
+
+        # The inverse of pixelIndex, stripGather[position] is the (row * cols) + col that lands there.
+        # With numpy a whole row-major frame goes to strip order in one gather: frame[stripGather]
+        self.stripGather = [0] * self.nPix
+        for pixel, position in enumerate(self.pixelIndex):
+            self.stripGather[position] = pixel
+        if np is not None:
+            self.stripGather = np.array(self.stripGather, dtype=np.intp)
+
+        # Every row of the matrix is one contiguous run of the strip, some of them running backwards.
+        # rowSpans[row] = (first strip position of the row, True if the row runs right to left)
+        self.rowSpans = []
+        for row in range(self.rows):
+            rowPositions = self.pixelIndex[row * self.cols:(row + 1) * self.cols]
+            self.rowSpans.append((min(rowPositions), rowPositions[0] != min(rowPositions)))
+
+        # Text gets rendered once into a strip and reused, see glyphAtlas.py
+        TEXT_CACHE_SIZE = 32        # how many rendered strings to hang on to
+        self.textCacheSize = TEXT_CACHE_SIZE
+        self.textCache = {}
+        self.textCacheHits = 0
+        self.textCacheMisses = 0
+        self.atlas = GlyphAtlas(self.escapeColors)
+
+        if bufferBackend not in ("list", "numpy"):
+            raise ValueError("bufferBackend must be \"list\" or \"numpy\", got " + repr(bufferBackend))
+        if bufferBackend == "numpy" and np is None:
+            raise ImportError("The numpy buffer backend needs numpy installed")
+        self.bufferBackend = bufferBackend
 
         if bufferEnabled:
             self.bufferEnabled = True
@@ -68,8 +457,12 @@ class LEDMatrix:
             BUFFER_SCALE_COL = 2
             self.bufferRows = (self.rows * BUFFER_SCALE_ROW) + 2    # add two to maintain a 1 element border around the buffer
             self.bufferCols = (self.cols * BUFFER_SCALE_COL) + 2
-            # Buffer format is (r, g, b, brightnessMod) where brightness mod can dim the entire color
-            self.buffer = [[(0, 0, 0, 0) for _ in range(self.bufferRows)] for _ in range(self.bufferCols)]
+            # List buffer format is (r, g, b, brightnessMod) where brightness mod can dim the entire color
+            # The numpy buffer splits that into bufferColor[row, col] = (r, g, b) and bufferBrightness[row, col]
+            self.buffer = []
+            self.bufferColor = None
+            self.bufferBrightness = None
+            self.clearBuffer()
         else:
             self.bufferEnabled = False
             self.bufferRows = -1
@@ -80,12 +473,36 @@ class LEDMatrix:
     def setBrightness(self, brightness):
         self.brightness = brightness
         self.matrix.brightness = self.brightness
+
+    """
+    @brief:     Limits the current the LEDs can draw, see powerLimiter.py
+    @note:      Frames that would go over are dimmed on the way out, what is drawn is not touched
+    @param:     budgetAmps  Most amps the supply can give the LEDs, None turns the limit off
+    @param:     volts       Default 5.0, supply voltage, for the watts figures
+    @retval:    PowerLimiter    The limiter, or None when turned off
+    """
+    def setPowerBudget(self, budgetAmps, volts = 5.0):
+        limiter = PowerLimiter(budgetAmps, self.nPix, volts) if budgetAmps is not None else None
+        self.matrix.powerLimiter = limiter
+        self.colorPipeline.setLimit(1.0)
+        self.matrix.resend()
+        return limiter
+
+    # Gamma correction applied on the way out, 1.0 is linear
+    def setGamma(self, gamma):
+        self.colorPipeline.setGamma(gamma)
+        self.matrix.resend()
     
     # Getter and setter for speed
-    # Time between animation frames in seconds
+    # Time between animation frames in seconds, measured from the start of one frame to the start
+    # of the next. Rendering time is not added on top, frames get dropped instead if it runs long
     def setSpeed(self, speed):
         self.speed = speed
 
+    # Same as setSpeed, but in frames per second
+    def setFps(self, fps):
+        self.speed = 1.0 / fps
+
     # Getter and setter for delay
     # Hold time after the animation in seconds
     def setDelay(self, delay):
@@ -96,6 +513,42 @@ class LEDMatrix:
         self.matrix.fill((0,0,0))
         self.matrix.show()
 
+    # Sends the current frame to the LEDs, if anything in it changed
+    def commitFrame(self):
+        return self.matrix.show()
+
+    """
+    @brief:     Collapses every show() inside the with block into one frame at the end
+    @note:      Handy for code that shows after every pixel, batches can be nested
+    @example:   with mat.frameBatch():
+                    for col in range(mat.cols):
+                        mat.matrixDrawPixel(0, col, color)
+                        mat.matrix.show()       # nothing is sent until the block ends
+    """
+    @contextmanager
+    def frameBatch(self):
+        self.matrix.hold()
+        try:
+            yield self.matrix
+        finally:
+            self.matrix.release()
+
+
+    """
+    @brief:     Converts a row/col on the matrix to its position along the strip, assuming a serpentine design
+    @note:      Only used to build self.pixelIndex, drawing functions should use the table instead
+    @param:     row         The row from zero to self.rows
+    @param:     col         The col of the pixel from zero to self.cols
+    @retval:    int         Position of the pixel along the strip
+    """
+    def _serpentinePosition(self, row, col):
+        # For even rows, the  math is simple
+        if (row % 2 == 0):
+            return (row * self.cols) + (col)
+        else:
+            # odd rows need to have nCol - (2 * col) added
+            return (row * self.cols) + (col - 1)  + (self.cols - (2 * col))
+
 
     """
     @brief:     Draws a pixel at any location on the matrix, assuming a serptentine design
@@ -109,78 +562,115 @@ class LEDMatrix:
     def matrixDrawPixel(self, row, col, color, brightnessMod = 1.0):
         # Some functions require drawing pixels outside the visible area, so make sure
         # we dont try to actually color an area thats off the matrix
-        if (row <= (self.rows-1) and row >= 0 and col <= (self.cols-1) and col >= 0):
-            # For even rows, the  math is simple
-            if (row % 2 == 0):
-                position = (row * self.cols) + (col)
-            else:
-                # odd rows need to have nCol - (2 * col) added
-                position = (row * self.cols) + (col - 1)  + (self.cols - (2 * col))
-
+        if (0 <= row < self.rows and 0 <= col < self.cols):
             # We already know this position is within the matrix, so color it after applying the brightness modifier
-            drawColor = tuple(int(x * brightnessMod) for x in color)
-            self.matrix[position] = drawColor
+            if brightnessMod != 1.0:
+                dim = self.colorPipeline.dimTable(brightnessMod)
+                color = (dim[color[0]], dim[color[1]], dim[color[2]])
+            self.matrix[self.pixelIndex[(row * self.cols) + col]] = color
             return True
         else:
             return False
 
 
     """
-    @brief:     Uses drawPixel to render a string of characters on the matrix
-    @note:      Drawing to buffer will not update the matrix, use bufferWindowToMatrix to see changes
+    @brief:     Draws many pixels at once, same as calling matrixDrawPixel for each of them
+    @note:      Pixels outside of the matrix are skipped, just like matrixDrawPixel
+    @note:      Does not update the matrix, call matrix.show() after this
+    @param:     pixels      Iterable of (row, col, color) triples, color as (RED, GRN, BLU)
+    @param:     brightnessMod   Default 1.0, dims every pixel in the batch
+    @retval:    int         The number of pixels that landed on the matrix
+    """
+    def matrixDrawPixels(self, pixels, brightnessMod = 1.0):
+        # Pull everything into locals, this loop is the hot path for text and buffer copies
+        rows = self.rows
+        cols = self.cols
+        pixelIndex = self.pixelIndex
+        strip = self.matrix
+        dim = self.colorPipeline.dimTable(brightnessMod) if brightnessMod != 1.0 else None
+        drawn = 0
+
+        for row, col, color in pixels:
+            if (0 <= row < rows and 0 <= col < cols):
+                if dim is not None:
+                    color = (dim[color[0]], dim[color[1]], dim[color[2]])
+                strip[pixelIndex[(row * cols) + col]] = color
+                drawn += 1
+        return drawn
+
+
+    """
+    @brief:     Writes an entire frame to the matrix at once
+    @note:      The frame is reordered into strip order with a single gather through self.stripGather
+    @note:      Does not update the matrix, call matrix.show() after this
+    @param:     frame       numpy array of shape (rows, cols, 3), or anything np.asarray can turn into one
+    @retval:    None
+    """
+    def matrixWriteFrame(self, frame):
+        frame = np.asarray(frame, dtype=np.uint8).reshape(self.nPix, 3)
+        self.matrix[0:self.nPix] = list(map(tuple, frame[self.stripGather].tolist()))
+
+
+    """
+    @brief:     Gets the rendered TextStrip for a string, rendering it only the first time it is seen
+    @note:      Scrolling the same string reuses one render for every frame
+    @param:     string      The string to be rendered, escape codes included
+    @param:     color       The color as (RED,GRN,BLU)
+    @retval:    TextStrip   See glyphAtlas.py
+    """
+    def getTextStrip(self, string, color):
+        key = (string, tuple(color))
+        strip = self.textCache.get(key)
+        if strip is None:
+            self.textCacheMisses += 1
+            strip = self.atlas.render(string, color)
+            # Oldest entries go first once the cache is full, dicts keep insertion order
+            if len(self.textCache) >= self.textCacheSize:
+                del self.textCache[next(iter(self.textCache))]
+            self.textCache[key] = strip
+        else:
+            self.textCacheHits += 1
+        return strip
+
+
+    """
+    @brief:     Copies a window of a rendered TextStrip onto the whole matrix
+    @note:      Every pixel of the matrix is written, anything not covered by the strip becomes black
+    @note:      Each matrix row is a single slice write to the strip, no per pixel work
+    @note:      Does not update the matrix, call matrix.show() after this
+    @param:     strip       TextStrip from getTextStrip
+    @param:     startCol    The column of the matrix where the strip starts, can be negative
+    @param:     startRow    The row of the matrix where the strip starts, can be negative
+    @retval:    None
+    """
+    def matrixDrawStrip(self, strip, startCol = 0, startRow = 0):
+        for row in range(self.rows):
+            pixels = strip.rowSlice(row - startRow, -startCol, self.cols)
+            position, backwards = self.rowSpans[row]
+            if backwards:
+                pixels.reverse()
+            self.matrix[position:position + self.cols] = pixels
+
+
+    """
+    @brief:     Renders a string of characters on the matrix
+    @note:      The string is rendered once and cached, so calling this every frame of a scroll is cheap
     @param:     string      The string to be rendered on the display
     @param:     color       The color as (RED,GRN,BLU)
     @param:     startCol    The column to start the string at
     @param:     startRow    Default 0, the row to print the text on
-    @param:     show        Default True, whether or not to update the matrix at the end
-    @param:     toBuffer    Default False, whether to draw to the physical matrix or its display buffer
+    @param:     show        Default True, clear the matrix behind the text and update it at the end.
+                                When False only the lit pixels are drawn, over whatever is already there
     @retval:    None
     """
     def stringPrint(self, string, color, startCol = 0, startRow = 0, show = True):
-        # These are shadows of the params, because they need to change
-        drawCol = startCol
-        drawColor = color
+        strip = self.getTextStrip(string, color)
 
         if show == True:
-            self.matrix.fill((0,0,0))
-
-        # We will iterate through each character of the string
-        index = 0
-        while index <= len(string) - 1:
-            char = string[index]
-            
-            # Do we need to process an escape character?
-            if char == '\\':
-                nextChar = string[index + 1]
-                if nextChar.isnumeric():
-                    # Pick a symbol from the symbol dictionary
-                    drawData = symbols[int(nextChar)]
-                    for row in range(7):
-                        for col in range(7):
-                            if (drawData[row][col] == 1):
-                                self.matrixDrawPixel(startRow + row, drawCol + col, drawColor)
-                    drawCol += 7
-                    None
-
-                elif nextChar in self.escapeColors:  # here we know if we need to change the color
-                    drawColor = self.escapeColors[nextChar]
-
-                index += 1  # we need to advance past the color char, so add one to index
-
-            else:   # Not an escape char, so just draw the character
-                # The character data is a 7x7 matrix of binary, 
-                # telling which pixels need to be lit to make the character
-                charData = font[char]
-                for row in range(7):
-                    for col in range(7):
-                        if (charData[row][col] == 1):
-                            self.matrixDrawPixel(startRow + row, drawCol + col, drawColor)
-                drawCol += 7
-
-            index += 1
-        
-        if show == True:
+            self.matrixDrawStrip(strip, startCol, startRow)
             self.matrix.show()
+        else:
+            self.matrixDrawPixels((startRow + row, startCol + col, pixelColor) for row, col, pixelColor in strip.litPixels)
 
 
     """
@@ -203,15 +693,17 @@ class LEDMatrix:
             delay = self.delay
 
         col = startCol
+        # Measure what will actually be drawn, normalizing can change the length (like ... for an ellipsis)
+        string = self.atlas.normalize(string)
 
         # we need the amount of characters to draw, subtracting the escape characters
         lenPix = (len(string) * 7) - (string.count("\\") * lenModifier)  
 
         # Essentially we just move the startCol leftwards, until the entire string has scrolled across the matrix
+        self.frameClock.start(speed)
         while col >= (-1 * lenPix):
             self.stringPrint(string, color, col, startRow)
-            time.sleep(speed)
-            col -= 1
+            col -= self.frameClock.tick(framesLeft = col + lenPix)
         time.sleep(delay)
 
 
@@ -236,10 +728,10 @@ class LEDMatrix:
         # move the string up, row by row, until we get to endRow (defualt zero)
         # but only if endRow is between 0 and 6 inclusive
         if endRow <= 6 and endRow >= 0:
+            self.frameClock.start(speed)
             while row >= endRow:
                 self.stringPrint(string, color, startCol, row)
-                row -= 1
-                time.sleep(speed)
+                row -= self.frameClock.tick(framesLeft = row - endRow)
             time.sleep(delay)
     
 
@@ -260,10 +752,10 @@ class LEDMatrix:
         if delay == None:
             delay = self.delay
 
+        self.frameClock.start(speed)
         while startRow >= -7:
             self.stringPrint(string, color, startCol, startRow)
-            startRow -= 1
-            time.sleep(speed)
+            startRow -= self.frameClock.tick(framesLeft = startRow + 7)
         time.sleep(delay)
 
 
@@ -317,6 +809,24 @@ class LEDMatrix:
         time.sleep(delay)
 
 
+    """
+    @brief:     How long stringEnterBottomExitLeft takes to show a string
+    @note:      Takes the same parameters, so the answer matches the call it is for
+    @retval:    float       Seconds, not counting frames that run late
+    """
+    def timeEnterBottomExitLeft(self, string, speed = None, delay = None, displayTime = 1, lenModifier = 10):
+        if speed == None:
+            speed = self.speed
+        if delay == None:
+            delay = self.delay
+        string = self.atlas.normalize(string)
+        lenPix = (len(string) * 7) - (string.count("\\") * lenModifier)
+
+        # 7 frames to come up from the bottom, one per column to scroll off, and three delays
+        frames = 7 + lenPix + 1
+        return (frames * speed) + displayTime + (3 * delay)
+
+
     """
     @brief:     Scrolls a string left, holds, then scrolls left until its off screen
     @param:     string      The string to be rendered on the display
@@ -336,20 +846,21 @@ class LEDMatrix:
             delay = self.delay
         if startCol == None:
             startCol = self.cols
+        string = self.atlas.normalize(string)
         
         lenPix = (len(string) * 7) - (string.count("\\") * 14)
 
         # start from the right, scroll in, and stop at column 0
+        self.frameClock.start(speed)
         while startCol >= 0:
             self.stringPrint(string, color, startCol, startRow)
-            startCol -= 1
-            time.sleep(speed)
+            startCol -= self.frameClock.tick(framesLeft = startCol)
         time.sleep(displayTime)
         # now scroll until the string is off screen
+        self.frameClock.start(speed)
         while (startCol >= (-1 * lenPix)):
             self.stringPrint(string, color, startCol, startRow)
-            startCol -= 1
-            time.sleep(speed)         
+            startCol -= self.frameClock.tick(framesLeft = startCol + lenPix)
 
         time.sleep(delay)
 
@@ -375,7 +886,11 @@ class LEDMatrix:
         if self.bufferEnabled:
             if (row <= (self.bufferRows-1) and row >= 0 and col <= (self.bufferCols-1) and col >= 0):
                 #print(f"Write to Buffer[{row}][{col}]")
-                self.buffer[row][col] = (color + (brightnessMod,))
+                if self.bufferBackend == "numpy":
+                    self.bufferColor[row, col] = color
+                    self.bufferBrightness[row, col] = brightnessMod
+                else:
+                    self.buffer[row][col] = (tuple(color) + (brightnessMod,))
                 return True
             else:
                 return False
@@ -385,14 +900,27 @@ class LEDMatrix:
     # clears out the buffer
     def clearBuffer(self):
         if (self.bufferEnabled):
-            self.buffer = [[(0, 0, 0, 0) for _ in range(self.bufferCols)] for _ in range(self.bufferRows)]
+            if self.bufferBackend == "numpy":
+                # Reuse the arrays once they exist, zeroing them is much cheaper than reallocating
+                if self.bufferColor is None:
+                    self.bufferColor = np.zeros((self.bufferRows, self.bufferCols, 3), dtype=np.uint8)
+                    self.bufferBrightness = np.zeros((self.bufferRows, self.bufferCols), dtype=np.float32)
+                else:
+                    self.bufferColor.fill(0)
+                    self.bufferBrightness.fill(0)
+            else:
+                self.buffer = [[(0, 0, 0, 0) for _ in range(self.bufferCols)] for _ in range(self.bufferRows)]
         else:
             return -1
     
     # fills the buffer with one color
     def fillBuffer(self, color, brightnessMod = 1.0):
         if (self.bufferEnabled):
-            self.buffer = [[(color + (brightnessMod,)) for _ in range(self.bufferCols)] for _ in range(self.bufferRows)]
+            if self.bufferBackend == "numpy":
+                self.bufferColor[:, :] = color
+                self.bufferBrightness.fill(brightnessMod)
+            else:
+                self.buffer = [[(tuple(color) + (brightnessMod,)) for _ in range(self.bufferCols)] for _ in range(self.bufferRows)]
         else:
             return -1
 
@@ -401,15 +929,20 @@ class LEDMatrix:
         if self.bufferEnabled:
             outputFile = open("buffer.txt", "a")
 
-            rows = len(self.buffer)
-            cols = len(self.buffer[0]) if rows > 0 else 0
+            if self.bufferBackend == "numpy":
+                rows, cols = self.bufferBrightness.shape
+                lit = self.bufferColor.any(axis=2) | (self.bufferBrightness != 0)
+            else:
+                rows = len(self.buffer)
+                cols = len(self.buffer[0]) if rows > 0 else 0
+                lit = [[pixel != (0, 0, 0, 0) for pixel in bufferRow] for bufferRow in self.buffer]
             outputFile.write("\n\nBuffer has " + str(rows) + " rows and " + str(cols) + " cols\n")
 
             for row in range(self.bufferRows):
                 disp = ""
                 for col in range(self.bufferCols):
                     #print(self.buffer[row])
-                    if self.buffer[row][col] != (0, 0, 0, 0):
+                    if lit[row][col]:
                         disp += "X"
                     else:
                         disp += "-"
@@ -427,14 +960,35 @@ class LEDMatrix:
             if windowSizeHW == None:
                 windowSizeHW = (self.rows, self.cols)
 
+            if self.bufferBackend == "numpy":
+                # Build the wrapped row and col indexes once, then pull the whole window out in one go
+                rowIndex = (np.arange(windowSizeHW[0]) + bufferRowCol[0] + 1) % (self.bufferRows - 2)
+                colIndex = (np.arange(windowSizeHW[1]) + bufferRowCol[1] + 1) % (self.bufferCols - 2)
+                window = self.bufferColor[rowIndex[:, None], colIndex[None, :]]
+                window = (window * self.bufferBrightness[rowIndex[:, None], colIndex[None, :], None]).astype(np.uint8)
+
+                if tuple(windowSizeHW) == (self.rows, self.cols) and tuple(matrixRowCol) == (0, 0):
+                    # The window covers the whole matrix, so it can go to the strip as a single frame
+                    self.matrixWriteFrame(window)
+                else:
+                    rowGrid, colGrid = np.indices(window.shape[0:2]).reshape(2, -1)
+                    self.matrixDrawPixels(zip((rowGrid + matrixRowCol[0]).tolist(), (colGrid + matrixRowCol[1]).tolist(),
+                                              map(tuple, window.reshape(-1, 3).tolist())))
+                self.matrix.show()
+                return
+
+            # Gather the whole window first, dimming each pixel by its own brightness modifier,
+            # then hand it to the strip in a single batch
+            pixels = []
             for col in range(windowSizeHW[1]):
-                disp = ""
+                bufferCol = (col+bufferRowCol[1] + 1) % (self.bufferCols - 2)
                 for row in range(windowSizeHW[0]):
                     #print(f"Buffer[{(row+bufferRowCol[0] + 1) % (self.bufferRows - 2)}][{(col+bufferRowCol[1] + 1) % (self.bufferCols - 2)}]")
-                    color = self.buffer[(row+bufferRowCol[0] + 1) % (self.bufferRows - 2)][(col+bufferRowCol[1] + 1) % (self.bufferCols - 2)]
-                    #color = self.buffer[(col+bufferRowCol[1] + 1) % (self.bufferCols - 2)][(row+bufferRowCol[0] + 1) % (self.bufferRows - 2)]
-                    self.matrixDrawPixel(row + matrixRowCol[0], col + matrixRowCol[1], color[0:3], brightnessMod=color[3])
-                    
+                    r, g, b, brightnessMod = self.buffer[(row+bufferRowCol[0] + 1) % (self.bufferRows - 2)][bufferCol]
+                    dim = self.colorPipeline.dimTable(brightnessMod)
+                    pixels.append((row + matrixRowCol[0], col + matrixRowCol[1], (dim[r], dim[g], dim[b])))
+            self.matrixDrawPixels(pixels)
+
             self.matrix.show()
         else:
             return -1
@@ -442,48 +996,24 @@ class LEDMatrix:
     # writes a string to the buffer using the included font
     def bufferStringPrint(self, string, color, startRow=0, startCol=0):
         if self.bufferEnabled:
-            # These are shadows of the params, because they need to change
-            drawCol = startCol
-            drawColor = color
-
-            # We will iterate through each character of the string
-            index = 0
-            while index <= len(string) - 1:
-                char = string[index]
-
-                # Do we need to process an escape character?
-                if char == '\\':
-                    nextChar = string[index + 1]
-                    if nextChar.isnumeric():
-                        # Pick a symbol from the symbol dictionary
-                        drawData = symbols[int(nextChar)]
-                        for row in range(7):
-                            for col in range(7):
-                                if (drawData[row][col] == 1):
-                                    # The modulo is to take care of wrapping, in case the string is too big for the buffer,
-                                    # though it will overwrite over itself if not used mindfully
-                                    self.buffer[(startRow + row + 1) % (self.bufferRows - 2)][(drawCol + col + 1) % (self.bufferCols - 2)] = (drawColor + (0,))
-                        drawCol += 7
-
-                    elif nextChar in self.escapeColors:  # here we know if we need to change the color
-                        drawColor = self.escapeColors[nextChar]
-
-                    index += 1  # we need to advance past the color char, so add one to index
-
-                else:   # Not an escape char, so just draw the character
-                    # The character data is a 7x7 matrix of binary, 
-                    # telling which pixels need to be lit to make the character
-                    charData = font[char]
-                    for row in range(7):
-                        for col in range(7):
-                            if (charData[row][col] == 1):
-
-                                # The row and col values have 1 added to maintain a 1 pixel border around the buffer, to make scrolling look neat
-                                # the -2 in the modulo is to make rollover account for that extra border space
-                                self.buffer[(startRow + row + 1) % (self.bufferRows - 2)][(drawCol + col + 1) % (self.bufferCols - 2)] = (drawColor + (0,))
-                    drawCol += 7
-
-                index += 1
+            strip = self.getTextStrip(string, color)
+
+            # The row and col values have 1 added to maintain a 1 pixel border around the buffer, to make scrolling look neat
+            # the -2 in the modulo is to make rollover account for that extra border space.
+            # The modulo is also there to take care of wrapping, in case the string is too big for the buffer,
+            # though it will overwrite over itself if not used mindfully
+            pixels = [((startRow + row + 1) % (self.bufferRows - 2), (startCol + col + 1) % (self.bufferCols - 2), pixelColor)
+                      for row, col, pixelColor in strip.litPixels]
+
+            # Text is drawn at full brightness, so it shows up when copied with bufferWindowToMatrix
+            if self.bufferBackend == "numpy":
+                if pixels:
+                    rowIndex, colIndex, colors = zip(*pixels)
+                    self.bufferColor[list(rowIndex), list(colIndex)] = colors
+                    self.bufferBrightness[list(rowIndex), list(colIndex)] = 1.0
+            else:
+                for row, col, pixelColor in pixels:
+                    self.buffer[row][col] = (tuple(pixelColor) + (1.0,))
         else:
             return -1
     
@@ -1,61 +1,147 @@
+# First, so the startup timeline includes every other import, see startupTimeline.py
+from startupTimeline import startup
+import atexit
+import sys
 import time
-import board
-import neopixel
-from font import font
-from datetime import datetime, timezone
-from time import strftime
-import requests, json
-import yfinance
-from matrix import LEDMatrix
+from datetime import datetime
+from matrix import LEDMatrix, np
 from simpleTime import Time
+from displaySchedule import DisplaySchedule, Phase
 from widgets import Widget
+from drivers import SimulatorDriver
+from renderProcess import SharedFrameBuffer, SharedMemoryDriver
+from metrics import BoardMetrics
+from samplingProfiler import SamplingProfiler
 
+# yfinance and requests are not imported up here, they are only loaded by the providers
+# that use them, in the background, so the first frame does not wait on them. numpy still
+# is, matrix.py and compositor.py import it, because the numpy frame buffer and the
+# overlay compositor are used from the very first frame, so it counts towards "imports"
+startup.mark("imports")
 
-def main():
+MAX_SLEEP = 15 * 60     # longest sleep with the display off before checking the schedule again
+POWER_BUDGET_AMPS = 4.0 # what the 5 V supply can give the LEDs, frames that would draw more get dimmed
+
+
+# Pass simulate = True (or run with --simulate) to draw to the terminal instead of the LEDs
+# Pass renderProcess = True (or run with --render-process) to drive the strip from its own
+# process, so the widgets and API work can never stall a frame, see renderProcess.py
+# Pass startupReport = True (or run with --startup-report) to print the startup timeline
+# and quit as soon as the first frame is on the LEDs
+# Pass metrics = True (or run with --metrics) to serve live performance counters for
+# Prometheus at http://127.0.0.1:9105/metrics, see metrics.py
+# Pass metricsHost (or run with --metrics-host <address>) to listen somewhere else than
+# 127.0.0.1, like 0.0.0.0 to be scraped from the network, it turns metrics on too
+def main(simulate = False, renderProcess = False, startupReport = False, metrics = False, metricsHost = None):
     # Initialize the hardware, these values wont change
-    dataPin = board.D18
     rows = 7
     cols = 55
-    mat = LEDMatrix(dataPin, rows, cols, bufferEnabled = True)
-
-    # Here the different behavior times can be configured
-    # Time 0: Wakeup    - When the first enable the display as a red clock (no widgets)
-    # Time 1: Morning   - Begin showing widgets at regular brightness
-    # Time 2: Evening   - Stop widgets, return to red clock without widgets
-    # Time 3: Off       - Turn off the display completely
-    schedule = [Time(5, 30), Time(6, 30), Time(23, 00), Time(23, 50)]
+    dataPin = None
+    if renderProcess:
+        driver = SharedMemoryDriver(SharedFrameBuffer.create(rows * cols))
+    elif simulate:
+        driver = SimulatorDriver(rows * cols, liveAnsi = True)
+    else:
+        import board    # only exists on the Pi
+        dataPin = board.D18
+        driver = None
+    # numpy is optional, without it the plain list buffer is used and the alert badge skips the compositor
+    mat = LEDMatrix(dataPin, rows, cols, bufferEnabled = True, bufferBackend = "numpy" if np is not None else "list", driver = driver)
+    if renderProcess:
+        driver.startRenderer(simulate = simulate)
+        atexit.register(driver.close)     # blanks the strip and frees the shared memory
+    mat.setPowerBudget(POWER_BUDGET_AMPS)
+    startup.mark("hardware")
 
     # Widgets have been moved to their own class and now need instantiation
-    w = Widget(mat)
+    boardMetrics = BoardMetrics() if metrics or metricsHost is not None else None
+    w = Widget(mat, metrics = boardMetrics)
+    if boardMetrics is not None:
+        boardMetrics.watch(mat, w)
+        if metricsHost is not None:
+            boardMetrics.serve(host = metricsHost)
+        else:
+            boardMetrics.serve()
+
+    w._log("LOG", "Program starting.")
 
-    w._log("[LOG][" + str(datetime.now(timezone.utc)) + "]: Program starting.")
+    # kill -USR1 <pid> (or POST /profile with --metrics) profiles the running board, see samplingProfiler.py
+    profiler = SamplingProfiler(log = w._log)
+    profiler.installSignal()
+    if boardMetrics is not None:
+        boardMetrics.profiler = profiler
+
+    # Once the first frame is out, the startup timeline is complete
+    def firstFrame():
+        startup.mark("firstFrame")
+        w._log("LOG", "Startup timeline.", **startup.fields())
+        if startupReport:
+            print(startup.report())
+            sys.exit(0)
+    mat.matrix.onFirstShow = firstFrame
+
+    # Here the different behavior times can be configured, see displaySchedule.py
+    # Each phase lasts until the next one starts, the last one runs over midnight
+    #   "clock"     red clock, no widgets
+    #   "widgets"   widgets at regular brightness
+    #   "off"       turn off the display completely
+    # A phase can also follow the sun, like Phase(SunTime("sunset", 30), "clock", 0.005),
+    # with SunTime imported from displaySchedule
+    latitude = w.secrets.get("WeatherLat")
+    longitude = w.secrets.get("WeatherLong")
+    schedule = DisplaySchedule([Phase(Time(5, 30), "clock", 0.005),      # Wakeup
+                                Phase(Time(6, 30), "widgets", 0.045),    # Morning
+                                Phase(Time(23, 00), "clock", 0.005),     # Evening
+                                Phase(Time(23, 50), "off")],             # Off
+                               latitude = float(latitude) if latitude is not None else None,
+                               longitude = float(longitude) if longitude is not None else None)
+    lastPhase = None
 
     # This is the main program loop, to run forever
     while True:
-        # Manage brightness according to time
+        # The schedule tells us what we need to run, and until when
         now = datetime.now()
+        phase = schedule.current(now)
+        nextAt, nextPhase = schedule.nextTransition(now)
+        deadline = time.monotonic() + (nextAt - now).total_seconds()
+        if phase is not lastPhase:
+            w._log("LOG", "Display " + phase.mode + " until " + nextAt.strftime("%Y-%m-%d %H:%M") + ", then " + nextPhase.mode + ".")
+            if phase.brightness is not None:
+                mat.setBrightness(phase.brightness)
+            lastPhase = phase
 
         # Testing, so use schedule override
         #mat.setBrightness(0.045)
         #while True:
         #    w.widget_runLoop()
 
-
-        # The schedule tells us what we need to run
-        if schedule[3].compare(now) or not schedule[0].compare(now):
-            # Night mode, no display, sleep for a bit
+        if phase.mode == "off":
+            # Night mode, no display, sleep right up to the next phase
+            # Never more than MAX_SLEEP in one go, the Pi has no clock battery and its clock
+            # can jump when it syncs, so every so often check the schedule again
             mat.clearDisplay()
-            time.sleep(120)
+            time.sleep(min(max(0.0, deadline - time.monotonic()), MAX_SLEEP))
 
-        elif (schedule[0].compare(now) and not schedule[1].compare(now)) or (schedule[2].compare(now) and not schedule[3].compare(now)):
+        elif phase.mode == "clock":
             # red clock, no widgets
-            mat.setBrightness(0.005)
-            w.widget_NightClock()
+            clockStart = time.monotonic()
+            w.widget_NightClock(until = deadline)
+            if boardMetrics is not None:
+                boardMetrics.observeWidget("widget_NightClock", time.monotonic() - clockStart)
 
-        elif schedule[1].compare(now) and not schedule[2].compare(now):
+        elif phase.mode == "widgets":
             # full normal operation
-            mat.setBrightness(0.045)
-            w.widget_runLoop()
+            w.widget_runLoop(deadline = deadline)
+
+# The value after a command line option, like the address in --metrics-host 0.0.0.0
+def optionValue(name):
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return None
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main(simulate = "--simulate" in sys.argv, renderProcess = "--render-process" in sys.argv,
+         startupReport = "--startup-report" in sys.argv, metrics = "--metrics" in sys.argv,
+         metricsHost = optionValue("--metrics-host"))
\ No newline at end of file
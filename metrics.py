@@ -0,0 +1,273 @@
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+"""
+Live performance counters for the running board, served over HTTP in the Prometheus
+text format, so a stuck or slow display can be alerted on without logging into the Pi.
+
+    python matrixDisplayBoard.py --metrics
+    curl http://127.0.0.1:9105/metrics
+
+It only listens on 127.0.0.1 unless it is told otherwise, for Prometheus on another
+machine run with --metrics-host 0.0.0.0 (or the Pi's address on the network it should be
+scraped from).
+
+The same server is the local control interface for the sampling profiler, when main()
+hands it one, POST /profile?seconds=60 starts a run or ends the current one early, see
+samplingProfiler.py. It has to be a POST, so a crawler or a prefetching browser cannot
+start profile runs that fill up the SD card.
+
+Almost everything is read at scrape time from counters the parts of the board already
+keep (StripFrame, FrameClock, the scheduler, the providers, the HTTP client and the text
+caches), so nothing extra runs per frame for those. The only work on the render path is
+timing show() for the frames that actually go out to the LEDs, one perf_counter pair and
+a bisect into a histogram. Widget slots and provider fetches are timed the same way, by
+the scheduler and the provider pool.
+
+Exposed, every name starts with rgbmatrix_:
+    frames_shown_total, frames_skipped_total, frames_dropped_total, rows_sent_total
+    seconds_since_frame         since the last show() call, stuck display detection
+    animation_fps, animation_target_fps, frame_jitter_seconds
+    show_seconds                histogram of show() for frames that were sent
+    widget_seconds{widget}      histogram of the wall time of each widget_* method
+    widget_runs_total{widget}, widget_preempted_total{widget}
+    provider_fetch_seconds{provider}    histogram of API latency
+    provider_errors_total{provider}, provider_warm_starts_total{provider}
+    provider_data_age_seconds{provider}
+    http_requests_total{host,code}, http_not_modified_total{host}
+    http_ratelimit_remaining{host,window}   quota left, from the API's rate limit headers
+    cache_hits_total{cache}, cache_misses_total{cache}    text strips and normalized strings
+    power_budget_amps, power_requested_amps, power_estimated_amps, power_estimated_watts,
+    power_scale, power_limited_frames_total     when a power budget is set, see powerLimiter.py
+    uptime_seconds
+"""
+
+METRICS_PORT = 9105
+METRICS_HOST = "127.0.0.1"     # only this machine, see serve()
+PREFIX = "rgbmatrix_"
+
+# Histogram bucket upper bounds in seconds
+SHOW_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+WIDGET_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+
+class Histogram:
+    """
+    Prometheus style histogram with fixed buckets
+
+    observe() is a bisect and two additions, cheap enough to call every frame. Only one
+    thread observes each histogram, and a scrape that reads it halfway through an
+    observe is at worst off by that one observation.
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Lines of the text format, buckets are cumulative
+    def lines(self, name, labels = ""):
+        lines = []
+        total = 0
+        separator = "," if labels else ""
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            lines.append(name + '_bucket{' + labels + separator + 'le="' + str(bound) + '"} ' + str(total))
+        braces = "{" + labels + "}" if labels else ""
+        lines.append(name + "_sum" + braces + " " + repr(self.sum))
+        lines.append(name + "_count" + braces + " " + str(self.count))
+        return lines
+
+
+def labelPairs(**labels):
+    return ",".join(key + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"' for key, value in labels.items())
+
+
+class BoardMetrics:
+    """
+    Everything the metrics endpoint serves
+
+    Made in main() before the Widget, which hands it to its provider pool and scheduler,
+    and pointed at the LEDMatrix and the Widget with watch() once they exist.
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.mat = None
+        self.widget = None
+        self.showSeconds = Histogram(SHOW_BUCKETS)
+        self.widgetSeconds = {}         # widget method name: Histogram
+        self.fetchSeconds = {}          # provider name: Histogram
+        self.lock = threading.Lock()    # only for adding new names, never taken per frame
+        self.server = None
+        self.profiler = None            # optional SamplingProfiler, toggled by POST /profile
+
+    """
+    @brief:     Points the metrics at the running board
+    @param:     mat         LEDMatrix, show() gets timed from now on
+    @param:     widget      Default None, the Widget, for the scheduler, providers and HTTP client
+    @retval:    None
+    """
+    def watch(self, mat, widget = None):
+        self.mat = mat
+        self.widget = widget
+        mat.matrix.showTimes = self.showSeconds
+
+    def _histogram(self, table, name, buckets):
+        histogram = table.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = table.setdefault(name, Histogram(buckets))
+        return histogram
+
+    # Called by the scheduler and main() with how long a widget_* method ran
+    def observeWidget(self, name, seconds):
+        self._histogram(self.widgetSeconds, name, WIDGET_BUCKETS).observe(seconds)
+
+    # Called by the provider pool after every fetch, good or bad
+    def observeFetch(self, name, seconds):
+        self._histogram(self.fetchSeconds, name, FETCH_BUCKETS).observe(seconds)
+
+    """
+    @brief:     Renders every metric in the Prometheus text format
+    @note:      Runs on the server thread, it only reads what the other threads keep
+    @retval:    str
+    """
+    def render(self):
+        out = []
+        def metric(name, kind, help, samples):
+            out.append("# HELP " + PREFIX + name + " " + help)
+            out.append("# TYPE " + PREFIX + name + " " + kind)
+            for labels, value in samples:
+                out.append(PREFIX + name + ("{" + labels + "}" if labels else "") + " " + repr(value))
+        def histograms(name, help, table, label):
+            out.append("# HELP " + PREFIX + name + " " + help)
+            out.append("# TYPE " + PREFIX + name + " histogram")
+            for key, histogram in sorted(table.items()):
+                out.extend(histogram.lines(PREFIX + name, labelPairs(**{label: key}) if label else ""))
+
+        metric("uptime_seconds", "gauge", "Seconds since the metrics started.", [("", time.monotonic() - self.started)])
+
+        if self.mat is not None:
+            frame = self.mat.matrix
+            clock = self.mat.frameClock
+            clockStats = clock.stats()
+            metric("frames_shown_total", "counter", "Frames sent to the LEDs.", [("", frame.framesShown)])
+            metric("frames_skipped_total", "counter", "show() calls with nothing new to send.", [("", frame.framesSkipped)])
+            metric("rows_sent_total", "counter", "Matrix rows copied to the driver.", [("", frame.rowsSent)])
+            metric("frames_dropped_total", "counter", "Animation frames skipped to stay on schedule.", [("", clockStats["dropped"])])
+            metric("animation_fps", "gauge", "Frames per second achieved over the recent animation frames.", [("", clockStats["fps"])])
+            metric("animation_target_fps", "gauge", "Frames per second the current animation asked for.", [("", clockStats["targetFps"])])
+            metric("frame_jitter_seconds", "gauge", "Standard deviation of the recent animation frame intervals.", [("", clockStats["jitter"])])
+            if frame.lastShowCall > 0:
+                metric("seconds_since_frame", "gauge", "Seconds since show() was last called.", [("", time.monotonic() - frame.lastShowCall)])
+            histograms("show_seconds", "Time spent in show() for frames sent to the LEDs.", {"": self.showSeconds}, None)
+
+            limiter = frame.powerLimiter
+            if limiter is not None:
+                power = limiter.stats()
+                metric("power_budget_amps", "gauge", "Most amps the LEDs are allowed to draw.", [("", power["budgetAmps"])])
+                metric("power_requested_amps", "gauge", "Estimated amps of the last frame as drawn, before limiting.", [("", power["requestedAmps"])])
+                metric("power_estimated_amps", "gauge", "Estimated amps of the last frame as sent.", [("", power["estimatedAmps"])])
+                metric("power_estimated_watts", "gauge", "Estimated watts of the last frame as sent.", [("", power["estimatedWatts"])])
+                metric("power_scale", "gauge", "Scale the power limiter is applying, 1 is no limit.", [("", power["scale"])])
+                metric("power_limited_frames_total", "counter", "Frames dimmed to stay within the power budget.", [("", power["framesLimited"])])
+
+            atlas = self.mat.atlas
+            metric("cache_hits_total", "counter", "Cache lookups that found an entry.",
+                   [(labelPairs(cache = "textStrip"), self.mat.textCacheHits), (labelPairs(cache = "normalize"), atlas.normalizeHits)])
+            metric("cache_misses_total", "counter", "Cache lookups that had to build the entry.",
+                   [(labelPairs(cache = "textStrip"), self.mat.textCacheMisses), (labelPairs(cache = "normalize"), atlas.normalizeMisses)])
+
+        histograms("widget_seconds", "Wall time of each widget method.", dict(self.widgetSeconds), "widget")
+
+        if self.widget is not None:
+            scheduled = self.widget.scheduler.widgets
+            metric("widget_runs_total", "counter", "Scheduler slots given to each widget.",
+                   [(labelPairs(widget = each.name), each.runs) for each in scheduled])
+            metric("widget_preempted_total", "counter", "Slots cut short by an urgent widget, the budget or the schedule.",
+                   [(labelPairs(widget = each.name), each.preempted) for each in scheduled])
+
+            providers = list(self.widget.providers.providers.values())
+            now = time.time()
+            histograms("provider_fetch_seconds", "API latency of each provider fetch.", dict(self.fetchSeconds), "provider")
+            metric("provider_errors_total", "counter", "Provider fetches that raised.",
+                   [(labelPairs(provider = each.name), each.errors) for each in providers])
+            metric("provider_warm_starts_total", "counter", "Providers started from the response cache instead of the API.",
+                   [(labelPairs(provider = each.name), 1 if each.warmStarted else 0) for each in providers])
+            metric("provider_data_age_seconds", "gauge", "Age of the data each provider is showing.",
+                   [(labelPairs(provider = each.name), now - each.snapshot().fetchedAt) for each in providers if each.snapshot().fetchedAt > 0])
+
+            http = self.widget.http.stats()
+            metric("http_requests_total", "counter", "HTTP responses from the APIs, by status code.",
+                   [(labelPairs(host = host, code = code), count) for host, hostStats in http.items() for code, count in sorted(hostStats["codes"].items())])
+            metric("http_not_modified_total", "counter", "Requests answered from the conditional request cache.",
+                   [(labelPairs(host = host), hostStats["notModified"]) for host, hostStats in http.items()])
+            metric("http_ratelimit_remaining", "gauge", "Requests left in the API quota, from the last rate limit headers.",
+                   [(labelPairs(host = host, window = window), remaining) for host, hostStats in http.items() for window, remaining in sorted(hostStats["rateLimit"].items())])
+
+        return "\n".join(out) + "\n"
+
+    """
+    @brief:     Serves the metrics at /metrics from a background thread
+    @param:     port        Default METRICS_PORT
+    @param:     host        Default "127.0.0.1", only this machine, "0.0.0.0" for every interface
+    @retval:    None
+    """
+    def serve(self, port = METRICS_PORT, host = METRICS_HOST):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                request = urlsplit(self.path)
+                if request.path in ("/metrics", "/"):
+                    self.reply(metrics.render())
+                elif request.path == "/profile" and metrics.profiler is not None:
+                    self.send_response(405)
+                    self.send_header("Allow", "POST")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                else:
+                    self.send_error(404)
+
+            # Anything that changes state is a POST
+            def do_POST(self):
+                request = urlsplit(self.path)
+                if request.path != "/profile" or metrics.profiler is None:
+                    self.send_error(404)
+                    return
+                seconds = parse_qs(request.query).get("seconds", [None])[0]
+                try:
+                    started = metrics.profiler.toggle(float(seconds)) if seconds else metrics.profiler.toggle()
+                except ValueError:
+                    self.send_error(400, "seconds has to be a number")
+                    return
+                self.reply("Profiling started.\n" if started else "Profiling stopped, files are in " + metrics.profiler.directory + ".\n")
+
+            def reply(self, text):
+                body = text.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass    # every scrape would end up on stderr otherwise
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target = self.server.serve_forever, name = "metrics", daemon = True).start()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
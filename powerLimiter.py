@@ -0,0 +1,102 @@
+from itertools import chain
+
+"""
+Keeps the LEDs inside what the power supply can deliver.
+
+The static brightness is the only thing between a full white frame and the supply, and
+widget_Hell sets brightness to 1 and flashes all 385 LEDs white, which asks for over 20 A.
+With a limiter on the StripFrame, every outgoing frame gets its supply current estimated
+before it is sent, and when it would go over the budget the whole frame is scaled down
+through the ColorPipeline, so the frame that goes out is already within budget.
+
+The estimate is the summed output channel values: a WS2812B channel draws about
+AMPS_PER_CHANNEL at 255 and scales linearly with its PWM value, plus IDLE_AMPS_PER_LED
+for every LED whether it is lit or not. The StripFrame keeps a running sum per row, so
+only the rows that changed get added up again.
+
+Scaling down happens on the frame that would go over, no waiting. Coming back up is
+spread over RELEASE_SECONDS, so content that hovers around the budget fades instead of
+pumping brightness up and down every frame.
+
+Usage:
+    mat.setPowerBudget(4.0)     # amps the 5 V supply can give the LEDs
+"""
+
+AMPS_PER_CHANNEL = 0.020    # one channel at full PWM
+IDLE_AMPS_PER_LED = 0.001   # quiescent draw of each LED's controller
+RELEASE_SECONDS = 1.0       # time to go from fully limited back to no limit
+FRAME_SECONDS = 0.03        # rough frame time, for turning RELEASE_SECONDS into a step per frame
+
+
+class PowerLimiter:
+    """
+    budgetAmps  Most amps the LEDs are allowed to draw
+    nPix        Number of LEDs
+    volts       Default 5.0, supply voltage, only used for the watts figures
+    """
+    def __init__(self, budgetAmps, nPix, volts = 5.0):
+        self.budgetAmps = budgetAmps
+        self.nPix = nPix
+        self.volts = volts
+        self.idleAmps = nPix * IDLE_AMPS_PER_LED
+        self.releaseStep = FRAME_SECONDS / RELEASE_SECONDS
+
+        self.scale = 1.0            # what the ColorPipeline is multiplying by right now
+        self.requestedAmps = 0.0    # last frame, as drawn, without the limit
+        self.estimatedAmps = 0.0    # last frame, as sent
+        self.peakRequestedAmps = 0.0
+
+        # Counters, for diagnostics
+        self.framesLimited = 0
+        self.framesChecked = 0
+
+    # Output level of a row of colors, the sum of every channel value
+    @staticmethod
+    def level(rowOut):
+        return sum(chain.from_iterable(rowOut))
+
+    # Supply current for a total output level, at whatever scale it was measured at
+    def amps(self, level):
+        return self.idleAmps + ((level / 255.0) * AMPS_PER_CHANNEL)
+
+    """
+    @brief:     Works out the scale for the frame about to go out
+    @note:      Called by StripFrame.show with the summed output levels of every row, as
+                    they come out of the pipeline at the current scale
+    @param:     level       Sum of every channel value of the frame
+    @retval:    float       The scale the frame should be sent at, from 0.0 to 1.0
+    """
+    def update(self, level):
+        self.framesChecked += 1
+        dynamicAmps = self.amps(level) - self.idleAmps
+        unscaledAmps = dynamicAmps / self.scale if self.scale > 0 else dynamicAmps
+        self.requestedAmps = self.idleAmps + unscaledAmps
+        self.peakRequestedAmps = max(self.peakRequestedAmps, self.requestedAmps)
+
+        # Highest scale that keeps this frame within budget
+        if unscaledAmps > 0:
+            target = min(1.0, max(0.0, self.budgetAmps - self.idleAmps) / unscaledAmps)
+        else:
+            target = 1.0
+
+        if target < self.scale:
+            self.scale = target
+        elif self.scale < 1.0:
+            self.scale = min(target, self.scale + self.releaseStep)
+        if self.scale < 1.0:
+            self.framesLimited += 1
+        self.estimatedAmps = self.idleAmps + (unscaledAmps * self.scale)
+        return self.scale
+
+    # Everything at once, for logging and metrics
+    def stats(self):
+        return {
+            "budgetAmps": self.budgetAmps,
+            "requestedAmps": self.requestedAmps,
+            "estimatedAmps": self.estimatedAmps,
+            "estimatedWatts": self.estimatedAmps * self.volts,
+            "peakRequestedAmps": self.peakRequestedAmps,
+            "scale": self.scale,
+            "framesLimited": self.framesLimited,
+            "framesChecked": self.framesChecked
+        }
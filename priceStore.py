@@ -0,0 +1,86 @@
+import os
+import struct
+import threading
+
+"""
+Daily closing prices for the stock watchlist, kept on disk between refreshes.
+
+The stock widget used to download the whole 5 day history every few minutes and throw
+the old one away. Now every ticker has a small append-only file of fixed size records,
+and each refresh only asks for bars from the last stored one onwards.
+
+Each record is 16 bytes, little endian:
+    time    int64   unix time of the bar
+    close   float64 closing price (the latest price for a bar that is still open)
+
+Bars arrive in time order. A bar with the same time as the last stored one replaces it,
+since today's bar keeps changing until the market closes, anything newer is appended and
+anything older is ignored.
+"""
+
+RECORD = struct.Struct("<qd")
+
+
+class PriceStore:
+    def __init__(self, directory = os.path.join("cache", "prices")):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok = True)
+        self.lock = threading.Lock()
+
+    def _path(self, symbol):
+        return os.path.join(self.directory, symbol.upper() + ".bin")
+
+    # The last stored record of a symbol as (time, close), None if there is none
+    def lastBar(self, symbol):
+        bars = self.last(symbol, 1)
+        return bars[0] if len(bars) > 0 else None
+
+    """
+    @brief:     Reads the newest bars of a symbol, without reading the whole file
+    @param:     symbol      Ticker symbol
+    @param:     count       How many bars at most
+    @retval:    list        (time, close) tuples, oldest first
+    """
+    def last(self, symbol, count):
+        try:
+            with open(self._path(symbol), "rb") as storeFile:
+                storeFile.seek(0, os.SEEK_END)
+                size = storeFile.tell() - (storeFile.tell() % RECORD.size)     # ignore a half written record
+                start = max(0, size - (count * RECORD.size))
+                storeFile.seek(start)
+                data = storeFile.read(size - start)
+        except FileNotFoundError:
+            return []
+        return [RECORD.unpack_from(data, offset) for offset in range(0, len(data), RECORD.size)]
+
+    """
+    @brief:     Adds new bars for a symbol
+    @param:     symbol      Ticker symbol
+    @param:     bars        (time, close) tuples in time order
+    @retval:    int         How many bars were added or replaced
+    """
+    def append(self, symbol, bars):
+        with self.lock:
+            path = self._path(symbol)
+            last = self.lastBar(symbol)
+            written = 0
+            with open(path, "r+b" if os.path.exists(path) else "wb") as storeFile:
+                storeFile.seek(0, os.SEEK_END)
+                end = storeFile.tell() - (storeFile.tell() % RECORD.size)
+                for barTime, close in bars:
+                    barTime = int(barTime)
+                    if last is not None and barTime < last[0]:
+                        continue
+                    if last is not None and barTime == last[0]:
+                        # Same bar as the last stored one, overwrite it in place
+                        if close == last[1]:
+                            continue
+                        storeFile.seek(end - RECORD.size)
+                    else:
+                        storeFile.seek(end)
+                        end += RECORD.size
+                    storeFile.write(RECORD.pack(barTime, float(close)))
+                    last = (barTime, close)
+                    written += 1
+                storeFile.truncate(end)
+            return written
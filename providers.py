@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Widgets used to call their APIs inline, right before animating, so the display
+froze for the whole HTTP round trip. Now every data source is a DataProvider
+with its own refresh schedule, and a ProviderPool runs the fetches on background
+threads. Each successful fetch publishes a new Snapshot, and widgets just read
+whatever the latest snapshot is without ever waiting on the network.
+
+If the pool has a ResponseCache, every good payload is also saved to disk. When a
+provider is registered its cached payload is published straight away, as long as
+it is younger than the provider's ttl, and the next fetch is scheduled from the
+time that payload was fetched instead of right now.
+"""
+
+# data       Whatever the fetch function returned, None until the first good fetch
+# fetchedAt  Unix time of the fetch that produced data, 0 if there is none yet
+# error      Description of the last failed fetch, None if the last fetch worked
+#
+# Snapshots are shared between threads, treat data as read only and never modify it
+Snapshot = namedtuple("Snapshot", ["data", "fetchedAt", "error"])
+
+# What a fetch function returns when the server said its data has not changed, a 304
+NOT_MODIFIED = object()
+
+
+class DataProvider:
+    """
+    One data source, for example the weather API
+
+    name            Name used for logging and to look the provider up in the pool
+    fetch           Function that does the network call and returns the parsed data.
+                        Returning None means nothing new, the last snapshot is kept.
+                        Returning NOT_MODIFIED means the last data is still current, it
+                        is published again with the new fetchedAt and saved to the cache.
+                        Raising marks the fetch as failed, the last snapshot is kept.
+    refreshSeconds  Seconds between fetches, or a function taking the current Snapshot
+                        and returning seconds, for sources whose schedule changes
+    ttl             Default None, seconds a cached payload stays good enough to show after
+                        a restart. None means cached payloads are always used
+    """
+    def __init__(self, name, fetch, refreshSeconds, ttl = None):
+        self.name = name
+        self.fetch = fetch
+        self.refreshSeconds = refreshSeconds
+        self.ttl = ttl
+
+        self.lastAttempt = 0        # unix time of the last fetch, good or bad
+        self.lastLatency = 0        # seconds the last fetch took
+        self.inFlight = False
+        self.cache = None           # set by the pool
+        self.warmStarted = False    # the first snapshot came from the cache
+        self.fetches = 0
+        self.errors = 0
+        self._snapshot = Snapshot(None, 0, None)
+
+    # The latest published data, never blocks
+    def snapshot(self):
+        return self._snapshot
+
+    # Seconds between fetches right now
+    def interval(self):
+        if callable(self.refreshSeconds):
+            return self.refreshSeconds(self._snapshot)
+        return self.refreshSeconds
+
+    # Unix time when the next fetch should happen
+    def nextDue(self):
+        return self.lastAttempt + self.interval()
+
+    # Replaces the published snapshot, one reference swap so readers always see a whole snapshot
+    def publish(self, data, fetchedAt):
+        self._snapshot = Snapshot(data, fetchedAt, None)
+
+    """
+    @brief:     Publishes the cached payload, if there is one and it has not expired
+    @note:      The next fetch is scheduled from when the cached payload was fetched
+    @retval:    boolean     True if a cached payload was published
+    """
+    def warmStart(self):
+        if self.cache is None:
+            return False
+        cached = self.cache.load(self.name)
+        if cached is None:
+            return False
+
+        data, fetchedAt = cached
+        if self.ttl is not None and time.time() - fetchedAt > self.ttl:
+            return False
+        self.publish(data, fetchedAt)
+        self.lastAttempt = fetchedAt
+        self.warmStarted = True
+        return True
+
+    """
+    @brief:     Runs the fetch function and publishes the result
+    @note:      Runs on a pool worker thread, never on the render thread
+    @retval:    None
+    """
+    def refresh(self):
+        now = time.time()
+        self.lastAttempt = now
+        self.fetches += 1
+        fetchStart = time.monotonic()
+        try:
+            data = self.fetch()
+            if data is NOT_MODIFIED:
+                # The server confirmed what we have, so it is as fresh as a new fetch
+                data = self._snapshot.data
+            if data is not None:
+                self.publish(data, now)
+                if self.cache is not None:
+                    self.cache.save(self.name, data, now)
+        except Exception as ex:
+            self.errors += 1
+            self._snapshot = Snapshot(self._snapshot.data, self._snapshot.fetchedAt, type(ex).__name__ + ": " + str(ex))
+            raise
+        finally:
+            self.lastLatency = time.monotonic() - fetchStart
+            self.inFlight = False
+
+
+class ProviderPool:
+    """
+    Runs every registered DataProvider on its own schedule, in the background
+
+    A single scheduler thread sleeps until the next provider is due and hands the fetch
+    to a small thread pool, so one slow API never holds up the others.
+    """
+    IDLE_WAIT = 30      # most seconds the scheduler sleeps before checking again
+
+    def __init__(self, maxWorkers = 3, log = None, cache = None, metrics = None):
+        self.providers = {}
+        self.log = log          # function taking (level, message, **fields), used to report fetches
+        self.cache = cache      # optional ResponseCache, for warm starts
+        self.metrics = metrics  # optional BoardMetrics, gets the latency of every fetch
+        self.executor = ThreadPoolExecutor(max_workers = maxWorkers, thread_name_prefix = "provider")
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def register(self, provider):
+        self.providers[provider.name] = provider
+        provider.cache = self.cache
+        provider.warmStart()
+        self.wakeup.set()
+        return provider
+
+    def get(self, name):
+        return self.providers[name]
+
+    # Shorthand for get(name).snapshot()
+    def snapshot(self, name):
+        return self.providers[name].snapshot()
+
+    # Starts the scheduler thread, providers are all due right away
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target = self._run, name = "providerScheduler", daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.executor.shutdown(wait = False)
+
+    # Asks for a provider to be fetched as soon as possible, ignoring its schedule
+    def requestRefresh(self, name):
+        self.providers[name].lastAttempt = 0
+        self.wakeup.set()
+
+    def _run(self):
+        while self.running:
+            now = time.time()
+            nextWake = now + self.IDLE_WAIT
+
+            for provider in list(self.providers.values()):
+                if provider.inFlight:
+                    continue
+                due = provider.nextDue()
+                if due <= now:
+                    provider.inFlight = True
+                    future = self.executor.submit(provider.refresh)
+                    future.add_done_callback(lambda f, p = provider: self._fetchDone(f, p))
+                else:
+                    nextWake = min(nextWake, due)
+
+            self.wakeup.wait(max(0, nextWake - time.time()))
+            self.wakeup.clear()
+
+    def _fetchDone(self, future, provider):
+        ex = future.exception()
+        latencyMs = int(provider.lastLatency * 1000)
+        if self.metrics is not None:
+            self.metrics.observeFetch(provider.name, provider.lastLatency)
+        if self.log is not None:
+            if ex is not None:
+                template = "An exception of type {0} occurred in provider {1}. Arguments:\n{2!r}"
+                message = template.format(type(ex).__name__, provider.name, ex.args)
+                self.log("ERROR", message, provider = provider.name, latencyMs = latencyMs)
+            else:
+                self.log("LOG", "Fetched " + provider.name + ".", provider = provider.name, latencyMs = latencyMs)
+        # The next due time of a provider can depend on what it just fetched
+        self.wakeup.set()
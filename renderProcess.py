@@ -0,0 +1,220 @@
+import itertools
+import struct
+import sys
+from multiprocessing import Process, shared_memory
+
+"""
+Runs the LED strip from its own process.
+
+In one process, JSON parsing, pandas and logging all share the GIL with the thread that
+calls show(), and every time they hold it for a while the scroll hitches. With this the
+strip belongs to a render process that does nothing but copy the newest frame to the
+LEDs at a fixed rate. The widgets keep running LEDMatrix like always, only its driver is
+a SharedMemoryDriver, which publishes every shown frame into shared memory.
+
+Shared memory layout, all little endian:
+    magic   uint32  FRAME_MAGIC
+    nPix    uint32  LEDs per frame
+    seq     uint32  Number of frames published so far
+    flags   uint32  FLAG_CLOSED once the app is done
+    frame 0 nPix * 3 bytes of r, g, b in strip order
+    frame 1 nPix * 3 bytes
+
+Frames are double buffered. Frame number seq lives in buffer seq % 2, the writer fills the
+other buffer and only then bumps seq. The reader copies buffer seq % 2 and checks seq
+again afterwards, if it moved the copy could be torn, so it reads again.
+
+Pixels are published after LEDMatrix's color pipeline, so the render process shows them
+as they are, with the strip at full brightness.
+"""
+
+HEADER = struct.Struct("<IIII")
+SEQ_FORMAT = struct.Struct("<I")
+SEQ_OFFSET = 8
+FLAGS_OFFSET = 12
+FRAME_MAGIC = 0x46424752     # "RGBF"
+FLAG_CLOSED = 1
+DEFAULT_NAME = "rgbMatrixFrames"
+
+
+class SharedFrameBuffer:
+    """
+    The double buffered frames in shared memory. The app process create()s it,
+    the render process attach()es to it by name.
+    """
+    def __init__(self, memory, owner):
+        self.memory = memory
+        self.owner = owner
+        magic, self.nPix, seq, flags = HEADER.unpack_from(memory.buf, 0)
+        if magic != FRAME_MAGIC:
+            raise ValueError("Shared memory " + memory.name + " does not hold matrix frames")
+        self.frameBytes = self.nPix * 3
+        self.name = memory.name
+
+    @classmethod
+    def create(cls, nPix, name = DEFAULT_NAME):
+        size = HEADER.size + (2 * nPix * 3)
+        try:
+            memory = shared_memory.SharedMemory(name = name, create = True, size = size)
+        except FileExistsError:
+            # Left behind by a run that crashed, nobody else should be using it
+            stale = shared_memory.SharedMemory(name = name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name = name, create = True, size = size)
+        HEADER.pack_into(memory.buf, 0, FRAME_MAGIC, nPix, 0, 0)
+        return cls(memory, owner = True)
+
+    @classmethod
+    def attach(cls, name = DEFAULT_NAME):
+        if sys.version_info >= (3, 13):
+            memory = shared_memory.SharedMemory(name = name, track = False)
+        else:
+            memory = shared_memory.SharedMemory(name = name)
+        return cls(memory, owner = False)
+
+    def _frameOffset(self, seq):
+        return HEADER.size + ((seq % 2) * self.frameBytes)
+
+    def sequence(self):
+        return SEQ_FORMAT.unpack_from(self.memory.buf, SEQ_OFFSET)[0]
+
+    def closed(self):
+        return SEQ_FORMAT.unpack_from(self.memory.buf, FLAGS_OFFSET)[0] & FLAG_CLOSED != 0
+
+    """
+    @brief:     Publishes a frame
+    @param:     frame       bytes of r, g, b for every LED in strip order
+    @retval:    int         The sequence number of the frame
+    """
+    def write(self, frame):
+        seq = self.sequence() + 1
+        offset = self._frameOffset(seq)
+        self.memory.buf[offset:offset + self.frameBytes] = frame
+        SEQ_FORMAT.pack_into(self.memory.buf, SEQ_OFFSET, seq)
+        return seq
+
+    """
+    @brief:     Reads the newest frame, if there is one newer than lastSeq
+    @param:     lastSeq     Sequence number of the frame the caller already has
+    @retval:    tuple       (seq, frame bytes), or None when nothing new was published
+    """
+    def read(self, lastSeq = 0):
+        while True:
+            seq = self.sequence()
+            if seq == lastSeq:
+                return None
+            offset = self._frameOffset(seq)
+            frame = bytes(self.memory.buf[offset:offset + self.frameBytes])
+            if self.sequence() == seq:
+                return (seq, frame)
+
+    def markClosed(self):
+        SEQ_FORMAT.pack_into(self.memory.buf, FLAGS_OFFSET, FLAG_CLOSED)
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class SharedMemoryDriver:
+    """
+    Driver for LEDMatrix that hands every shown frame to the render process,
+    see drivers.py for what a driver has to do.
+
+    show() only flattens the pixels and copies them into shared memory, which takes
+    microseconds, the strip itself is driven by the render process.
+    """
+    def __init__(self, frames):
+        self.frames = frames
+        self.n = frames.nPix
+        self.brightness = 1.0
+        self.pixels = [(0, 0, 0)] * self.n
+        self.showCount = 0
+        self.layout = None
+        self.process = None
+
+    # LEDMatrix calls this, the render process needs it when it runs the simulator
+    def setLayout(self, rows, cols, pixelIndex):
+        self.layout = (rows, cols, list(pixelIndex))
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, color):
+        self.pixels[index] = color
+
+    def __getitem__(self, index):
+        return self.pixels[index]
+
+    def fill(self, color):
+        self.pixels = [tuple(color)] * self.n
+
+    def show(self):
+        self.showCount += 1
+        self.frames.write(bytes(itertools.chain.from_iterable(self.pixels)))
+
+    """
+    @brief:     Starts the render process for this driver
+    @param:     fps         Default 100, how often the render process looks for a new frame
+    @param:     simulate    Default False, render to a SimulatorDriver in the terminal instead of the LEDs
+    @retval:    Process     The render process, it is also kept in self.process
+    """
+    def startRenderer(self, fps = 100, simulate = False):
+        self.process = Process(target = renderMain, args = (self.frames.name, fps, simulate, self.layout),
+                               name = "matrixRender", daemon = True)
+        self.process.start()
+        return self.process
+
+    # Tells the render process to blank the strip and quit, then lets go of the shared memory
+    def close(self):
+        self.frames.markClosed()
+        if self.process is not None:
+            self.process.join(timeout = 5)
+        self.frames.close()
+
+
+"""
+@brief:     Copies frames from shared memory to the strip until the app closes the buffer
+@note:      Only shows the strip when a new frame arrived, pushing data out to 385 LEDs
+                takes a noticeable slice of a frame
+@param:     frames      SharedFrameBuffer, attached
+@param:     strip       The real driver, see drivers.py
+@param:     fps         How often to look for a new frame
+@retval:    None
+"""
+def renderLoop(frames, strip, fps):
+    from matrix import FrameClock
+
+    clock = FrameClock()
+    clock.start(1.0 / fps)
+    lastSeq = 0
+    n = frames.nPix
+    while not frames.closed():
+        latest = frames.read(lastSeq)
+        if latest is not None:
+            lastSeq, frame = latest
+            strip[0:n] = [tuple(frame[i:i + 3]) for i in range(0, n * 3, 3)]
+            strip.show()
+        clock.tick()
+
+    strip.fill((0, 0, 0))
+    strip.show()
+
+# Entry point of the render process
+def renderMain(name, fps, simulate, layout):
+    from drivers import SimulatorDriver, openNeoPixel
+
+    frames = SharedFrameBuffer.attach(name)
+    if simulate:
+        strip = SimulatorDriver(frames.nPix, liveAnsi = True)
+        if layout is not None:
+            strip.setLayout(*layout)
+    else:
+        import board    # only exists on the Pi
+        strip = openNeoPixel(board.D18, frames.nPix, 1.0)
+    try:
+        renderLoop(frames, strip, fps)
+    finally:
+        frames.close()
@@ -0,0 +1,58 @@
+import os
+import pickle
+
+"""
+Keeps the last good payload of every data provider on disk, so after a restart
+the widgets have something to show right away, and the APIs only get called
+again once their data is actually stale.
+
+Each provider gets its own file in the cache directory holding (fetchedAt, data).
+Payloads are whatever the fetch functions return, and some of them are not plain JSON,
+like the Forecast object the weather provider parses its response into, or the news
+headline tuple, so they are pickled. The HTTP responses themselves are not cached here,
+HttpClient only keeps the ones with validators in memory. Files are written to a temp file and renamed into place,
+so a power cut halfway through a write never leaves a broken entry behind.
+"""
+
+class ResponseCache:
+    def __init__(self, directory = "cache"):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok = True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".pickle")
+
+    """
+    @brief:     Stores a payload for a provider, replacing whatever was there
+    @param:     name        Name of the provider
+    @param:     data        The payload, anything pickle can handle
+    @param:     fetchedAt   Unix time the payload was fetched
+    @retval:    None
+    """
+    def save(self, name, data, fetchedAt):
+        path = self._path(name)
+        tempPath = path + ".tmp"
+        with open(tempPath, "wb") as cacheFile:
+            pickle.dump((fetchedAt, data), cacheFile, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(tempPath, path)
+
+    """
+    @brief:     Loads the stored payload for a provider
+    @note:      A missing or unreadable entry is treated the same as no entry
+    @param:     name        Name of the provider
+    @retval:    tuple       (data, fetchedAt), or None if there is nothing usable
+    """
+    def load(self, name):
+        try:
+            with open(self._path(name), "rb") as cacheFile:
+                fetchedAt, data = pickle.load(cacheFile)
+            return (data, fetchedAt)
+        except Exception:
+            return None
+
+    # Removes the stored payload for a provider, if there is one
+    def clear(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
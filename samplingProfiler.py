@@ -0,0 +1,171 @@
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+"""
+A sampling profiler that can be turned on while the board is running.
+
+When the display stutters, this shows where the time actually goes, the scroll loop,
+stringPrint, JSON parsing on a provider thread, show(), without restarting anything.
+While it runs, a background thread wakes up every INTERVAL seconds, grabs the current
+stack of every other thread with sys._current_frames() and counts it. Nothing is traced
+or hooked, so the threads being profiled run at full speed, the cost is the sampler
+thread itself, well under a percent of one core at the default rate.
+
+After the run two files go into the profiles directory:
+    profile-<time>.folded       collapsed stacks, one line per distinct stack with its
+                                    sample count, thread name first. Feed it to
+                                    flamegraph.pl or drop it on speedscope.app
+    profile-<time>.txt          per function summary, self and total samples
+
+Turning it on and off:
+    kill -USR1 <pid>                        starts a run, or ends the current one early
+    curl -X POST "http://127.0.0.1:9105/profile?seconds=60"     the same, when --metrics is on
+"""
+
+INTERVAL = 0.01         # seconds between samples
+DEFAULT_SECONDS = 30    # how long a run lasts unless it is told otherwise
+
+
+class SamplingProfiler:
+    def __init__(self, directory = "profiles", interval = INTERVAL, log = None):
+        self.directory = directory
+        self.interval = interval
+        self.log = log          # function taking (level, message, **fields)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopEvent = threading.Event()
+        self.lastFiles = None   # (folded path, summary path) of the last finished run
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    """
+    @brief:     Starts a profiling run in the background
+    @param:     seconds     Default DEFAULT_SECONDS, how long to sample for
+    @retval:    boolean     False if a run was already going
+    """
+    def start(self, seconds = DEFAULT_SECONDS):
+        with self.lock:
+            if self.running():
+                return False
+            self.stopEvent.clear()
+            self.thread = threading.Thread(target = self._run, args = (seconds,), name = "profiler", daemon = True)
+            self.thread.start()
+        if self.log is not None:
+            self.log("LOG", "Profiling for " + str(seconds) + " seconds.")
+        return True
+
+    # Ends the current run early, it still writes its files
+    def stop(self):
+        self.stopEvent.set()
+
+    # Starts a run, or ends the one that is going. Returns True if a run was started
+    def toggle(self, seconds = DEFAULT_SECONDS):
+        if self.running():
+            self.stop()
+            return False
+        return self.start(seconds)
+
+    """
+    @brief:     Makes a signal toggle the profiler
+    @note:      Has to be called from the main thread. Does nothing where the signal does
+                    not exist, SIGUSR1 is not a thing on Windows
+    @param:     signalName  Default "SIGUSR1"
+    @retval:    boolean     True if the handler was installed
+    """
+    def installSignal(self, signalName = "SIGUSR1"):
+        signum = getattr(signal, signalName, None)
+        if signum is None:
+            return False
+        # The handler only starts or stops a thread, it never does the sampling itself
+        signal.signal(signum, lambda received, frame: self.toggle())
+        return True
+
+    @staticmethod
+    def _frameName(frame):
+        code = frame.f_code
+        name = code.co_name + " (" + os.path.basename(code.co_filename) + ":" + str(code.co_firstlineno) + ")"
+        return name.replace(";", ":")
+
+    def _run(self, seconds):
+        stacks = {}         # collapsed stack: samples
+        samples = 0
+        ownId = threading.get_ident()
+        started = time.monotonic()
+        end = started + seconds
+        nextSample = started
+
+        while not self.stopEvent.is_set() and time.monotonic() < end:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == ownId:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frameName(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread-" + str(ident)))
+                key = ";".join(reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+            samples += 1
+
+            # Fixed rate on the monotonic clock, a slow sample does not push the rest back
+            nextSample += self.interval
+            wait = nextSample - time.monotonic()
+            if wait > 0:
+                self.stopEvent.wait(wait)
+            else:
+                nextSample = time.monotonic()
+
+        self.lastFiles = self._write(stacks, samples, time.monotonic() - started)
+        if self.log is not None:
+            self.log("LOG", "Profile written to " + self.lastFiles[0] + ".", samples = samples)
+
+    """
+    @brief:     Writes the collapsed stacks and the per function summary of a run
+    @param:     stacks      Dict of collapsed stack: sample count
+    @param:     samples     How many times the threads were sampled
+    @param:     duration    Seconds the run lasted
+    @retval:    tuple       (folded path, summary path)
+    """
+    def _write(self, stacks, samples, duration):
+        os.makedirs(self.directory, exist_ok = True)
+        base = os.path.join(self.directory, "profile-" + datetime.now().strftime("%Y%m%d-%H%M%S"))
+        foldedPath = base + ".folded"
+        summaryPath = base + ".txt"
+
+        with open(foldedPath, "w") as foldedFile:
+            for stack, count in sorted(stacks.items()):
+                foldedFile.write(stack + " " + str(count) + "\n")
+
+        # Self is where the thread actually was, total is anywhere on the stack, per thread
+        selfCounts = {}
+        totalCounts = {}
+        threadCounts = {}
+        for stack, count in stacks.items():
+            parts = stack.split(";")
+            thread = parts[0]
+            threadCounts[thread] = threadCounts.get(thread, 0) + count
+            if len(parts) > 1:
+                leaf = (thread, parts[-1])
+                selfCounts[leaf] = selfCounts.get(leaf, 0) + count
+            for function in set(parts[1:]):
+                key = (thread, function)
+                totalCounts[key] = totalCounts.get(key, 0) + count
+
+        with open(summaryPath, "w") as summaryFile:
+            summaryFile.write("Sampled every " + str(self.interval * 1000) + " ms for " + "{:.1f}".format(duration) + " s, " + str(samples) + " samples\n")
+            for thread, count in sorted(threadCounts.items(), key = lambda item: -item[1]):
+                summaryFile.write("\n" + thread + "\n")
+                summaryFile.write("{:>8}{:>8}{:>8}{:>8}  {}\n".format("self", "self%", "total", "total%", "function"))
+                functions = sorted((key for key in totalCounts if key[0] == thread),
+                                   key = lambda key: (-selfCounts.get(key, 0), -totalCounts[key]))
+                for key in functions:
+                    selfCount = selfCounts.get(key, 0)
+                    summaryFile.write("{:>8}{:>7.1f}%{:>8}{:>7.1f}%  {}\n".format(
+                        selfCount, 100.0 * selfCount / count, totalCounts[key], 100.0 * totalCounts[key] / count, key[1]))
+        return (foldedPath, summaryPath)
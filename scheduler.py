@@ -0,0 +1,216 @@
+import time
+
+"""
+Decides which widget gets the display next.
+
+widget_runLoop used to run a fixed list of widgets and then sleep, so a new alert could
+wait a whole loop before it was shown. Now every widget registers with the scheduler
+with a priority, a minimum interval between showings and a time budget, and each call to
+runSlot() gives the display to whichever eligible widget scores highest right now.
+
+A widget is eligible when
+    its minimum interval has passed since it last ran
+    its provider has data, when it has one, and that data is different from what it showed
+        last time if it was registered with changedOnly
+    its ready function says it has something to show, when it has one
+
+The score is the priority plus how long the widget has been waiting, so low priority
+widgets still get their turn instead of starving.
+
+While a widget runs, the scheduler checks in at every frame boundary (every show() on the
+matrix). If another widget reports urgent, the running widget is over its budget, or
+the slot's deadline (the next change of the display schedule) has passed,
+WidgetPreempted is raised out of show(), which unwinds the running widget, and the
+urgent widget gets the very next slot.
+"""
+
+
+class WidgetPreempted(BaseException):
+    """
+    Raised out of show() to stop a running widget. It is a BaseException on purpose,
+    so the catch-all except blocks in the widgets let it through.
+    """
+    pass
+
+
+class ScheduledWidget:
+    """
+    A widget as the scheduler sees it
+
+    name            Name for logging
+    run             Function that shows the widget, returns when it is done
+    priority        Higher goes first
+    minInterval     Seconds it has to wait after running before it can run again
+    budget          Most seconds a single slot can last before it gets cut off at the next frame,
+                        or a function returning seconds, checked when each slot starts, for
+                        widgets whose run time depends on their data
+    provider        Default None, name of the DataProvider the widget reads
+    changedOnly     Default False, only show again once the provider's data is different from
+                        what was shown last, compared with ==, so a refetch of the same data
+                        (or a 304) does not count
+    ready           Default None, function returning True when there is anything to show
+    urgent          Default None, function returning True when the widget has to be shown now,
+                        checked at every frame boundary of the other widgets, so keep it cheap
+    """
+    def __init__(self, name, run, priority, minInterval, budget, provider = None, changedOnly = False, ready = None, urgent = None):
+        self.name = name
+        self.run = run
+        self.priority = priority
+        self.minInterval = minInterval
+        self.budget = budget
+        self.provider = provider
+        self.changedOnly = changedOnly
+        self.ready = ready
+        self.urgent = urgent
+
+        self.lastRun = 0            # monotonic time the last slot started
+        self.lastShownData = None   # the provider data the last finished slot showed
+        self.runs = 0
+        self.preempted = 0
+        self.skipped = 0
+
+
+class WidgetScheduler:
+    AGING = 0.1             # score gained per second of waiting
+    URGENT_CHECK = 0.25     # fewest seconds between urgency checks during a slot
+    IDLE_WAIT = 1.0         # seconds to wait when nothing at all can run
+
+    def __init__(self, matrix, providers = None, log = None, metrics = None):
+        self.mat = matrix
+        self.providers = providers
+        self.log = log          # function taking (level, message, **fields)
+        self.metrics = metrics  # optional BoardMetrics, gets the wall time of every slot
+        self.widgets = []
+
+        self.current = None
+        self.slotStart = 0
+        self.slotBudget = 0
+        self.lastUrgentCheck = 0
+        self.preemptFor = None
+        self.stopping = False
+        self.deadline = None
+
+    def register(self, widget):
+        self.widgets.append(widget)
+        return widget
+
+    def _snapshot(self, widget):
+        if widget.provider is None or self.providers is None:
+            return None
+        return self.providers.snapshot(widget.provider)
+
+    def _eligible(self, widget, now):
+        if widget.lastRun > 0 and now - widget.lastRun < widget.minInterval:
+            return False
+        snapshot = self._snapshot(widget)
+        if snapshot is not None:
+            if snapshot.data is None:
+                return False
+            if widget.changedOnly and snapshot.data == widget.lastShownData:
+                return False
+        if widget.ready is not None and not widget.ready():
+            return False
+        return True
+
+    def _score(self, widget, now):
+        waited = now - (widget.lastRun + widget.minInterval) if widget.lastRun > 0 else widget.minInterval
+        return widget.priority + (waited * self.AGING)
+
+    """
+    @brief:     Picks the widget that should get the next slot
+    @note:      A widget that asked to preempt always goes first
+    @retval:    ScheduledWidget The widget, or None if nothing can run right now
+    """
+    def pickNext(self):
+        if self.preemptFor is not None:
+            widget = self.preemptFor
+            self.preemptFor = None
+            return widget
+
+        now = time.monotonic()
+        best = None
+        bestScore = 0
+        for widget in self.widgets:
+            if not self._eligible(widget, now):
+                widget.skipped += 1
+                continue
+            score = self._score(widget, now)
+            if best is None or score > bestScore:
+                best = widget
+                bestScore = score
+        return best
+
+    """
+    @brief:     Gives the display to one widget, runs it, and returns
+    @note:      Call this over and over, it replaces the fixed widget loop
+    @param:     deadline    Default None, monotonic time the slot has to be over by, whatever the budget
+    @retval:    ScheduledWidget The widget that ran, or None if nothing could run
+    """
+    def runSlot(self, deadline = None):
+        widget = self.pickNext()
+        if widget is None:
+            idle = self.IDLE_WAIT
+            if deadline is not None:
+                idle = max(0.0, min(idle, deadline - time.monotonic()))
+            time.sleep(idle)
+            return None
+
+        snapshot = self._snapshot(widget)
+        self.current = widget
+        self.slotBudget = widget.budget() if callable(widget.budget) else widget.budget
+        self.slotStart = time.monotonic()
+        self.lastUrgentCheck = self.slotStart
+        self.stopping = False
+        self.deadline = deadline
+        widget.lastRun = self.slotStart
+        widget.runs += 1
+
+        self.mat.matrix.onFrame = self._frameBoundary
+        try:
+            widget.run()
+            if snapshot is not None:
+                widget.lastShownData = snapshot.data
+        except WidgetPreempted:
+            widget.preempted += 1
+            if self.log is not None:
+                if self.preemptFor is not None:
+                    reason = "for " + self.preemptFor.name
+                elif self.deadline is not None and time.monotonic() >= self.deadline:
+                    reason = "for the display schedule"
+                else:
+                    reason = "over budget"
+                self.log("LOG", "Preempted " + widget.name + " " + reason + ".", widget = widget.name,
+                         latencyMs = int((time.monotonic() - self.slotStart) * 1000))
+        finally:
+            if self.metrics is not None:
+                self.metrics.observeWidget(getattr(widget.run, "__name__", widget.name), time.monotonic() - self.slotStart)
+            self.mat.matrix.onFrame = None
+            self.current = None
+            self.stopping = False
+            self.deadline = None
+        return widget
+
+    # Called by the matrix at every show() while a widget is running
+    def _frameBoundary(self):
+        if self.stopping:
+            return      # already unwinding, let the widget's cleanup draw in peace
+        now = time.monotonic()
+
+        if now - self.slotStart > self.slotBudget or (self.deadline is not None and now >= self.deadline):
+            self.stopping = True
+            raise WidgetPreempted()
+
+        if now - self.lastUrgentCheck < self.URGENT_CHECK:
+            return
+        self.lastUrgentCheck = now
+        for widget in self.widgets:
+            if widget is self.current or widget.urgent is None:
+                continue
+            if widget.priority > self.current.priority and widget.urgent():
+                self.preemptFor = widget
+                self.stopping = True
+                raise WidgetPreempted()
+
+    # Per widget counters, for diagnostics
+    def stats(self):
+        return {widget.name: {"runs": widget.runs, "preempted": widget.preempted, "skipped": widget.skipped} for widget in self.widgets}
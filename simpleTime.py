@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, time
 
 """
 This library is probably gratuitous but the behavior 
@@ -38,11 +38,19 @@ class Time:
     @retval:    Returns the total minutes of the time that was imported
     """
     def importDatetime(self, dt):
-        self.minutes = dt.minutes
-        self.hours = dt.minutes
+        self.minutes = dt.minute
+        self.hours = dt.hour
         self.totalMinutes = (self.hours * 60) + self.minutes
         return self.totalMinutes
     
+    """
+    @brief:     This time of day on a given date
+    @param:     day     date (or datetime, only the date is used)
+    @retval:    Returns a datetime, naive local time like datetime.now()
+    """
+    def onDate(self, day):
+        return datetime.combine(day, time(self.hours, self.minutes))
+
     """
     @brief:     Compares self with another time object
     @note:      Works with self type objects and datetime objects
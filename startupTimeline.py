@@ -0,0 +1,56 @@
+import time
+
+"""
+Keeps track of how long the board takes to come up after a power cycle.
+
+matrixDisplayBoard.py imports this before anything else, so the clock starts as close to
+the start of the program as python allows. Each step of startup calls mark() when it is
+done, and once the first frame is on the LEDs the whole timeline goes into the log, so
+time to first pixel can be followed from boot to boot:
+    imports         everything matrixDisplayBoard.py imports
+    hardware        the strip and LEDMatrix
+    secrets         secrets.txt
+    providers       data providers registered and warm started from the cache
+    widgets         the rest of Widget, scheduler and overlays
+    firstFrame      the first frame actually shown on the strip
+
+Run python matrixDisplayBoard.py --startup-report to print it and quit after the first frame.
+"""
+
+class StartupTimeline:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.last = self.start
+        self.marks = []         # (name, seconds since the previous mark, seconds since start)
+
+    """
+    @brief:     Ends a step of startup
+    @param:     name        Name of the step that just finished
+    @param:     at          Default None, monotonic time the step finished, None means now
+    @retval:    None
+    """
+    def mark(self, name, at = None):
+        if at is None:
+            at = time.monotonic()
+        self.marks.append((name, at - self.last, at - self.start))
+        self.last = at
+
+    def total(self):
+        return self.last - self.start
+
+    # One line per step, for printing
+    def report(self):
+        lines = ["{:<14}{:>10}{:>10}".format("step", "ms", "total ms")]
+        for name, duration, sinceStart in self.marks:
+            lines.append("{:<14}{:>10.0f}{:>10.0f}".format(name, duration * 1000, sinceStart * 1000))
+        return "\n".join(lines)
+
+    # Every step in milliseconds as key=value fields for the log, like importsMs=850
+    def fields(self):
+        fields = {name + "Ms": int(duration * 1000) for name, duration, sinceStart in self.marks}
+        fields["totalMs"] = int(self.total() * 1000)
+        return fields
+
+
+# The one timeline for this run
+startup = StartupTimeline()
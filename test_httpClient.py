@@ -0,0 +1,108 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from httpClient import HttpClient
+
+"""
+Tests for httpClient.py against a stub server on 127.0.0.1, no network needed.
+
+    python -m pytest -q test_httpClient.py
+"""
+
+ETAG = '"v1"'
+BODY = b'{"headlines": ["Stub news"]}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # /etag     answers 304 when it gets If-None-Match with ETAG, otherwise 200 with ETAG
+    # /slow     waits a second before answering, for the read timeout
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path == "/slow":
+            time.sleep(1)
+        if self.path == "/etag" and self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        if self.path == "/etag":
+            self.send_header("ETag", ETAG)
+        self.send_header("X-RateLimit-Remaining", "41")
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        threading.Thread(target = self.server.serve_forever, daemon = True).start()
+        self.base = "http://127.0.0.1:" + str(self.server.server_address[1])
+        self.http = HttpClient()
+
+    def tearDown(self):
+        self.http.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_etagComesBackAs304(self):
+        first = self.http.get(self.base + "/etag")
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.notModified)
+
+        second = self.http.get(self.base + "/etag")
+        self.assertTrue(second.notModified)
+        self.assertEqual(self.server.requests[1][1].get("If-None-Match"), ETAG)
+        self.assertEqual(self.http.stats()["127.0.0.1"]["codes"], {"200": 1, "304": 1})
+        self.assertEqual(self.http.stats()["127.0.0.1"]["notModified"], 1)
+        self.assertEqual(self.http.stats()["127.0.0.1"]["rateLimit"], {"default": 41})
+
+    def test_notModifiedReusesTheEarlierResponse(self):
+        first = self.http.get(self.base + "/etag")
+        second = self.http.get(self.base + "/etag")
+        self.assertIs(second, first)
+        self.assertTrue(second.notModified)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), {"headlines": ["Stub news"]})
+
+    def test_unconditionalSkipsTheValidators(self):
+        self.http.get(self.base + "/etag")
+        response = self.http.get(self.base + "/etag", conditional = False)
+        self.assertNotIn("If-None-Match", self.server.requests[1][1])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.notModified)
+
+    def test_noValidatorsNoConditionalRequest(self):
+        self.http.get(self.base + "/plain")
+        self.http.get(self.base + "/plain")
+        self.assertNotIn("If-None-Match", self.server.requests[1][1])
+        self.assertEqual(self.http.stats()["127.0.0.1"]["codes"], {"200": 2})
+
+    def test_hostTimeoutOverride(self):
+        self.assertEqual(self.http.timeoutFor(self.base + "/slow"), HttpClient.DEFAULT_TIMEOUT)
+        self.assertEqual(self.http.timeoutFor("https://api.weather.gov/alerts"), HttpClient.HOST_TIMEOUTS["api.weather.gov"])
+
+        import requests
+        http = HttpClient(hostTimeouts = {"127.0.0.1": (1, 0.2)})
+        try:
+            self.assertEqual(http.timeoutFor(self.base + "/slow"), (1, 0.2))
+            self.assertEqual(http.timeoutFor("https://api.weather.gov/alerts"), HttpClient.HOST_TIMEOUTS["api.weather.gov"])
+            started = time.monotonic()
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                http.get(self.base + "/slow")
+            self.assertLess(time.monotonic() - started, 0.9)
+        finally:
+            http.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,22 +2,34 @@ from matrix import LEDMatrix
 from datetime import datetime, timezone
 from time import strftime
 import time
-import requests
 from simpleTime import Time
-import yfinance as yf
 import random
 import inspect
 from color import Color
+from providers import DataProvider, ProviderPool, NOT_MODIFIED
+from responseCache import ResponseCache
+from priceStore import PriceStore
+from forecast import Forecast
+from frameSequence import ANIMATION_NAMES, FrameSequence, SequenceLibrary
+from httpClient import HttpClient
+from logWriter import LogWriter
+from scheduler import ScheduledWidget, WidgetScheduler
+from compositor import Compositor, PixelOverlay
+from startupTimeline import startup
 import math
 
 class Widget:
 
-    # Google Maps Distance Matrix API (for widget_TransitTime)
-    last_GoogleAPI_Call = 0         # for getting transit times
-    transitTime = 0                 # minutes of travel time to work, this will be what is displayed
+    # All of the API data is fetched in the background by these providers, see providers.py
+    # Each widget just reads the latest snapshot and never waits on the network
+    #   "transit"   Google Maps Distance Matrix API, minutes of travel time to work
+    #   "forecast"  Tomorrow API for Weather, the forecast parsed into a Forecast, see forecast.py
+    #   "watchlist" Yahoo finance API for stock prices, the display strings for every ticker
+    #   "news"      NewsAPI API for news headlines, a list of headline strings
+    #   "alerts"    National Weather Service for alerts, the raw alerts JSON
+    providers = None
 
     # Tomorrow API for Weather, conditions come in as integer strings
-    last_TomorrowAPI_Call = 0       # for weather data
     weatherCodes = {
         "0": "Unknown",
         "1000": "Clear, Sunny",
@@ -44,22 +56,9 @@ class Widget:
         "7102": "Light Ice Pellets",
         "8000": "Thunderstorm"
     }
-    WeatherResponseData = []
 
-    # Yahoo finance API for stock price
-    last_YahooAPI_Call = 0          # for stock price data
-    ticker = None
-    history = None
-
-    # NewsAPI API for news headlines
-    last_NewsAPI_Call = 0
-    headlines = []
-    headlineCount = 0
-
-    # National Weather Service for alerts and weather data
-    last_NWSAPI_Call = 0
-    NWSResponseData = []
-    NWSAPIDelay = 5
+    # Yahoo finance tickers to show, all of them are fetched in one request
+    watchlist = ['VOO']
 
     # Storage for our sensetive data like addresses and API keys
     # Data that should not go into version control
@@ -67,27 +66,77 @@ class Widget:
 
     mat = None
 
-    def __init__(self, matrix):
+    # Compiled variants of the animations, see frameSequence.py. None plays them procedurally
+    animations = None
+
+    # metrics is an optional BoardMetrics, it gets the timings of the providers and widgets, see metrics.py
+    def __init__(self, matrix, logWriter = None, metrics = None):
         self.mat = matrix
+        self.metrics = metrics
+        # Log lines are written by a background thread, see logWriter.py
+        self.logWriter = logWriter if logWriter is not None else LogWriter("log.txt")
         self.__getsecrets()
+        startup.mark("secrets")
         self.c = Color()
-    
-    # runs through all the widgets in series
-    def widget_runLoop(self):
-        self.widget_Animation()
-
-        self.widget_Alerts()
-        self.widget_CalendarClock()
-        self.widget_TransitTime()
 
-        self.widget_Animation()
-
-        self.widget_StockPrice()
-        self.widget_NewsHeadlines()
-        self.widget_Weather()
-
-        # TODO: add other widgets here
-        time.sleep(4)
+        # Every API call goes through one pooled, keep-alive HTTP client, see httpClient.py
+        self.http = HttpClient()
+
+        # Refresh times and ttls are in seconds. The last good payload of each provider is kept
+        # on disk, so after a restart widgets show cached data right away. The ttl is how old that
+        # cached data can be and still be worth showing, traffic goes stale much faster than news
+        self.prices = PriceStore()      # daily closes of the watchlist, only new bars get downloaded
+        self.animations = SequenceLibrary()
+        self.providers = ProviderPool(log = self._log, cache = ResponseCache("cache"), metrics = self.metrics)
+        self.providers.register(DataProvider("transit", self._fetchTransitTime, self._transitInterval, ttl = 30 * 60))
+        self.providers.register(DataProvider("forecast", self._fetchWeather, 15 * 60, ttl = 6 * 60 * 60))
+        self.providers.register(DataProvider("watchlist", self._fetchWatchlist, 5 * 60, ttl = 24 * 60 * 60))
+        self.providers.register(DataProvider("news", self._fetchNewsHeadlines, 15 * 60, ttl = 12 * 60 * 60))
+        self.providers.register(DataProvider("alerts", self._fetchAlerts, self._alertsInterval, ttl = 60 * 60))
+        self.providers.start()
+        startup.mark("providers")
+
+        # Ids of the severe alerts that have been on the display, so each one only preempts once
+        self.shownAlerts = set()
+
+        # Which widget gets the display next is up to the scheduler, see scheduler.py
+        # Priority is relative, intervals and budgets are in seconds
+        self.scheduler = WidgetScheduler(self.mat, providers = self.providers, log = self._log, metrics = self.metrics)
+        self.scheduler.register(ScheduledWidget("alerts", self.widget_Alerts, 100, 3 * 60, 120, provider = "alerts",
+                                                ready = self._alertsActive, urgent = self._alertsUrgent))
+        # The data widgets only come back when their data changed, so an unchanged travel time
+        # or the same watchlist after the market closes does not take up slots over and over
+        self.scheduler.register(ScheduledWidget("transit", self.widget_TransitTime, 40, 2 * 60, 30, provider = "transit", changedOnly = True))
+        self.scheduler.register(ScheduledWidget("clock", self.widget_CalendarClock, 30, 90, 30))
+        self.scheduler.register(ScheduledWidget("weather", self.widget_Weather, 30, 3 * 60, 60, provider = "forecast", changedOnly = True))
+        self.scheduler.register(ScheduledWidget("stock", self.widget_StockPrice, 20, 3 * 60, self._stockBudget, provider = "watchlist", changedOnly = True))
+        self.scheduler.register(ScheduledWidget("news", self.widget_NewsHeadlines, 20, 60, 45, provider = "news", changedOnly = True))
+        self.scheduler.register(ScheduledWidget("animation", self.widget_Animation, 5, 45, 30))
+
+        # Overlays go on top of whatever widget is running, see compositor.py
+        # While there is an active alert, a red pixel in the top right corner says so on every widget
+        # Without numpy there is no Compositor, the badge is then just a pixel put over every frame
+        try:
+            self.compositor = Compositor(self.mat)
+            self.alertBadge = self.compositor.addLayer("alertBadge", 10)
+        except ImportError:
+            self.compositor = None
+            self.alertBadge = PixelOverlay(self.mat)
+        self.alertBadge.drawPixel(0, self.mat.cols - 1, self.c.RED)
+        self.alertBadge.setVisible(False)
+        startup.mark("widgets")
+    
+    # Gives the display to the next widget, call it over and over
+    # The order is not fixed anymore, the scheduler picks by priority and what has new data
+    #   deadline    Default None, monotonic time the widget has to be off the display by,
+    #               main() passes the next change of the display schedule
+    def widget_runLoop(self, deadline = None):
+        self.alertBadge.setVisible(self._alertsActive())
+        try:
+            self.scheduler.runSlot(deadline = deadline)
+        finally:
+            # Only on during widgets, not on the night clock or the blank display
+            self.alertBadge.setVisible(False)
 
     # Displays time and date, fancylike
     def widget_CalendarClock(self):
@@ -97,15 +146,19 @@ class Widget:
             start = datetime.now()
             while (datetime.now() - start).total_seconds() <= 5:
                 timeString = "\\w" + strftime("%I:%M:%S")
+                # The matrix skips the show when the time has not ticked over, so this is cheap,
+                # the sleep just keeps it from spinning the CPU between seconds
                 self.mat.stringPrint(timeString, self.c.RED)
+                time.sleep(0.05)
             self.mat.stringExitTop(timeString, self.c.RED, delay = 1)
 
             dateString = "\\w" + strftime("%m/%d/%y")
             self.mat.stringEnterBottomExitTop(dateString, self.c.RED, delay = 2, displayTime = 3)
         except Exception as ex:
             template = "An exception of type {0} occurred in {1}. Arguments:\n{2!r}"
-            message = template.format(type(ex).__name__, inspect.currentframe().f_code.co_name, ex.args)
-            self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: " + message)
+            widgetName = inspect.currentframe().f_code.co_name
+            message = template.format(type(ex).__name__, widgetName, ex.args)
+            self._log("ERROR", message, widget = widgetName)
             self.mat.stringEnterBottomExitLeft("Error in calendar clock widget.", self.c.RED, speed=0, delay=0, displayTime=0.3)
     
 
@@ -113,223 +166,232 @@ class Widget:
     # between an origin and destination
     def widget_TransitTime(self):
         try:
-            # The API delay is scheduled, it should be shorter in the morning before work
-            # and longer the rest of the day
-            highSpeedStart = Time(7, 00)
-            highSpeedEnd = Time(8, 00)
-            now = datetime.now()
-            if (highSpeedStart.compare(now) and not highSpeedEnd.compare(now)):
-                API_DELAY = 3
-            else:
-                API_DELAY = 60
-
-            # Build the request URL to get the JSON from
-            origin = self.secrets["TransitOrigin"]
-            destination  = self.secrets["TransitDestination"]
-            APIKey = self.secrets["GoogleDistanceMatrix"]
-            trafficModel = "best_guess"
-            departureTime = "now"
-            units = "imperial"
-            requestURL = "https://maps.googleapis.com/maps/api/distancematrix/json?departure_time=" + departureTime + "&traffic_model="
-            requestURL += trafficModel + "&destinations=" + destination + "&origins=" + origin + "&units=" + units + "%20&key=" + APIKey
-
-            # first we need to know if its time to call the API
-            now = int(datetime.now(timezone.utc).timestamp())
-            if (now - self.last_GoogleAPI_Call > (API_DELAY * 60)):
-                # We need to call the API again
-                self._log("[LOG][" + str(datetime.now(timezone.utc)) + "]: Calling Google Distance Matrix API.")
-                self.last_GoogleAPI_Call = now
-                response = requests.get(requestURL)
-                if response.status_code == 200:
-                    data = response.json()
-                    main = data['rows'][0]['elements'][0]['duration_in_traffic']
-                    self.transitTime = int(int(main['value']) / 60)
-                else:
-                    self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: Google Distance Matrix API Response " + response.status_code)
-            
+            transitTime = self.providers.snapshot("transit").data
+            if transitTime is None:
+                return      # nothing fetched yet
+
             # Apply fancy colors to the string depending on how long it takes to get to work
             dispString = self.secrets["workplaceName"] + ": "
-            if self.transitTime < 20:
+            if transitTime < 20:
                 dispString += "\\g"
-            elif self.transitTime < 25:
+            elif transitTime < 25:
                 dispString += "\\y"
-            elif self.transitTime >= 30:
+            elif transitTime >= 30:
                 dispString += "\\r"
             else:
                 dispString += "\\w"
-            dispString += str(self.transitTime) + "m"
+            dispString += str(transitTime) + "m"
 
             self.mat.stringEnterBottomExitTop(dispString, self.c.WHITE)
         except Exception as ex:
             template = "An exception of type {0} occurred in {1}. Arguments:\n{2!r}"
-            message = template.format(type(ex).__name__, inspect.currentframe().f_code.co_name, ex.args)
-            self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: " + message)
+            widgetName = inspect.currentframe().f_code.co_name
+            message = template.format(type(ex).__name__, widgetName, ex.args)
+            self._log("ERROR", message, widget = widgetName)
             self.mat.stringEnterBottomExitLeft("Error in transit time widget.", self.c.RED, speed=0, delay=0, displayTime=0.3)
 
-
-    # Uses yfinance to show the price and history for a ticker symbol
+    # The API delay is scheduled, it should be shorter in the morning before work
+    # and longer the rest of the day
+    def _transitInterval(self, snapshot):
+        highSpeedStart = Time(7, 00)
+        highSpeedEnd = Time(8, 00)
+        now = datetime.now()
+        if (highSpeedStart.compare(now) and not highSpeedEnd.compare(now)):
+            return 3 * 60
+        else:
+            return 60 * 60
+
+    # Runs in the background, returns minutes of travel time to work
+    def _fetchTransitTime(self):
+        # Build the request URL to get the JSON from
+        origin = self.secrets["TransitOrigin"]
+        destination  = self.secrets["TransitDestination"]
+        APIKey = self.secrets["GoogleDistanceMatrix"]
+        trafficModel = "best_guess"
+        departureTime = "now"
+        units = "imperial"
+        requestURL = "https://maps.googleapis.com/maps/api/distancematrix/json?departure_time=" + departureTime + "&traffic_model="
+        requestURL += trafficModel + "&destinations=" + destination + "&origins=" + origin + "&units=" + units + "%20&key=" + APIKey
+
+        self._log("LOG", "Calling Google Distance Matrix API.", api = "GoogleDistanceMatrix")
+        # Traffic is for departing right now, so the response is never the same twice
+        response = self.http.get(requestURL, conditional = False)
+        if response.status_code == 200:
+            data = response.json()
+            main = data['rows'][0]['elements'][0]['duration_in_traffic']
+            return int(int(main['value']) / 60)
+        else:
+            self._log("ERROR", "Google Distance Matrix API Response " + str(response.status_code), api = "GoogleDistanceMatrix")
+            return None
+
+
+    # Uses yfinance to show the price and change for every ticker on the watchlist
+    # The strings are all built when the data arrives, this only scrolls them
     def widget_StockPrice(self):
         try:
-            API_DELAY = 5
-
-            tickerSymbol = 'VOO'
-
-            # first we need to know if its time to call the API
-            now = int(datetime.now(timezone.utc).timestamp())
-            if (now - self.last_YahooAPI_Call > (API_DELAY * 60)):
-                # We need to call the API again
-                self._log("[LOG][" + str(datetime.now(timezone.utc)) + "]: Calling Yahoo Finance API.")
-                self.last_YahooAPI_Call = now
-                self.ticker = yf.Ticker(tickerSymbol)
-                self.history = self.ticker.history(period = '5d')
-
-            # Process the data to get the numbers
-            lastClose = self.history['Close'][-1]
-            previousClose = self.history['Close'][-2]
-            currentPrice = self.history['Close'][0]
-
-            difference = lastClose - previousClose
-            percent = math.fabs((difference / previousClose) * 100.0)
-
-            # Build and display the string
-            dispString = "VOO:$" + str(round(currentPrice, 2)) + " Last:"
-            if difference <= 0:
-                dispString += "\\r\\3"  # symbol 3 is down stock arrow
-            elif difference > 0:
-                dispString += "\\g\\2"  # symbol 2 is up stock arrow
-            dispString += str(round(percent,2)) + "%"
-
-            self.mat.stringEnterBottomExitLeft(dispString, self.c.WHITE)
+            watchlist = self.providers.snapshot("watchlist").data
+            if watchlist is None:
+                return      # nothing fetched yet
+
+            self.mat.stringEnterBottomExitLeft(watchlist['line'], self.c.WHITE)
         except Exception as ex:
             template = "An exception of type {0} occurred in {1}. Arguments:\n{2!r}"
-            message = template.format(type(ex).__name__, inspect.currentframe().f_code.co_name, ex.args)
-            self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: " + message)
+            widgetName = inspect.currentframe().f_code.co_name
+            message = template.format(type(ex).__name__, widgetName, ex.args)
+            self._log("ERROR", message, widget = widgetName)
             self.mat.stringEnterBottomExitLeft("Error in stock price widget.", self.c.RED, speed=0, delay=0, displayTime=0.3)
 
+    # The whole watchlist scrolls by in one slot, so the budget grows with the line, otherwise a
+    # long watchlist would get cut off at the same ticker every time and the rest never shown
+    def _stockBudget(self):
+        watchlist = self.providers.snapshot("watchlist").data
+        if watchlist is None:
+            return 30
+        return self.mat.timeEnterBottomExitLeft(watchlist['line']) + 5
+
+    # Builds the display string for one ticker from its last two closes, None without enough history
+    def _tickerString(self, symbol, bars):
+        if len(bars) < 2:
+            return None
+        previousClose = bars[-2][1]
+        lastClose = bars[-1][1]
+
+        difference = lastClose - previousClose
+        percent = math.fabs((difference / previousClose) * 100.0)
+
+        dispString = symbol + ":$" + str(round(lastClose, 2)) + " Last:"
+        if difference <= 0:
+            dispString += "\\r\\3"  # symbol 3 is down stock arrow
+        elif difference > 0:
+            dispString += "\\g\\2"  # symbol 2 is up stock arrow
+        dispString += str(round(percent,2)) + "%\\w"
+        return dispString
+
+    # Runs in the background, downloads new daily bars for the whole watchlist in one request
+    # and returns {'tickers': {symbol: display string}, 'line': every string in one line}
+    def _fetchWatchlist(self):
+        # yfinance drags in pandas, which takes seconds to import on a Pi, so it is only
+        # imported here, on the provider thread, the first time the stock is fetched
+        import yfinance as yf
+
+        # Only ask for what is not stored yet. Starting at the oldest last bar also
+        # refreshes today's bar, which keeps moving until the close
+        lastBars = [self.prices.lastBar(symbol) for symbol in self.watchlist]
+        if any(bar is None for bar in lastBars):
+            request = {"period": "5d"}
+        else:
+            request = {"start": datetime.fromtimestamp(min(bar[0] for bar in lastBars), timezone.utc).strftime("%Y-%m-%d")}
+
+        self._log("LOG", "Calling Yahoo Finance API.", api = "YahooFinance", tickers = len(self.watchlist))
+        data = yf.download(self.watchlist, interval = "1d", group_by = "ticker", auto_adjust = False,
+                           progress = False, threads = False, **request)
+        if data is None or len(data) == 0:
+            return None
+
+        tickers = {}
+        for symbol in self.watchlist:
+            # Columns are (ticker, field) pairs, older yfinance gives plain fields for a single ticker
+            if hasattr(data.columns, "levels"):
+                if symbol not in data.columns.get_level_values(0):
+                    continue
+                closes = data[symbol]['Close'].dropna()
+            else:
+                closes = data['Close'].dropna()
+            self.prices.append(symbol, ((int(barTime.timestamp()), float(close)) for barTime, close in closes.items()))
+
+            dispString = self._tickerString(symbol, self.prices.last(symbol, 2))
+            if dispString is not None:
+                tickers[symbol] = dispString
+
+        if len(tickers) == 0:
+            return None
+        return {'tickers': tickers, 'line': "  ".join(tickers[symbol] for symbol in self.watchlist if symbol in tickers)}
+
 
     # Gets the weahter from the Tomorrow API
     def widget_Weather(self):
         try:
-            API_DELAY = 15
-
-            lat = self.secrets["WeatherLat"]
-            long = self.secrets["WeatherLong"]
-            apiKey = self.secrets["TomorrowWeather"]
-            requestURL = "https://api.tomorrow.io/v4/weather/forecast?location="+lat+","+long+"&apikey="+apiKey
-
-            now = int(datetime.now(timezone.utc).timestamp())
-            if (now - self.last_TomorrowAPI_Call > (API_DELAY * 60)):
-                self._log("[LOG][" + str(datetime.now(timezone.utc)) + "]: Calling Tomorrow.io Weather API.")
-                self.last_TomorrowAPI_Call = now
-                response = requests.get(requestURL)
-                if response.status_code == 200:
-                    self.WeatherResponseData = response.json()
-                else:
-                    self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: Tomorrow.io Weather API Response " + response.status_code)
-            
-            # Process self.WeatherResponseData as it has the most recent data
-            hour = datetime.now().hour
-            nowData = self.WeatherResponseData['timelines']['hourly'][hour]['values']
-            nowConditions = str(self.weatherCodes[str(nowData['weatherCode'])])
-            nowTemperature = float(nowData['temperature'])
-            nowTemperatureF = str(int(nowTemperature * 1.8 + 32))
-
-            todayData = self.WeatherResponseData['timelines']['daily'][0]['values']
-            todayConditions = str(self.weatherCodes[str(todayData['weatherCodeMax'])])    #weatherCodeMax gives worst conditions of the day
-            todayHigh = float(todayData['temperatureMax'])
-            todayHighF = str(int(todayHigh * 1.8 + 32))
-            todayLow = float(todayData['temperatureMin'])
-            todayLowF = str(int(todayLow * 1.8 + 32))
-            
-            tomorrowData = self.WeatherResponseData['timelines']['daily'][1]['values']
-            tomorrowConditions = str(self.weatherCodes[str(tomorrowData['weatherCodeMax'])])    #weatherCodeMax gives worst conditions of the day
-            tomorrowHigh = float(tomorrowData['temperatureMax'])
-            tomorrowHighF = str(int(tomorrowHigh * 1.8 + 32))
-            tomorrowLow = float(tomorrowData['temperatureMin'])
-            tomorrowLowF = str(int(tomorrowLow * 1.8 + 32))
-
-            # Build our strings
-            todayString = "Now " + nowConditions + ",\\g" + nowTemperatureF + "\\6\\w"    #todayString includes current weather, and todays high/low
-            todayString += ",Today " + todayConditions + ",\\b" + todayLowF + "\\6\\w/\\r" + todayHighF + "\\6"
-            tomorrowString = "Tomorrow " + tomorrowConditions + ",\\b" + tomorrowLowF + "\\6\\w/\\r" + tomorrowHighF + "\\6"
+            forecast = self.providers.snapshot("forecast").data
+            if forecast is None:
+                return      # nothing fetched yet
+
+            # The forecast finds the current hour and day by timestamp, so this stays right
+            # however old the forecast is, and the strings are only built once per hour
+            todayString, tomorrowString = forecast.displayStrings()
 
             self.mat.stringEnterBottomExitLeft(todayString, self.c.WHITE, lenModifier=6)
             self.mat.stringEnterBottomExitLeft(tomorrowString, self.c.WHITE, lenModifier=6)
         except Exception as ex:
             template = "An exception of type {0} occurred in {1}. Arguments:\n{2!r}"
-            message = template.format(type(ex).__name__, inspect.currentframe().f_code.co_name, ex.args)
-            self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: " + message)
-            print(self.WeatherResponseData)
+            widgetName = inspect.currentframe().f_code.co_name
+            message = template.format(type(ex).__name__, widgetName, ex.args)
+            self._log("ERROR", message, widget = widgetName)
             self.mat.stringEnterBottomExitLeft("Error in weather widget.", self.c.RED, speed=0, delay=0, displayTime=0.3)
+
+    # Runs in the background, parses the forecast JSON into a Forecast once per response
+    def _fetchWeather(self):
+        lat = self.secrets["WeatherLat"]
+        long = self.secrets["WeatherLong"]
+        apiKey = self.secrets["TomorrowWeather"]
+        requestURL = "https://api.tomorrow.io/v4/weather/forecast?location="+lat+","+long+"&apikey="+apiKey
+
+        self._log("LOG", "Calling Tomorrow.io Weather API.", api = "Tomorrow.io")
+        response = self.http.get(requestURL)
+        if response.notModified:
+            return NOT_MODIFIED     # same forecast as last time
+        if response.status_code == 200:
+            return Forecast.fromTomorrow(response.json(), self.weatherCodes)
+        else:
+            self._log("ERROR", "Tomorrow.io Weather API Response " + str(response.status_code), api = "Tomorrow.io")
+            return None
                 
 
     # displays a random news headline from google news using newsAPI
     def widget_NewsHeadlines(self):
         try:
-            API_DELAY = 15
-
-            country = "us"
-            APIKey = self.secrets["NewsAPI"]
-            requestURL = "https://newsapi.org/v2/top-headlines?country=" + country + "&apiKey=" + APIKey
-
-            now = int(datetime.now(timezone.utc).timestamp())
-            if (now - self.last_NewsAPI_Call > (API_DELAY * 60)):
-                self._log("[LOG][" + str(datetime.now(timezone.utc)) + "]: Calling NewsAPI.org API.")
-                self.last_NewsAPI_Call = now
-                response = requests.get(requestURL)
-                if response.status_code == 200:
-                    data = response.json()
-                    articles = data['articles']
-                    
-                    self.headlines = []
-                    for art in articles:
-                        self.headlines.append(art['title'])
-
-                    self.headlineCount = int(data['totalResults'])
-                else:
-                    self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: NewsAPI.org API Response " + response.status_code)
+            headlines = self.providers.snapshot("news").data
+            if headlines is None:
+                return      # nothing fetched yet
 
             # Pick a random headline to display
-            headlineIndex = random.randrange(0, len(self.headlines) - 1)
-            dispString = self.headlines[headlineIndex]
+            headlineIndex = random.randrange(0, len(headlines) - 1)
+            dispString = headlines[headlineIndex]
 
             self.mat.stringEnterBottomExitLeft(dispString, self.c.WHITE, speed=0.02, delay=0, displayTime=0.6)
         except Exception as ex:
             template = "An exception of type {0} occurred in {1}. Arguments:\n{2!r}"
-            message = template.format(type(ex).__name__, inspect.currentframe().f_code.co_name, ex.args)
-            self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: " + message)
+            widgetName = inspect.currentframe().f_code.co_name
+            message = template.format(type(ex).__name__, widgetName, ex.args)
+            self._log("ERROR", message, widget = widgetName)
             self.mat.stringEnterBottomExitLeft("No news right now.", self.c.WHITE, speed=0, delay=0, displayTime=0.3)           
 
+    # Runs in the background, returns a tuple of headline strings
+    def _fetchNewsHeadlines(self):
+        country = "us"
+        APIKey = self.secrets["NewsAPI"]
+        requestURL = "https://newsapi.org/v2/top-headlines?country=" + country + "&apiKey=" + APIKey
+
+        self._log("LOG", "Calling NewsAPI.org API.", api = "NewsAPI.org")
+        response = self.http.get(requestURL)
+        if response.notModified:
+            return NOT_MODIFIED     # same headlines as last time
+        if response.status_code == 200:
+            data = response.json()
+            return tuple(art['title'] for art in data['articles'])
+        else:
+            self._log("ERROR", "NewsAPI.org API Response " + str(response.status_code), api = "NewsAPI.org")
+            return None
+
 
     # displays any active NWS alerts, otherwise it shows nothing
     def widget_Alerts(self):
         try:
-            # We want alerts for our area
-            requestURL = "https://api.weather.gov/alerts/active/zone/" + self.secrets["NWScountyZoneID"]
-
-            # We have to use fake headers to get the call to go through reliably
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-            }
-
-            now = int(datetime.now(timezone.utc).timestamp())
-            if (now - self.last_NWSAPI_Call > (self.NWSAPIDelay * 60)):
-                self._log("[LOG][" + str(datetime.now(timezone.utc)) + "]: Calling NWS Alert API.")
-                self.last_NWSAPI_Call = now
-                response = requests.get(requestURL, headers=headers)
-                if response.status_code == 200:
-                    self.NWSResponseData = response.json()
-                else:
-                    self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: NWS Alert API Response " + response.status_code)
+            alertData = self.providers.snapshot("alerts").data
+            if alertData is None:
+                return      # nothing fetched yet
 
-            # If there is an active alert, we need to check more frequently than if there are no alerts
-            if len(self.NWSResponseData['features']) > 0:
-                self.NWSAPIDelay = 5
-            else:
-                self.NWSAPIDelay = 20
-            
             # Go through the alerts and display each
-            for alert in self.NWSResponseData['features']:
+            for alert in alertData['features']:
                 prop = alert['properties']
                 event = prop['event']
                 alertType = prop['messageType']
@@ -342,6 +404,7 @@ class Widget:
                 dispString = ""
 
                 if severity == 'Extreme' or severity == 'Severe':
+                    self.shownAlerts.add(prop.get('id', headline))
                     dispString += "\\r" + "NWS " + event + ":" + headline
                     self.mat.stringEnterBottomExitLeft(dispString, self.c.RED, speed=0.02, delay=0, displayTime=0.1)
                     dispString = "\\r" + alertResponse
@@ -352,42 +415,110 @@ class Widget:
                     self.mat.stringEnterBottomExitLeft(dispString, self.c.WHITE, speed=0.02, delay=0.8, displayTime=0.1)
         except Exception as ex:
             template = "An exception of type {0} occurred in {1}. Arguments:\n{2!r}"
-            message = template.format(type(ex).__name__, inspect.currentframe().f_code.co_name, ex.args)
-            self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: " + message)
+            widgetName = inspect.currentframe().f_code.co_name
+            message = template.format(type(ex).__name__, widgetName, ex.args)
+            self._log("ERROR", message, widget = widgetName)
             self.mat.stringEnterBottomExitLeft("Error in alerts widget.", self.c.RED, speed=0, delay=0, displayTime=0.3)  
 
+    # The alerts widget only needs a slot when there is an alert
+    def _alertsActive(self):
+        alertData = self.providers.snapshot("alerts").data
+        return alertData is not None and len(alertData.get('features', [])) > 0
+
+    # True when there is a severe or extreme alert that has not been on the display yet
+    # Runs at frame boundaries of the other widgets, it only walks the alert list
+    def _alertsUrgent(self):
+        alertData = self.providers.snapshot("alerts").data
+        if alertData is None:
+            return False
+        for alert in alertData.get('features', []):
+            prop = alert['properties']
+            if prop.get('severity') in ('Extreme', 'Severe') and prop.get('id', prop.get('headline')) not in self.shownAlerts:
+                return True
+        return False
+
+    # If there is an active alert, we need to check more frequently than if there are no alerts
+    def _alertsInterval(self, snapshot):
+        if snapshot.data is not None and len(snapshot.data['features']) > 0:
+            return 5 * 60
+        else:
+            return 20 * 60
+
+    # Runs in the background, returns the raw alerts JSON
+    def _fetchAlerts(self):
+        # We want alerts for our area
+        requestURL = "https://api.weather.gov/alerts/active/zone/" + self.secrets["NWScountyZoneID"]
+
+        # We have to use fake headers to get the call to go through reliably
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+        }
+
+        self._log("LOG", "Calling NWS Alert API.", api = "NWS")
+        response = self.http.get(requestURL, headers=headers)
+        if response.notModified:
+            return NOT_MODIFIED     # no change in the alerts
+        if response.status_code == 200:
+            return response.json()
+        else:
+            self._log("ERROR", "NWS Alert API Response " + str(response.status_code), api = "NWS")
+            return None
+
 
     # Displays a random fun animation on the display to keep it interesting
-    def widget_Animation(self):
+    # Pass animationNumber to pick a specific one instead
+    def widget_Animation(self, animationNumber = None):
         # First lets pick which animation to do
-        animationNumber = random.randrange(0, 5)
+        if animationNumber == None:
+            animationNumber = random.randrange(0, 5)
+
+        # If any variants of it have been compiled, play one of them straight from its file
+        if self.animations is not None:
+            path = self.animations.choose(ANIMATION_NAMES[animationNumber])
+            if path is not None:
+                try:
+                    sequence = FrameSequence(path)
+                except ValueError as ex:
+                    # Compiled by an older version, draw it the slow way until it is recompiled
+                    self._log("ERROR", str(ex) + ", recompile it with python frameSequence.py compile.", widget = "widget_Animation")
+                else:
+                    with sequence:
+                        sequence.play(self.mat)
+                    return
 
         if animationNumber == 0:        # Random pixels left>right, then blank screen left>right
             # fill screen black
             # columns of random pixels w/ random colors scrolls right
             # sit for just a sec
             # column of black pixels scrolls right to clear the screen
+            # Each column goes out as one frame, paced by the frame clock
             self.mat.clearDisplay()
+            self.mat.frameClock.start(self.mat.speed)
             for column in range(self.mat.cols):
                 r = 0
                 g = 0
                 b = 0
                 px = 0
-                while px < 7:
-                    if random.randrange(0, 10) > 5:
-                        r = random.randrange(0, 255)
-                        g = random.randrange(0,255)
-                        b = random.randrange(0, 255)
-                        self.mat.matrixDrawPixel(px, column, (r, g, b))
-                        self.mat.matrix.show()
-                    px += 1
+                with self.mat.frameBatch():
+                    while px < 7:
+                        if random.randrange(0, 10) > 5:
+                            r = random.randrange(0, 255)
+                            g = random.randrange(0,255)
+                            b = random.randrange(0, 255)
+                            self.mat.matrixDrawPixel(px, column, (r, g, b))
+                            self.mat.matrix.show()
+                        px += 1
+                self.mat.frameClock.tick()
             time.sleep(0.7)
+            self.mat.frameClock.start(self.mat.speed)
             for column in range(self.mat.cols):
                 px = 0
-                while px < 7:
-                    self.mat.matrixDrawPixel(px, column, (0, 0, 0))
-                    self.mat.matrix.show()
-                    px += 1
+                with self.mat.frameBatch():
+                    while px < 7:
+                        self.mat.matrixDrawPixel(px, column, (0, 0, 0))
+                        self.mat.matrix.show()
+                        px += 1
+                self.mat.frameClock.tick()
         elif animationNumber == 1:      # Pixel bounces around with different colors
             # pong, where a pixel bounces around for a bit
             # to start, a position and vector are chosen at random
@@ -550,30 +681,35 @@ class Widget:
             self.mat.setBrightness(old)
         except Exception as ex:
             template = "An exception of type {0} occurred in {1}. Arguments:\n{2!r}"
-            message = template.format(type(ex).__name__, inspect.currentframe().f_code.co_name, ex.args)
-            self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: " + message)
+            widgetName = inspect.currentframe().f_code.co_name
+            message = template.format(type(ex).__name__, widgetName, ex.args)
+            self._log("ERROR", message, widget = widgetName)
 
 
-    # Displays a basic red clock for about a minute
-    def widget_NightClock(self):
+    # Displays a basic red clock until the minute changes, or until the deadline if that comes first
+    #   until       Default None, monotonic time to return by, main() passes the next change of the display schedule
+    def widget_NightClock(self, until = None):
         try:
-            start = datetime.now()
-            while (datetime.now() - start).total_seconds() <= 60:
-                timeString = strftime("%H:%M")
-                self.mat.stringPrint(timeString, self.c.RED)
-                time.sleep(60)
+            timeString = strftime("%H:%M")
+            self.mat.stringPrint(timeString, self.c.RED)
+            wait = 60 - (time.time() % 60)      # wake right as the minute turns over, so the clock is never behind
+            if until is not None:
+                wait = min(wait, until - time.monotonic())
+            time.sleep(max(0.0, wait))
         except Exception as ex:
             template = "An exception of type {0} occurred in {1}. Arguments:\n{2!r}"
-            message = template.format(type(ex).__name__, inspect.currentframe().f_code.co_name, ex.args)
-            self._log("[ERROR][" + str(datetime.now(timezone.utc)) + "]: " + message)
+            widgetName = inspect.currentframe().f_code.co_name
+            message = template.format(type(ex).__name__, widgetName, ex.args)
+            self._log("ERROR", message, widget = widgetName)
             # dont display anything on the matrix for an exception here, just skip
     
 
     # Simple method to add text to the log file for diagnostics purposes
-    def _log(self, string):
-        logFile = open("log.txt", "a")
-        logFile.write(string + "\n")
-        logFile.close()
+    # Never touches the file itself, the line is queued for the log writer thread
+    #   level       "LOG" or "ERROR"
+    #   fields      Optional structured fields, like widget, api or latencyMs
+    def _log(self, level, message, **fields):
+        self.logWriter.log(level, message, **fields)
 
 
     # This will populate our dictionary of API keys and other sensetive information